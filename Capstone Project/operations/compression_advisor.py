@@ -0,0 +1,49 @@
+import os
+import sys
+import argparse
+import configparser
+import psycopg2
+from sql_queries import create_table_queries
+
+sys.path.append(os.path.join(os.path.dirname(os.path.abspath(__file__)), os.pardir, os.pardir))
+from common.compression import add_arguments, run
+
+# preprocessed Parquet inputs of the staging tables, sampled with --method estimate
+PARQUET_SAMPLES = {
+    "staging_country": "./data/country",
+    "staging_state_demo": "./data/demographics",
+    "staging_visa": "./data/visa",
+}
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Compression encodings for the immigration Redshift tables.")
+    add_arguments(parser)
+    parser.add_argument("--parquet", nargs="*", default=[], metavar="TABLE=PATH",
+                        help="sample these Parquet inputs instead of the tables with --method estimate, "
+                             "in addition to the ones under ./data")
+    args = parser.parse_args()
+
+    config = configparser.ConfigParser()
+    config.read('./aws/credentials.cfg')
+
+    parquet = dict(PARQUET_SAMPLES)
+    parquet.update(item.split("=", 1) for item in args.parquet)
+    # the fact and dimension tables hold the columns of their staging tables as loaded
+    for table, staging in [("dim_country", "staging_country"), ("dim_state_demo", "staging_state_demo"),
+                           ("dim_visa", "staging_visa"), ("fact_immigration", "staging_immigration")]:
+        if staging in parquet:
+            parquet.setdefault(table, parquet[staging])
+
+    conn = psycopg2.connect("host={} dbname={} user={} password={} port={}".format(*config['CLUSTER'].values()))
+    # ANALYZE COMPRESSION cannot run inside a transaction block
+    conn.autocommit = True
+    cur = conn.cursor()
+
+    run(args, cur, create_table_queries, parquet)
+
+    conn.close()
+
+
+if __name__ == "__main__":
+    main()
@@ -1,7 +1,13 @@
+import os
+import sys
+import argparse
 import configparser
 import psycopg2
 from sql_queries import create_table_queries, drop_table_queries
 
+sys.path.append(os.path.join(os.path.dirname(os.path.abspath(__file__)), os.pardir, os.pardir))
+from common.compression import apply_encodings, read_encodings
+
 
 def drop_tables(cur, conn):
     """Drop tables if they already exist.
@@ -12,16 +18,21 @@ def drop_tables(cur, conn):
         cur.execute(query)
         conn.commit()
         
-def create_tables(cur, conn):
+def create_tables(cur, conn, encodings=None):
     """Create tables.
     :params cur: cursor
     :params conn: DB connection
+    :params encodings: dict of table to dict of column to compression encoding
     """
     for query in create_table_queries:
-        cur.execute(query)
+        cur.execute(apply_encodings(query, encodings or {}))
         conn.commit()
 
 def main():
+    parser = argparse.ArgumentParser(description="Create the immigration staging, fact and dimension tables.")
+    parser.add_argument("--encodings", help="report of compression_advisor.py whose column encodings are declared")
+    args = parser.parse_args()
+
     config = configparser.ConfigParser()
     config.read('./aws/credentials.cfg')
 
@@ -34,7 +45,7 @@ def main():
         print(e)
         
     try:
-        create_tables(cur, conn)
+        create_tables(cur, conn, read_encodings(args.encodings) if args.encodings else None)
     except psycopg2.Error as e:
         print(e)
 
@@ -1,48 +1,76 @@
+import os
+import sys
+import argparse
 import configparser
 import psycopg2
-from sql_queries import copy_table_queries, insert_table_queries
-import sys
+from psycopg2.pool import ThreadedConnectionPool
+import sql_queries
+from sql_queries import copy_table_queries, insert_table_queries, table_dependencies
+
+sys.path.append(os.path.join(os.path.dirname(os.path.abspath(__file__)), os.pardir, os.pardir))
+from common.instrument import StatementRecorder, statement_names, execute
+from common.scheduler import declared_statements, run_statements
 
 
-def load_staging_tables(cur, conn):
+def load_staging_tables(cur, conn, recorder=None):
     """Load staging tables.
     :params cur: cursor
     :params conn: DB connection
+    :params recorder: StatementRecorder timing each statement, if any
     """
     for query in copy_table_queries:
-        cur.execute(query)
+        execute(cur, query, recorder)
         conn.commit()
 
 
-def insert_tables(cur, conn):
-    """Insert tables.
+def insert_tables(cur, conn, recorder=None, pool=None, max_parallel=1):
+    """Insert tables, the dimensions before the fact referencing them.
     :params cur: cursor
     :params conn: DB connection
+    :params recorder: StatementRecorder timing each statement, if any
+    :params pool: connection pool to run independent inserts concurrently on
+    :params max_parallel: most inserts running at once on the pool
     """
-    for query in insert_table_queries:
-        cur.execute(query)
-        conn.commit()
+    statements = declared_statements(insert_table_queries, table_dependencies, statement_names(sql_queries))
+    run_statements(cur, conn, statements, recorder, pool, max_parallel)
 
 
 def main():
+    parser = argparse.ArgumentParser(description="Load the immigration staging, fact and dimension tables.")
+    parser.add_argument("--explain", action="store_true", help="record the EXPLAIN plan of every explainable statement")
+    parser.add_argument("--stats-log", default="etl_run_stats.json",
+                        help="JSON lines log the statement timings of the run are appended to")
+    parser.add_argument("--max-parallel", type=int, default=1,
+                        help="run up to this many independent inserts at once, each on its own connection")
+    args = parser.parse_args()
+
     config = configparser.ConfigParser()
     config.read('./aws/credentials.cfg')
     
-    conn = psycopg2.connect("host={} dbname={} user={} password={} port={}".format(*config['CLUSTER'].values()))    
+    dsn = "host={} dbname={} user={} password={} port={}".format(*config['CLUSTER'].values())
+    conn = psycopg2.connect(dsn)
     cur = conn.cursor()
-        
-    try:
-        load_staging_tables(cur, conn)
-    except psycopg2.Error as e:
-        print(e)
-        sys.exit()
-        
+    pool = ThreadedConnectionPool(1, args.max_parallel, dsn) if args.max_parallel > 1 else None
+    recorder = StatementRecorder("capstone", statement_names(sql_queries), args.explain,
+                                 "SELECT pg_last_copy_count()")
+
     try:
-        insert_tables(cur, conn)
-    except psycopg2.Error as e:
-        print(e)
+        try:
+            load_staging_tables(cur, conn, recorder)
+        except psycopg2.Error as e:
+            print(e)
+            sys.exit()
+
+        try:
+            insert_tables(cur, conn, recorder, pool, args.max_parallel)
+        except psycopg2.Error as e:
+            print(e)
+    finally:
+        recorder.flush(cur, conn, args.stats_log)
+        if pool is not None:
+            pool.closeall()
         
     conn.close()
     
 if __name__ == "__main__":
-    main()
\ No newline at end of file
+    main()
@@ -152,4 +152,13 @@ create_table_queries = [staging_immigration_table_create, staging_state_demo_tab
 
 copy_table_queries = [staging_immigration_copy, staging_state_demo_copy, staging_country_copy, staging_visa_copy]
 
-insert_table_queries = [immigration_table_insert, country_table_insert, state_table_insert, visa_table_insert]
\ No newline at end of file
+# the dimensions go first: fact_immigration references them
+insert_table_queries = [country_table_insert, state_table_insert, visa_table_insert, immigration_table_insert]
+
+# tables each insert reads and writes, for the parallel scheduler; the fact reads the dimensions its foreign keys reference
+table_dependencies = {
+    country_table_insert: (["staging_country"], ["dim_country"]),
+    state_table_insert: (["staging_state_demo"], ["dim_state_demo"]),
+    visa_table_insert: (["staging_visa"], ["dim_visa"]),
+    immigration_table_insert: (["staging_immigration", "dim_country", "dim_state_demo", "dim_visa"], ["fact_immigration"]),
+}
\ No newline at end of file
@@ -0,0 +1,141 @@
+import json
+import math
+import argparse
+import pyspark
+from etl import create_spark_session, hadoop_path
+from storage import HADOOP_AWS_VERSION, read_credentials, spark_config
+from tuning import PROFILES, profile_config, log_config, uses_s3a_committer
+
+TABLES = ["songs.parquet", "artist.parquet", "users.parquet", "time.parquet", "songplays.parquet"]
+
+
+def partition_files(spark, table_path):
+    """
+    List the data files of a table by the directory holding them, its leaf partitions.
+    :param spark: current Spark session.
+    :param table_path: location of a parquet table.
+    :return: dict of partition directory to list of (file path, size in bytes).
+    """
+    fs, path = hadoop_path(spark, table_path)
+    partitions = {}
+    if not fs.exists(path):
+        return partitions
+
+    files = fs.listFiles(path, True)
+    while files.hasNext():
+        status = files.next()
+        name = status.getPath().getName()
+        # _SUCCESS, .crc files and the like are not data
+        if name.startswith(("_", ".")):
+            continue
+        partitions.setdefault(status.getPath().getParent().toString(), []).append(
+            (status.getPath().toString(), status.getLen()))
+    return partitions
+
+
+def file_report(spark, output_data, tables=TABLES, small_file_bytes=16 * 1024 * 1024):
+    """
+    File counts and sizes of the data lake tables.
+    :param spark: current Spark session.
+    :param output_data: directory of output data.
+    :param tables: table directories to report.
+    :param small_file_bytes: files below this size are counted as small.
+    :return: dict of table to partitions, files, bytes, average file bytes and small files.
+    """
+    report = {}
+    for table in tables:
+        partitions = partition_files(spark, output_data + table)
+        sizes = [size for files in partitions.values() for _, size in files]
+        report[table] = {
+            "partitions": len(partitions),
+            "files": len(sizes),
+            "bytes": sum(sizes),
+            "avg_file_bytes": sum(sizes) // len(sizes) if sizes else 0,
+            "small_files": sum(size < small_file_bytes for size in sizes),
+        }
+    return report
+
+
+def compact_partition(spark, partition, files, output_data, target_file_bytes):
+    """
+    Rewrite a partition into as few files as the target size allows.
+
+    The partition is rewritten into a staging directory under <output>/_compacting first; its old
+    files are then deleted and the new ones moved in. A failure between the two steps leaves the
+    rows in the staging directory, and the next compaction refuses to start until it is resolved.
+    :param spark: current Spark session.
+    :param partition: partition directory.
+    :param files: list of (file path, size in bytes) of the partition.
+    :param output_data: directory of output data.
+    :param target_file_bytes: target size of a compacted file.
+    :return: number of files after compaction.
+    """
+    wanted = max(1, math.ceil(sum(size for _, size in files) / target_file_bytes))
+    if len(files) <= wanted:
+        return len(files)
+
+    staging = output_data + "_compacting"
+    spark.read.parquet(partition).repartition(wanted).write.parquet(staging)
+
+    fs, _ = hadoop_path(spark, partition)
+    Path = spark.sparkContext._jvm.org.apache.hadoop.fs.Path
+    for path, _ in files:
+        fs.delete(Path(path), False)
+    for status in fs.listStatus(Path(staging)):
+        if not status.getPath().getName().startswith(("_", ".")):
+            fs.rename(status.getPath(), Path(partition + "/" + status.getPath().getName()))
+    fs.delete(Path(staging), True)
+    return wanted
+
+
+def compact(spark, output_data, tables=TABLES, target_file_bytes=128 * 1024 * 1024):
+    """
+    Offline compaction of existing tables: every partition with more files than its size needs at
+    `target_file_bytes` per file is rewritten. Run it while no ETL job writes the tables.
+    :param spark: current Spark session.
+    :param output_data: directory of output data.
+    :param tables: table directories to compact.
+    :param target_file_bytes: target size of a compacted file.
+    """
+    for table in tables:
+        partitions = partition_files(spark, output_data + table)
+        before = sum(len(files) for files in partitions.values())
+        after = sum(compact_partition(spark, partition, files, output_data, target_file_bytes)
+                    for partition, files in partitions.items())
+        print("{}: {} files in {} partitions compacted to {} files.".format(table, before, len(partitions), after))
+
+
+def main():
+    """
+    Report and compact the files of the data lake tables.
+    """
+    parser = argparse.ArgumentParser(description="Report file counts and sizes of the data lake tables and compact them.")
+    parser.add_argument("output_data", help="directory of output data, e.g. s3a://bucket/output/")
+    parser.add_argument("--tables", default=",".join(TABLES), help="comma separated table directories")
+    parser.add_argument("--compact", action="store_true", help="rewrite partitions with too many small files")
+    parser.add_argument("--target-file-mb", type=int, default=128, help="target size of a compacted file")
+    parser.add_argument("--small-file-mb", type=int, default=16, help="files below this size are reported as small")
+    parser.add_argument("--s3-endpoint", help="custom S3 endpoint, e.g. http://localhost:9000 for MinIO")
+    parser.add_argument("--s3-path-style", action="store_true", help="use path-style S3 requests, as MinIO needs")
+    parser.add_argument("--credentials", default="dl.cfg", help="config file with the [AWS] keys for s3a")
+    parser.add_argument("--hadoop-aws-version", default=HADOOP_AWS_VERSION,
+                        help="hadoop-aws package version, the Hadoop version of the Spark build")
+    parser.add_argument("--profile", choices=list(PROFILES), default="default", help="Spark tuning profile")
+    args = parser.parse_args()
+
+    config = profile_config(args.profile, [args.output_data])
+    config.update(spark_config([args.output_data], args.s3_endpoint, args.s3_path_style,
+                               read_credentials(args.credentials), args.hadoop_aws_version,
+                               pyspark.__version__ if uses_s3a_committer(config) else None))
+    spark = create_spark_session(config)
+    log_config(spark, args.profile, config)
+    output_data = args.output_data.rstrip("/") + "/"
+    tables = args.tables.split(",")
+
+    if args.compact:
+        compact(spark, output_data, tables, args.target_file_mb * 1024 * 1024)
+    print(json.dumps(file_report(spark, output_data, tables, args.small_file_mb * 1024 * 1024), indent=2))
+
+
+if __name__ == "__main__":
+    main()
@@ -1,52 +1,254 @@
-import configparser
-from datetime import datetime
 import os
+import sys
+import json
+import argparse
+from datetime import datetime
+import pyspark
+from pyspark import StorageLevel
 from pyspark.sql import SparkSession
-from pyspark.sql.functions import udf, col
+from pyspark.sql.functions import col
 from pyspark.sql.functions import year, month, dayofmonth, hour, weekofyear, date_format
 from pyspark.sql import functions as F
 from pyspark.sql import types as T
 
-config = configparser.ConfigParser()
-config.read('dl.cfg')
+sys.path.append(os.path.join(os.path.dirname(os.path.abspath(__file__)), os.pardir))
+from common.time_dimension import spark_time_columns
+from storage import add_storage_arguments, read_credentials, resolve_input, spark_config
+from tuning import PROFILES, profile_config, log_config, uses_s3a_committer
+
+# schemas of the song and log JSON, so reading skips the inference pass over the input
+SONG_SCHEMA = T.StructType([
+    T.StructField("artist_id", T.StringType()),
+    T.StructField("artist_latitude", T.DoubleType()),
+    T.StructField("artist_location", T.StringType()),
+    T.StructField("artist_longitude", T.DoubleType()),
+    T.StructField("artist_name", T.StringType()),
+    T.StructField("duration", T.DoubleType()),
+    T.StructField("num_songs", T.LongType()),
+    T.StructField("song_id", T.StringType()),
+    T.StructField("title", T.StringType()),
+    T.StructField("year", T.LongType()),
+])
+
+LOG_SCHEMA = T.StructType([
+    T.StructField("artist", T.StringType()),
+    T.StructField("auth", T.StringType()),
+    T.StructField("firstName", T.StringType()),
+    T.StructField("gender", T.StringType()),
+    T.StructField("itemInSession", T.LongType()),
+    T.StructField("lastName", T.StringType()),
+    T.StructField("length", T.DoubleType()),
+    T.StructField("level", T.StringType()),
+    T.StructField("location", T.StringType()),
+    T.StructField("method", T.StringType()),
+    T.StructField("page", T.StringType()),
+    T.StructField("registration", T.DoubleType()),
+    T.StructField("sessionId", T.LongType()),
+    T.StructField("song", T.StringType()),
+    T.StructField("status", T.LongType()),
+    T.StructField("ts", T.LongType()),
+    T.StructField("userAgent", T.StringType()),
+    T.StructField("userId", T.StringType()),
+])
+
+STORAGE_LEVELS = ["MEMORY_ONLY", "MEMORY_AND_DISK", "MEMORY_AND_DISK_SER", "DISK_ONLY", "NONE"]
 
-os.environ['AWS_ACCESS_KEY_ID']=config.get("AWS",'AWS_ACCESS_KEY_ID')
-os.environ['AWS_SECRET_ACCESS_KEY']=config.get("AWS",'AWS_SECRET_ACCESS_KEY')
+# partition columns of the songs table; year/artist_id writes a directory per artist
+SONGS_PARTITIONS = {
+    "year,artist_id": ["year", "artist_id"],
+    "year": ["year"],
+    "none": [],
+}
 
 
-def create_spark_session():
+def create_spark_session(config=None):
     """
     function that creates spark session.
+    :param config: dict of extra Spark settings, e.g. the storage settings of storage.spark_config.
     """
-    spark = SparkSession \
+    builder = SparkSession \
         .builder \
-        .config("spark.jars.packages", "org.apache.hadoop:hadoop-aws:2.7.0") \
-        .getOrCreate()
+        .config("spark.sql.session.timeZone", "UTC")
+    for key, value in (config or {}).items():
+        builder = builder.config(key, value)
+    spark = builder.getOrCreate()
     return spark
 
 
-def process_song_data(spark, input_data, output_data):
+def start_time_column(ts):
+    """
+    Timestamp of a millisecond epoch column as a native Spark expression, keeping the milliseconds.
+    The session time zone is UTC, so this matches datetime.utcfromtimestamp(ts / 1000).
+    :param ts: column of milliseconds since the epoch.
+    :return: TimestampType column.
+    """
+    return (ts / 1000).cast(T.TimestampType())
+
+
+def persist(df, storage_level):
+    """
+    :param df: DataFrame.
+    :param storage_level: name of a pyspark StorageLevel, or NONE to leave the DataFrame uncached.
+    :return: the DataFrame, persisted at the storage level.
+    """
+    if storage_level == "NONE":
+        return df
+    return df.persist(getattr(StorageLevel, storage_level))
+
+
+def hadoop_path(spark, path):
+    """
+    :param spark: current Spark session.
+    :param path: local, hdfs or s3a path; may be a glob.
+    :return: Hadoop FileSystem and Path of the path.
+    """
+    path = spark.sparkContext._jvm.org.apache.hadoop.fs.Path(path)
+    return path.getFileSystem(spark.sparkContext._jsc.hadoopConfiguration()), path
+
+
+def path_exists(spark, path):
+    """
+    :return: whether the path exists, e.g. whether a table was written before.
+    """
+    fs, path = hadoop_path(spark, path)
+    return fs.exists(path)
+
+
+def log_partitions(spark, input_data):
+    """
+    List the year/month partitions of the log data, log_data/YYYY/MM.
+    :param spark: current Spark session.
+    :param input_data: directory of input data.
+    :return: sorted list of (year, month, path) tuples.
+    """
+    fs, pattern = hadoop_path(spark, input_data + "log_data/*/*")
+    partitions = []
+    for status in fs.globStatus(pattern) or []:
+        path = status.getPath()
+        year, month = path.getParent().getName(), path.getName()
+        if status.isDirectory() and year.isdigit() and month.isdigit():
+            partitions.append((int(year), int(month), path.toString()))
+    return sorted(partitions)
+
+
+def read_state(state_file):
+    """
+    :param state_file: location of the incremental state JSON.
+    :return: state dict, empty before the first run.
+    """
+    if not os.path.exists(state_file):
+        return {}
+    with open(state_file) as f:
+        return json.load(f)
+
+
+def write_state(state_file, state):
+    """
+    Replace the incremental state JSON atomically, so an interrupted run keeps the previous state.
+    :param state_file: location of the incremental state JSON.
+    :param state: state dict.
+    """
+    with open(state_file + ".tmp", "w") as f:
+        json.dump(state, f, indent=2)
+    os.replace(state_file + ".tmp", state_file)
+
+
+def read_song_data(spark, input_data, storage_level="MEMORY_AND_DISK", modified_after=None):
+    """
+    Parse the song JSON once with its explicit schema.
+    :param spark: current Spark session.
+    :param input_data: directory of input data.
+    :param storage_level: storage level of the parsed DataFrame.
+    :param modified_after: only read song files modified after this UTC time, e.g. 2018-11-01T00:00:00.
+    :return: persisted song DataFrame.
+    """
+    reader = spark.read
+    if modified_after:
+        reader = reader.option("modifiedAfter", modified_after)
+    return persist(reader.json(input_data + "song_data/*/*/*", schema=SONG_SCHEMA), storage_level)
+
+
+def read_log_data(spark, input_data, storage_level="MEMORY_AND_DISK", paths=None):
+    """
+    Parse the log JSON once with its explicit schema and keep the NextSong events with start_time
+    and the time parts, the frame users, time and songplays are all derived from.
+    :param spark: current Spark session.
+    :param input_data: directory of input data.
+    :param storage_level: storage level of the parsed DataFrame.
+    :param paths: log partitions to read, e.g. from log_partitions; all of log_data when not given.
+    :return: persisted DataFrame of NextSong events.
+    """
+    df = spark.read.json(paths or input_data + "log_data/*/*", schema=LOG_SCHEMA)
+
+    # filter by actions for song plays
+    df = df.where(df.page=='NextSong')
+
+    # create timestamp column from original timestamp column
+    df = df.withColumn("start_time", start_time_column(col("ts")))
+
+    # derive the time parts shared with the Postgres and Redshift pipelines
+    df = df.select("*", *spark_time_columns(col("start_time")))
+
+    return persist(df, storage_level)
+
+
+def table_writer(df, partition_by, incremental=False, mode="overwrite"):
+    """
+    Writer of a partitioned table. Rows are first repartitioned by the partition columns, so each
+    table partition is written by a single task into one file (split further only when
+    spark.sql.files.maxRecordsPerFile is set) instead of one small file per task.
+    :param df: DataFrame of a table.
+    :param partition_by: list of partition columns; empty for an unpartitioned table.
+    :param incremental: replace only the partitions present in df when writing with mode overwrite.
+    :param mode: save mode of the write.
+    :return: DataFrameWriter of df.
+    """
+    if not partition_by:
+        return df.write.mode(mode)
+    writer = df.repartition(*partition_by).write.partitionBy(*partition_by).mode(mode)
+    if incremental and mode == "overwrite":
+        if uses_s3a_committer(df.sparkSession.conf):
+            # the S3A commit protocol rejects dynamic partition overwrite; the partitioned committer
+            # replaces the partitions the job writes when it commits instead
+            writer = writer.mode("append") \
+                .option("fs.s3a.committer.name", "partitioned") \
+                .option("fs.s3a.committer.staging.conflict-mode", "replace")
+        else:
+            writer = writer.option("partitionOverwriteMode", "dynamic")
+    return writer
+
+
+def process_song_data(spark, input_data, output_data, df=None, incremental=False, songs_partition_by=("year", "artist_id")):
     """
     ETL function that process song data.
     :param spark: current Spark session.
     :param input_data: directory of input data.
     :param output_data: directory of output data.
+    :param df: song DataFrame from read_song_data; read from input_data when not given.
+    :param incremental: append the songs and artists that are not in the written tables yet.
+    :param songs_partition_by: partition columns of the songs table, see SONGS_PARTITIONS; keep them
+        the same across incremental runs.
+    :return: song dimension for the songplays join, derived from the same song DataFrame; None when
+        incremental, as the songs of earlier runs are only in the written tables.
     """
-    # get filepath to song data file
-    song_data = input_data + "song_data/*/*/*"
-    
-    # read song data file
-    df = spark.read.json(song_data)
+    if df is None:
+        df = read_song_data(spark, input_data)
 
     # extract columns to create songs table
     songs_table = (
         df.select(
             'song_id', 'title', 'artist_id', 'year', 'duration'
-        ).drop_duplicates() 
+        ).drop_duplicates(['song_id'])
     )
     
+    songs_mode = "overwrite"
+    if incremental and path_exists(spark, output_data+"songs.parquet"):
+        songs_table = songs_table.join(spark.read.parquet(output_data+"songs.parquet").select('song_id'),
+                                       'song_id', 'left_anti')
+        songs_mode = "append"
+
     # write songs table to parquet files partitioned by year and artist
-    songs_table.write.parquet(output_data+"song.parquet", mode="overwrite", partitionBy=["year", "artist_id"])
+    table_writer(songs_table, list(songs_partition_by), mode=songs_mode).parquet(output_data+"songs.parquet")
 
     # extract columns to create artists table
     artists_table = (
@@ -56,28 +258,97 @@ def process_song_data(spark, input_data, output_data):
             col('artist_location').alias('location'),
             col('artist_latitude').alias('latitude'),
             col('artist_longitude').alias('longitude')
-        ).drop_duplicates()
+        ).drop_duplicates(['artist_id'])
     )
     
+    artists_mode = "overwrite"
+    if incremental and path_exists(spark, output_data+"artist.parquet"):
+        artists_table = artists_table.join(spark.read.parquet(output_data+"artist.parquet").select('artist_id'),
+                                           'artist_id', 'left_anti')
+        artists_mode = "append"
+
     # write artists table to parquet files
-    artists_table.write.parquet(output_data+"artist.parquet", mode="overwrite")
+    artists_table.write.parquet(output_data+"artist.parquet", mode=artists_mode)
 
+    if incremental:
+        return None
+    return song_dimension(songs_table, artists_table)
 
-def process_log_data(spark, input_data, output_data):
+
+def estimated_size(df):
+    """
+    :param df: DataFrame.
+    :return: the optimizer's size estimate of the DataFrame in bytes, as used for automatic broadcasts.
+    """
+    return int(df._jdf.queryExecution().optimizedPlan().stats().sizeInBytes().toString())
+
+
+def song_dimension(songs_table, artists_table):
+    """
+    Song and artist attributes that identify the song of a log event, one row per
+    (title, artist_name, duration) so the join with the events cannot fan out.
+    :param songs_table: songs table.
+    :param artists_table: artists table.
+    :return: DataFrame of title, artist_name, duration, song_id and artist_id.
+    """
+    return (
+        songs_table.select('title', 'duration', 'song_id', 'artist_id')
+            .join(artists_table.select('artist_id', col('name').alias('artist_name')), 'artist_id')
+            .drop_duplicates(['title', 'artist_name', 'duration'])
+    )
+
+
+def build_songplays(df, song_df, broadcast_threshold=64 * 1024 * 1024):
+    """
+    Songplays from NextSong events with start_time and time parts.
+
+    Events are matched to songs on title, artist name and duration. The song dimension is unique on
+    those keys, so every event yields at most one songplay and no dedupe of the result is needed.
+    When the dimension is estimated below `broadcast_threshold` bytes it is broadcast, so the events
+    are joined where they are instead of being shuffled.
+    :param df: NextSong events.
+    :param song_df: song dimension from song_dimension.
+    :param broadcast_threshold: maximum estimated size in bytes of a broadcast dimension; 0 disables.
+    :return: songplays DataFrame.
+    """
+    if broadcast_threshold and estimated_size(song_df) <= broadcast_threshold:
+        song_df = F.broadcast(song_df)
+
+    return (
+        df.withColumn("songplay_id", F.monotonically_increasing_id())
+          .join(song_df, (song_df.title == df.song) & (song_df.artist_name == df.artist) &
+                (song_df.duration == df.length))
+          .select(
+            col('songplay_id'),
+            col('start_time').alias('start_time'),
+            col('userId').alias('user_id'),
+            col('level').alias('level'),
+            col('song_id').alias('song_id'),
+            col('artist_id').alias('artist_id'),
+            col('sessionId').alias('session_id'),
+            col('location').alias('location'),
+            col('userAgent').alias('user_agent'),
+            col('year').alias('year'),
+            col('month').alias('month')
+          )
+    )
+
+
+def process_log_data(spark, input_data, output_data, df=None, song_df=None, broadcast_threshold=64 * 1024 * 1024,
+                     incremental=False):
     """
     ETL function that process log data.
     :param spark: current Spark session.
     :param input_data: directory of input data.
     :param output_data: directory of output data.
+    :param df: NextSong DataFrame from read_log_data; read from input_data when not given.
+    :param song_df: song dimension from process_song_data; read from the written songs and artists when not given.
+    :param broadcast_threshold: maximum estimated size in bytes of the song dimension to broadcast.
+    :param incremental: append new users and overwrite only the year/month partitions of time and
+        songplays that df covers.
     """
-    # get filepath to log data file
-    log_data = input_data + "log_data/*/*"
-
-    # read log data file
-    df = spark.read.json(log_data)
-    
-    # filter by actions for song plays
-    df = df.where(df.page=='NextSong')
+    if df is None:
+        df = read_log_data(spark, input_data)
 
     # extract columns for users table    
     users_table = (
@@ -90,65 +361,113 @@ def process_log_data(spark, input_data, output_data):
         ).drop_duplicates()
     )
     
+    users_mode = "overwrite"
+    if incremental and path_exists(spark, output_data+"users.parquet"):
+        users_table = users_table.join(spark.read.parquet(output_data+"users.parquet"), users_table.columns, 'left_anti')
+        users_mode = "append"
+
     # write users table to parquet files
-    users_table.write.parquet(output_data+"users.parquet", mode="overwrite")
+    users_table.write.parquet(output_data+"users.parquet", mode=users_mode)
 
-    # create timestamp column from original timestamp column
-    get_timestamp = udf(lambda x: datetime.utcfromtimestamp(int(x)/1000), TimestampType())
-    df = df.withColumn("start_time", get_timestamp("ts"))
-    
-    # create datetime column from original timestamp column
-    get_datetime = udf(lambda x: F.to_date(x), TimestampType())
-    df = df.withColumn("hour",hour("start_time"))\
-           .withColumn("day",dayofmonth("start_time"))\
-           .withColumn("week",weekofyear("start_time"))\
-           .withColumn("month",month("start_time"))\
-           .withColumn("year",year("start_time"))\
-           .withColumn("weekday",dayofweek("start_time"))
-    
     # extract columns to create time table
     time_table = (
-        df.select("ts","start_time","hour", "day", "week", "month", "year", "weekday").distinct()
-    ).drop_duplicates()
+        df.select("start_time", "hour", "day", "week", "month", "year", "weekday").distinct()
+    )
     
     # write time table to parquet files partitioned by year and month
-    time_table.write.parquet(output_data+"time.parquet", mode="overwrite", partitionBy=["year", "month"])
+    table_writer(time_table, ["year", "month"], incremental).parquet(output_data+"time.parquet")
 
     # read in song data to use for songplays table
-    song_df = spark.read.parquet(output_data+"songs.parquet")
+    if song_df is None:
+        song_df = song_dimension(spark.read.parquet(output_data+"songs.parquet"),
+                                 spark.read.parquet(output_data+"artist.parquet"))
 
     # extract columns from joined song and log datasets to create songplays table 
-    songplays_table = (
-        df.withColumn("songplay_id", F.monotonically_increasing_id())
-          .join(song_df, song_df.title == df.song)
-          .select(
-            col('start_time').alias('start_time'),
-            col('userId').alias('user_id'),
-            col('level').alias('level'),
-            col('song_id').alias('song_id'),
-            col('artist_id').alias('artist_id'),
-            col('sessionId').alias('session_id'),
-            col('location').alias('location'),
-            col('userAgent').alias('user_agent'),
-            col('year').alias('year'),
-            col('month').alias('month')
-          ).drop_duplicates()
-    )
+    songplays_table = build_songplays(df, song_df, broadcast_threshold)
 
     # write songplays table to parquet files partitioned by year and month
-    songplays_table.write.parquet(output_data + "songplays.parquet", mode="overwrite", partitionBy=["year", "month"])
+    table_writer(songplays_table, ["year", "month"], incremental).parquet(output_data + "songplays.parquet")
+
+
+def process_data(spark, input_data, output_data, storage_level="MEMORY_AND_DISK", broadcast_threshold=64 * 1024 * 1024,
+                 incremental=False, state_file=None, songs_partition_by=("year", "artist_id")):
+    """
+    Single-pass ETL: each source is parsed once and persisted, and all five tables are derived from
+    the cached song and log DataFrames.
+
+    Incremental runs start from the state file of the previous run. Song files modified since then
+    are appended. Log partitions from the month of the last processed event onwards are re-read and
+    their year/month partitions of time and songplays overwritten, so a run costs the current month
+    instead of the whole history. Events arriving late for an older month are not picked up.
+    :param spark: current Spark session.
+    :param input_data: directory of input data.
+    :param output_data: directory of output data.
+    :param storage_level: storage level of the parsed DataFrames, or NONE.
+    :param broadcast_threshold: maximum estimated size in bytes of the song dimension to broadcast.
+    :param incremental: process only new song files and log partitions.
+    :param state_file: location of the state JSON holding the watermarks; required when incremental.
+    :param songs_partition_by: partition columns of the songs table.
+    """
+    state = read_state(state_file) if incremental else {}
+    started = datetime.utcnow().strftime("%Y-%m-%dT%H:%M:%S")
+
+    song_df = read_song_data(spark, input_data, storage_level, state.get("song_modified_after"))
+    song_dim = process_song_data(spark, input_data, output_data, song_df, incremental, songs_partition_by)
+
+    paths = None
+    watermark = state.get("log_watermark")
+    if watermark is not None:
+        last = datetime.utcfromtimestamp(watermark / 1000)
+        paths = [path for year, month, path in log_partitions(spark, input_data) if (year, month) >= (last.year, last.month)]
+        print("{} log partitions from {:%Y/%m} on to process.".format(len(paths), last))
+
+    if paths is None or paths:
+        log_df = read_log_data(spark, input_data, storage_level, paths)
+        process_log_data(spark, input_data, output_data, log_df, song_dim, broadcast_threshold, incremental)
+        last_ts = log_df.agg(F.max("ts")).first()[0]
+        if last_ts is not None:
+            state["log_watermark"] = max(last_ts, watermark or 0)
+        log_df.unpersist()
+    song_df.unpersist()
+
+    if state_file:
+        state["song_modified_after"] = started
+        write_state(state_file, state)
 
 
 def main():
     """
     Main function
     """
-    spark = create_spark_session()
-    input_data = "s3a://udacity-dend/"
-    output_data = "s3a://udacity-dend/output/"
-    
-    process_song_data(spark, input_data, output_data)    
-    process_log_data(spark, input_data, output_data)
+    parser = argparse.ArgumentParser(description="Load the Sparkify song and log data into the data lake tables.")
+    add_storage_arguments(parser)
+    parser.add_argument("--profile", choices=list(PROFILES), default="default",
+                        help="Spark tuning profile: shuffle partitions, adaptive execution, S3A upload and compression")
+    parser.add_argument("--storage-level", choices=STORAGE_LEVELS, default="MEMORY_AND_DISK",
+                        help="storage level of the parsed song and log data; NONE disables caching")
+    parser.add_argument("--broadcast-threshold", type=int, default=64 * 1024 * 1024,
+                        help="maximum estimated song dimension size in bytes to broadcast; 0 disables")
+    parser.add_argument("--incremental", action="store_true",
+                        help="process only song files and log partitions that are new since the last run")
+    parser.add_argument("--state-file", default="dl_state.json", help="watermarks of the last run")
+    parser.add_argument("--songs-partition-by", choices=list(SONGS_PARTITIONS), default="year,artist_id",
+                        help="partition columns of the songs table; year,artist_id writes a directory per artist")
+    parser.add_argument("--max-records-per-file", type=int, default=0,
+                        help="split the file of a table partition above this many rows; 0 writes one file")
+    args = parser.parse_args()
+
+    config = profile_config(args.profile, [args.input, args.output])
+    config.update(spark_config([args.input, args.output], args.s3_endpoint, args.s3_path_style,
+                               read_credentials(args.credentials), args.hadoop_aws_version,
+                               pyspark.__version__ if uses_s3a_committer(config) else None))
+    spark = create_spark_session(config)
+    log_config(spark, args.profile, config)
+    spark.conf.set("spark.sql.files.maxRecordsPerFile", args.max_records_per_file)
+    input_data = resolve_input(args.input, args.unpack_dir)
+    output_data = args.output.rstrip("/") + "/"
+
+    process_data(spark, input_data, output_data, args.storage_level, args.broadcast_threshold,
+                 args.incremental, args.state_file, SONGS_PARTITIONS[args.songs_partition_by])
 
 
 if __name__ == "__main__":
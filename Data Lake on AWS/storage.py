@@ -0,0 +1,117 @@
+import os
+import zipfile
+import configparser
+from datetime import datetime
+
+# hadoop-aws must match the Hadoop version Spark is built with: 3.3.4 for Spark 3.3 to 3.5. Older
+# connectors lack path-style access and the upload buffers of the tuning profiles and do not load on Spark 3.
+HADOOP_AWS_VERSION = "3.3.4"
+
+# module of the S3A committers' commit protocol; its version is that of the Spark build, Scala 2.12 for Spark 3
+SPARK_HADOOP_CLOUD_PACKAGE = "org.apache.spark:spark-hadoop-cloud_2.12:"
+
+
+def add_storage_arguments(parser):
+    """
+    Add the storage options shared by the data lake scripts to an argument parser.
+    :param parser: argparse.ArgumentParser.
+    """
+    parser.add_argument("--input", default="s3a://udacity-dend/",
+                        help="input directory: s3a://bucket/prefix/, a local directory, or a directory holding "
+                             "song-data.zip and log-data.zip")
+    parser.add_argument("--output", default="s3a://udacity-dend/output/", help="output directory, s3a:// or local")
+    parser.add_argument("--s3-endpoint", help="custom S3 endpoint, e.g. http://localhost:9000 for MinIO")
+    parser.add_argument("--s3-path-style", action="store_true", help="use path-style S3 requests, as MinIO needs")
+    parser.add_argument("--credentials", default="dl.cfg", help="config file with the [AWS] keys for s3a")
+    parser.add_argument("--hadoop-aws-version", default=HADOOP_AWS_VERSION,
+                        help="hadoop-aws package version, the Hadoop version of the Spark build")
+    parser.add_argument("--unpack-dir", help="where zipped input is unpacked (default: <input>/unpacked)")
+
+
+def read_credentials(config_file):
+    """
+    :param config_file: config file with AWS_ACCESS_KEY_ID and AWS_SECRET_ACCESS_KEY in [AWS].
+    :return: (access key, secret key), or None when the file or its keys are missing.
+    """
+    config = configparser.ConfigParser()
+    if not config.read(config_file) or not config.has_section("AWS"):
+        return None
+    key, secret = config.get("AWS", "AWS_ACCESS_KEY_ID", fallback=""), config.get("AWS", "AWS_SECRET_ACCESS_KEY", fallback="")
+    return (key, secret) if key and secret else None
+
+
+def spark_config(paths, endpoint=None, path_style=False, credentials=None, hadoop_aws_version=HADOOP_AWS_VERSION,
+                 spark_version=None):
+    """
+    Spark settings for the storage of the given paths. s3a paths add the hadoop-aws package, the
+    custom endpoint and the credentials; local paths need nothing.
+    :param paths: input and output locations.
+    :param endpoint: custom S3 endpoint URL.
+    :param path_style: use path-style S3 requests.
+    :param credentials: (access key, secret key) from read_credentials.
+    :param hadoop_aws_version: version of the hadoop-aws package.
+    :param spark_version: version of the Spark build, to add its spark-hadoop-cloud package for the S3A
+        committer of a tuning profile; None leaves it out.
+    :return: dict of Spark settings.
+    """
+    if not any(path.startswith("s3a://") for path in paths):
+        return {}
+
+    packages = ["org.apache.hadoop:hadoop-aws:" + hadoop_aws_version]
+    if spark_version:
+        packages.append(SPARK_HADOOP_CLOUD_PACKAGE + spark_version)
+    config = {"spark.jars.packages": ",".join(packages)}
+    if endpoint:
+        config["spark.hadoop.fs.s3a.endpoint"] = endpoint
+        config["spark.hadoop.fs.s3a.connection.ssl.enabled"] = str(endpoint.startswith("https://")).lower()
+    if path_style:
+        config["spark.hadoop.fs.s3a.path.style.access"] = "true"
+    if credentials:
+        config["spark.hadoop.fs.s3a.access.key"], config["spark.hadoop.fs.s3a.secret.key"] = credentials
+    return config
+
+
+def log_file_dir(name):
+    """
+    :param name: log file name such as 2018-11-01-events.json.
+    :return: its partition in the S3 layout, log_data/2018/11.
+    """
+    day = datetime.strptime(name[:10], "%Y-%m-%d")
+    return os.path.join("log_data", "{:%Y}".format(day), "{:%m}".format(day))
+
+
+def unpack_data(data_dir, target_dir):
+    """
+    Unpack song-data.zip and log-data.zip into the layout of the S3 input: song_data/A/B/C/*.json
+    and log_data/YYYY/MM/*.json. Files already unpacked with the same size are kept, and macOS
+    metadata files are skipped.
+    :param data_dir: directory holding the zip files.
+    :param target_dir: directory to unpack into.
+    :return: target directory, usable as input_data.
+    """
+    for archive, layout in [("song-data.zip", lambda name: os.path.dirname(name)),
+                            ("log-data.zip", log_file_dir)]:
+        with zipfile.ZipFile(os.path.join(data_dir, archive)) as zf:
+            for info in zf.infolist():
+                name = os.path.basename(info.filename)
+                if info.is_dir() or not name.endswith(".json"):
+                    continue
+                path = os.path.join(target_dir, layout(info.filename), name)
+                if os.path.exists(path) and os.path.getsize(path) == info.file_size:
+                    continue
+                os.makedirs(os.path.dirname(path), exist_ok=True)
+                with zf.open(info) as src, open(path, "wb") as dst:
+                    dst.write(src.read())
+
+    return target_dir.rstrip("/") + "/"
+
+
+def resolve_input(input_data, unpack_dir=None):
+    """
+    :param input_data: input directory.
+    :param unpack_dir: where zipped input is unpacked.
+    :return: input directory for Spark; a local directory holding the zipped samples is unpacked first.
+    """
+    if "://" not in input_data and os.path.exists(os.path.join(input_data, "log-data.zip")):
+        return unpack_data(input_data, unpack_dir or os.path.join(input_data, "unpacked"))
+    return input_data.rstrip("/") + "/"
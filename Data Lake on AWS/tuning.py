@@ -0,0 +1,103 @@
+import json
+
+PATH_OUTPUT_COMMIT_PROTOCOL = "org.apache.spark.internal.io.cloud.PathOutputCommitProtocol"
+
+# S3A directory committer, from the spark-hadoop-cloud module storage.spark_config adds for it. Tasks upload
+# their files as pending multipart uploads that only the job commit completes, so nothing is renamed (a
+# rename on S3 is a copy and a delete) and a failed job leaves no partial output in the destination.
+S3A_COMMITTER = {
+    "spark.hadoop.fs.s3a.committer.name": "directory",
+    "spark.hadoop.mapreduce.outputcommitter.factory.scheme.s3a": "org.apache.hadoop.fs.s3a.commit.S3ACommitterFactory",
+    "spark.sql.sources.commitProtocolClass": PATH_OUTPUT_COMMIT_PROTOCOL,
+    "spark.sql.parquet.output.committer.class": "org.apache.spark.internal.io.cloud.BindingParquetOutputCommitter",
+}
+
+# Spark settings per profile. "s3a" settings are only applied when the job reads or writes s3a paths,
+# and are those honoured by the pinned hadoop-aws 3.3 connector (storage.HADOOP_AWS_VERSION); it always
+# uploads blocks as they fill, so only the buffer of fast upload is set. No profile sets spark.master,
+# which would override spark-submit --master; plain python runs default to local mode.
+PROFILES = {
+    "default": {"spark": {}, "s3a": {}},
+    "local-small": {
+        "spark": {
+            # the sample data fits a handful of tasks; 200 shuffle partitions are mostly scheduling overhead
+            "spark.sql.shuffle.partitions": "8",
+            "spark.sql.adaptive.enabled": "true",
+            "spark.sql.adaptive.coalescePartitions.enabled": "true",
+            "spark.sql.adaptive.skewJoin.enabled": "false",
+            "spark.sql.parquet.compression.codec": "snappy",
+        },
+        "s3a": {
+            "spark.hadoop.fs.s3a.fast.upload.buffer": "bytebuffer",
+            **S3A_COMMITTER,
+        },
+    },
+    "cluster-large": {
+        "spark": {
+            "spark.sql.shuffle.partitions": "800",
+            "spark.sql.adaptive.enabled": "true",
+            "spark.sql.adaptive.coalescePartitions.enabled": "true",
+            "spark.sql.adaptive.advisoryPartitionSizeInBytes": "128m",
+            "spark.sql.adaptive.skewJoin.enabled": "true",
+            "spark.sql.adaptive.skewJoin.skewedPartitionFactor": "5",
+            "spark.sql.adaptive.skewJoin.skewedPartitionThresholdInBytes": "256m",
+            "spark.sql.parquet.compression.codec": "zstd",
+        },
+        "s3a": {
+            "spark.hadoop.fs.s3a.fast.upload.buffer": "disk",
+            "spark.hadoop.fs.s3a.multipart.size": "128M",
+            "spark.hadoop.fs.s3a.connection.maximum": "200",
+            "spark.hadoop.fs.s3a.threads.max": "64",
+            **S3A_COMMITTER,
+        },
+    },
+}
+
+SECRET_KEYS = ("spark.hadoop.fs.s3a.access.key", "spark.hadoop.fs.s3a.secret.key")
+
+
+def profile_config(profile, paths=()):
+    """
+    :param profile: name of a tuning profile.
+    :param paths: input and output locations; s3a settings are added when one of them is on s3a.
+    :return: dict of Spark settings of the profile.
+    """
+    config = dict(PROFILES[profile]["spark"])
+    if any(path.startswith("s3a://") for path in paths):
+        config.update(PROFILES[profile]["s3a"])
+    return config
+
+
+def uses_s3a_committer(conf):
+    """
+    :param conf: dict of Spark settings, or the RuntimeConfig of a session.
+    :return: whether the settings commit through an S3A committer.
+    """
+    return conf.get("spark.sql.sources.commitProtocolClass", None) == PATH_OUTPUT_COMMIT_PROTOCOL
+
+
+def effective_config(spark, keys):
+    """
+    The values the running session actually uses for the given settings, with credentials masked.
+    :param spark: current Spark session.
+    :param keys: setting names, e.g. those of profile_config.
+    :return: dict of setting to effective value.
+    """
+    conf = dict(spark.sparkContext.getConf().getAll())
+    effective = {}
+    for key in sorted(keys):
+        value = spark.conf.get(key, None) if key.startswith("spark.sql.") else conf.get(key)
+        effective[key] = "****" if key in SECRET_KEYS and value else value
+    return effective
+
+
+def log_config(spark, profile, config):
+    """
+    Print the profile and its effective settings as one JSON line of the job log. Every setting any
+    profile tunes is included, so runs with different profiles can be compared key by key.
+    :param spark: current Spark session.
+    :param profile: name of the tuning profile.
+    :param config: dict of Spark settings the session was created with.
+    """
+    keys = set(config) | {key for settings in PROFILES.values() for key in settings["spark"]}
+    print("spark config: " + json.dumps({"profile": profile, "settings": effective_config(spark, keys)}, sort_keys=True))
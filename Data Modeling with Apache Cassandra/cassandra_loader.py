@@ -0,0 +1,148 @@
+import csv
+import argparse
+from collections import namedtuple
+from itertools import islice
+from cassandra.cluster import Cluster
+from cassandra.concurrent import execute_concurrent
+from cassandra.query import BatchStatement, BatchType
+from cql_queries import *
+
+Event = namedtuple("Event", ["artist", "firstName", "gender", "itemInSession", "lastName", "length",
+                             "level", "location", "sessionId", "song", "userId"])
+
+# insert, parameters of the insert for an event, partition key of those parameters
+QUERY_TABLES = [
+    (song_info_by_session_insert,
+     lambda e: (e.sessionId, e.itemInSession, e.artist, e.song, e.length),
+     lambda params: params[0]),
+    (song_info_by_user_and_session_insert,
+     lambda e: (e.userId, e.sessionId, e.itemInSession, e.artist, e.song, e.firstName, e.lastName),
+     lambda params: params[:2]),
+    (user_name_by_song_and_userid_insert,
+     lambda e: (e.song, e.userId, e.firstName, e.lastName),
+     lambda params: params[0]),
+]
+
+
+def read_events(datafiles):
+    """
+    Parse event_datafile_new.csv, or the per-day shards of consolidate.py, once.
+    :param datafiles: list of consolidated event CSV files.
+    :return: generator of typed Event tuples.
+    """
+    for datafile in datafiles:
+        with open(datafile, encoding='utf8') as f:
+            csvreader = csv.reader(f)
+            next(csvreader) # skip header
+            for line in csvreader:
+                event = Event(*line)
+                yield event._replace(itemInSession=int(event.itemInSession), length=float(event.length),
+                                     sessionId=int(event.sessionId), userId=int(event.userId))
+
+
+def create_tables(session):
+    """
+    Create the keyspace and the query tables, and switch the session to the keyspace.
+    :param session: Cassandra session.
+    """
+    session.execute(keyspace_create)
+    session.set_keyspace('sparkify')
+    for query in create_table_queries:
+        session.execute(query)
+
+
+def drop_tables(session):
+    """
+    Drop the query tables.
+    :param session: Cassandra session.
+    """
+    for query in drop_table_queries:
+        session.execute(query)
+
+
+def partition_batches(prepared, params_list, key, batch_size):
+    """
+    Group insert parameters into unlogged batches that each touch a single partition.
+    :param prepared: prepared insert.
+    :param params_list: list of parameter tuples.
+    :param key: function returning the partition key of a parameter tuple.
+    :param batch_size: maximum statements per batch.
+    :return: list of BatchStatement.
+    """
+    partitions = {}
+    for params in params_list:
+        partitions.setdefault(key(params), []).append(params)
+
+    batches = []
+    for rows in partitions.values():
+        for start in range(0, len(rows), batch_size):
+            batch = BatchStatement(batch_type=BatchType.UNLOGGED)
+            for params in rows[start:start + batch_size]:
+                batch.add(prepared, params)
+            batches.append(batch)
+    return batches
+
+
+def load(session, datafiles, concurrency=100, chunk_size=10000, batch_size=0):
+    """
+    Load every query table from a single pass over the CSV with prepared statements.
+
+    Rows are read in chunks; each row of a chunk is fanned out to all query tables and the resulting
+    inserts run concurrently, `concurrency` requests in flight at a time. With `batch_size` > 0 the
+    inserts are first grouped into unlogged batches per partition key, which cuts round trips when
+    partitions receive many rows.
+    :param session: Cassandra session connected to the keyspace.
+    :param datafiles: list of consolidated event CSV files.
+    :param concurrency: maximum requests in flight.
+    :param chunk_size: rows read and dispatched per round.
+    :param batch_size: statements per unlogged partition batch; 0 sends individual inserts.
+    :return: number of CSV rows loaded.
+    """
+    prepared = [(session.prepare(insert), params, key) for insert, params, key in QUERY_TABLES]
+    events = read_events(datafiles)
+    rows = 0
+
+    while True:
+        chunk = list(islice(events, chunk_size))
+        if not chunk:
+            break
+
+        statements = []
+        for statement, params, key in prepared:
+            params_list = [params(event) for event in chunk]
+            if batch_size:
+                statements.extend((batch, ()) for batch in partition_batches(statement, params_list, key, batch_size))
+            else:
+                statements.extend((statement, p) for p in params_list)
+
+        execute_concurrent(session, statements, concurrency=concurrency, raise_on_first_error=True)
+        rows += len(chunk)
+        print('{} rows loaded.'.format(rows))
+
+    return rows
+
+
+def main():
+    """
+    Load event_datafile_new.csv into the query tables.
+    """
+    parser = argparse.ArgumentParser(description="Load event_datafile_new.csv into the Sparkify query tables.")
+    parser.add_argument("datafiles", nargs="*", default=["event_datafile_new.csv"],
+                        help="consolidated event CSV files")
+    parser.add_argument("--hosts", default="127.0.0.1", help="comma separated Cassandra contact points")
+    parser.add_argument("--concurrency", type=int, default=100, help="maximum requests in flight")
+    parser.add_argument("--chunk-size", type=int, default=10000, help="CSV rows dispatched per round")
+    parser.add_argument("--batch-size", type=int, default=0,
+                        help="group inserts into unlogged batches of this many statements per partition; 0 disables")
+    args = parser.parse_args()
+
+    cluster = Cluster(args.hosts.split(','))
+    session = cluster.connect()
+    create_tables(session)
+    load(session, args.datafiles, args.concurrency, args.chunk_size, args.batch_size)
+    session.shutdown()
+    cluster.shutdown()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,176 @@
+import os
+import csv
+import glob
+import argparse
+from itertools import islice
+
+COLUMNS = ['artist', 'firstName', 'gender', 'itemInSession', 'lastName', 'length',
+           'level', 'location', 'sessionId', 'song', 'userId']
+INT_COLUMNS = {'itemInSession', 'sessionId', 'userId'}
+FLOAT_COLUMNS = {'length'}
+
+csv.register_dialect('myDialect', quoting=csv.QUOTE_ALL, skipinitialspace=True)
+
+
+def get_files(event_dir):
+    """
+    :param event_dir: directory of daily event CSV files.
+    :return: sorted list of the CSV files, so output order does not depend on the file system.
+    """
+    return sorted(glob.glob(os.path.join(event_dir, '*.csv')))
+
+
+def shard_name(filepath):
+    """
+    :param filepath: daily event file such as event_data/2018-11-01-events.csv.
+    :return: the day of the file, e.g. 2018-11-01; the ts column of the CSVs is rounded to 6 digits
+        and cannot be used to tell days apart.
+    """
+    name = os.path.splitext(os.path.basename(filepath))[0]
+    return name[:10] if name.endswith('-events') else name
+
+
+def iter_rows(filepaths):
+    """
+    Lazily read the event files, one line at a time.
+
+    Columns are picked by header name rather than position, and rows without an artist (events
+    other than NextSong) are dropped.
+    :param filepaths: list of event CSV files.
+    :return: generator of (shard name, projected row) tuples.
+    """
+    for filepath in filepaths:
+        shard = shard_name(filepath)
+        with open(filepath, 'r', encoding='utf8', newline='') as csvfile:
+            csvreader = csv.reader(csvfile)
+            header = next(csvreader, None)
+            if header is None:
+                continue
+            indexes = [header.index(column) for column in COLUMNS]
+            artist = indexes[0]
+            for line in csvreader:
+                if line[artist] == '':
+                    continue
+                yield shard, [line[i] for i in indexes]
+
+
+class CsvSink:
+    """
+    Quoted CSV output in the layout of event_datafile_new.csv.
+    """
+    extension = '.csv'
+
+    def __init__(self, path):
+        self.file = open(path, 'w', encoding='utf8', newline='')
+        self.writer = csv.writer(self.file, dialect='myDialect')
+        self.writer.writerow(COLUMNS)
+
+    def write(self, rows):
+        self.writer.writerows(rows)
+
+    def close(self):
+        self.file.close()
+
+
+class ParquetSink:
+    """
+    Parquet output with typed columns, one row group per written chunk.
+    """
+    extension = '.parquet'
+
+    def __init__(self, path):
+        import pyarrow as pa
+        import pyarrow.parquet as pq
+
+        self.pa = pa
+        self.schema = pa.schema([(column, pa.int32() if column in INT_COLUMNS else
+                                  pa.float64() if column in FLOAT_COLUMNS else pa.string())
+                                 for column in COLUMNS])
+        self.writer = pq.ParquetWriter(path, self.schema)
+
+    def write(self, rows):
+        columns = list(zip(*rows))
+        arrays = []
+        for column, values in zip(COLUMNS, columns):
+            if column in INT_COLUMNS:
+                values = [int(v) for v in values]
+            elif column in FLOAT_COLUMNS:
+                values = [float(v) for v in values]
+            arrays.append(self.pa.array(values, type=self.schema.field(column).type))
+        self.writer.write_table(self.pa.Table.from_arrays(arrays, schema=self.schema))
+
+    def close(self):
+        self.writer.close()
+
+
+SINKS = {'csv': CsvSink, 'parquet': ParquetSink}
+
+
+def consolidate(filepaths, output, output_format='csv', shard=False, chunk_size=10000):
+    """
+    Consolidate event CSV files into event_datafile_new.csv, or into one file per day.
+
+    Rows are streamed from the input and written `chunk_size` at a time, so memory stays constant
+    whatever the number and size of the input files. With `shard`, the rows of a day are written to
+    <output>/<day>.csv (or .parquet), with only the current day's file open.
+    :param filepaths: list of event CSV files.
+    :param output: output file, or output directory when sharding.
+    :param output_format: 'csv' or 'parquet'.
+    :param shard: write one output per day instead of a single file.
+    :param chunk_size: rows written per call.
+    :return: number of rows written.
+    """
+    sink_class = SINKS[output_format]
+    sinks = {}
+    rows = 0
+
+    if shard:
+        os.makedirs(output, exist_ok=True)
+    else:
+        sinks[None] = sink_class(output)
+
+    stream = iter_rows(filepaths)
+    try:
+        while True:
+            chunk = list(islice(stream, chunk_size))
+            if not chunk:
+                break
+
+            by_shard = {}
+            for day, row in chunk:
+                by_shard.setdefault(day if shard else None, []).append(row)
+
+            for day, shard_rows in by_shard.items():
+                if day not in sinks:
+                    # input is sorted by day, so earlier days are complete
+                    for done in list(sinks):
+                        sinks.pop(done).close()
+                    sinks[day] = sink_class(os.path.join(output, day + sink_class.extension))
+                sinks[day].write(shard_rows)
+            rows += len(chunk)
+    finally:
+        for sink in sinks.values():
+            sink.close()
+
+    return rows
+
+
+def main():
+    """
+    Consolidate the event_data directory.
+    """
+    parser = argparse.ArgumentParser(description="Consolidate the Sparkify event CSV files for the Cassandra tables.")
+    parser.add_argument("event_dir", nargs="?", default="event_data", help="directory of event CSV files")
+    parser.add_argument("--output", default="event_datafile_new.csv",
+                        help="output file, or output directory with --shard")
+    parser.add_argument("--format", choices=sorted(SINKS), default="csv", help="output format")
+    parser.add_argument("--shard", action="store_true", help="write one output file per day")
+    parser.add_argument("--chunk-size", type=int, default=10000, help="rows written per chunk")
+    args = parser.parse_args()
+
+    rows = consolidate(get_files(args.event_dir), args.output, args.format, args.shard, args.chunk_size)
+    print('{} rows consolidated.'.format(rows))
+
+
+if __name__ == "__main__":
+    main()
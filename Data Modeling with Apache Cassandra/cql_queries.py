@@ -0,0 +1,52 @@
+# KEYSPACE
+
+keyspace_create = ("""
+CREATE KEYSPACE IF NOT EXISTS sparkify
+WITH REPLICATION = {'class':'SimpleStrategy', 'replication_factor':1}
+""")
+
+# DROP TABLES
+
+song_info_by_session_drop = "DROP TABLE IF EXISTS song_info_by_session"
+song_info_by_user_and_session_drop = "DROP TABLE IF EXISTS song_info_by_user_and_session"
+user_name_by_song_and_userid_drop = "DROP TABLE IF EXISTS user_name_by_song_and_userid"
+
+# CREATE TABLES
+
+song_info_by_session_create = ("""
+CREATE TABLE IF NOT EXISTS song_info_by_session
+(sessionId int, itemInSession int, artist text, song_title text, song_length float, PRIMARY KEY(sessionId, itemInSession))
+""")
+
+song_info_by_user_and_session_create = ("""
+CREATE TABLE IF NOT EXISTS song_info_by_user_and_session
+(userId int, sessionId int, itemInSession int, artist text, song text, firstName text, lastName text, PRIMARY KEY((userId, sessionId), itemInSession))
+""")
+
+user_name_by_song_and_userid_create = ("""
+CREATE TABLE IF NOT EXISTS user_name_by_song_and_userid
+(song text, userId int, firstName text, lastName text,
+PRIMARY KEY(song, userId))
+""")
+
+# INSERT RECORDS
+
+song_info_by_session_insert = ("""
+INSERT INTO song_info_by_session (sessionId, itemInSession, artist, song_title, song_length)
+VALUES (?, ?, ?, ?, ?)
+""")
+
+song_info_by_user_and_session_insert = ("""
+INSERT INTO song_info_by_user_and_session (userId, sessionId, itemInSession, artist, song, firstName, lastName)
+VALUES (?, ?, ?, ?, ?, ?, ?)
+""")
+
+user_name_by_song_and_userid_insert = ("""
+INSERT INTO user_name_by_song_and_userid (song, userId, firstName, lastName)
+VALUES (?, ?, ?, ?)
+""")
+
+# QUERY LISTS
+
+create_table_queries = [song_info_by_session_create, song_info_by_user_and_session_create, user_name_by_song_and_userid_create]
+drop_table_queries = [song_info_by_session_drop, song_info_by_user_and_session_drop, user_name_by_song_and_userid_drop]
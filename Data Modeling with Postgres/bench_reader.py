@@ -0,0 +1,57 @@
+import time
+import argparse
+from functools import partial
+from etl import get_files, extract_batch, extract_song_file, extract_log_file, stream_song_batch, stream_log_batch
+from json_reader import loads
+
+
+def time_extract(extract, filepaths, batch_size, repeat):
+    """
+    Time a batch extract function over a list of files.
+    :param extract: batch extract function.
+    :param filepaths: list of file locations.
+    :param batch_size: number of files per batch.
+    :param repeat: number of runs; the best one is kept.
+    :return: best wall time in seconds and number of songplay/song rows extracted.
+    """
+    best, rows = None, 0
+    for _ in range(repeat):
+        start = time.perf_counter()
+        rows = 0
+        for i in range(0, len(filepaths), batch_size):
+            frames, counts = extract(filepaths[i:i + batch_size])
+            rows += sum(counts)
+        elapsed = time.perf_counter() - start
+        best = elapsed if best is None else min(best, elapsed)
+    return best, rows
+
+
+def main():
+    """
+    Compare the per-file pandas reader with the streaming reader on a song_data/log_data tree.
+    """
+    parser = argparse.ArgumentParser(description="Benchmark pandas vs streaming JSON extraction.")
+    parser.add_argument("--data", default="data", help="directory holding song_data and log_data")
+    parser.add_argument("--batch-size", type=int, default=100, help="files per batch")
+    parser.add_argument("--repeat", type=int, default=3, help="runs per reader; the best is reported")
+    args = parser.parse_args()
+
+    print('JSON decoder: {}.{}'.format(loads.__module__, loads.__name__))
+    cases = [
+        ("song_data", partial(extract_batch, extract_song_file), stream_song_batch),
+        ("log_data", partial(extract_batch, extract_log_file), stream_log_batch),
+    ]
+    for name, pandas_extract, stream_extract in cases:
+        filepaths = get_files('{}/{}'.format(args.data, name))
+        if not filepaths:
+            print('{}: no files found'.format(name))
+            continue
+        pandas_time, rows = time_extract(pandas_extract, filepaths, args.batch_size, args.repeat)
+        stream_time, _ = time_extract(stream_extract, filepaths, args.batch_size, args.repeat)
+        print('{}: {} files, {} records | pandas {:.3f}s ({:.0f} files/sec) | stream {:.3f}s ({:.0f} files/sec) | {:.1f}x'.format(
+            name, len(filepaths), rows, pandas_time, len(filepaths) / pandas_time,
+            stream_time, len(filepaths) / stream_time, pandas_time / stream_time))
+
+
+if __name__ == "__main__":
+    main()
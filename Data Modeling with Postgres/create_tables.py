@@ -1,27 +1,34 @@
-import psycopg2
-from sql_queries import create_table_queries, drop_table_queries
+import argparse
+from db import read_config, connect
+from sql_queries import create_table_queries, drop_table_queries, upgrade_table_queries
 
 
-def create_database():
+def create_database(config, reset=True):
     """
     - Creates and connects to the sparkifydb
+    - Drops an existing sparkifydb first unless `reset` is False, in which case it is kept as is
     - Returns the connection and cursor to sparkifydb
+    Connection settings come from db.cfg.
     """
+    dbname = config['POSTGRES']['DB_NAME']
     
     # connect to default database
-    conn = psycopg2.connect("host=127.0.0.1 dbname=studentdb user=student password=student")
+    conn = connect(config, admin=True)
     conn.set_session(autocommit=True)
     cur = conn.cursor()
     
     # create sparkify database with UTF8 encoding
-    cur.execute("DROP DATABASE IF EXISTS sparkifydb")
-    cur.execute("CREATE DATABASE sparkifydb WITH ENCODING 'utf8' TEMPLATE template0")
+    if reset:
+        cur.execute("DROP DATABASE IF EXISTS {}".format(dbname))
+    cur.execute("SELECT 1 FROM pg_database WHERE datname = %s", (dbname,))
+    if cur.fetchone() is None:
+        cur.execute("CREATE DATABASE {} WITH ENCODING 'utf8' TEMPLATE template0".format(dbname))
 
     # close connection to default database
     conn.close()    
     
     # connect to sparkify database
-    conn = psycopg2.connect("host=127.0.0.1 dbname=sparkifydb user=student password=student")
+    conn = connect(config)
     cur = conn.cursor()
     
     return cur, conn
@@ -45,6 +52,16 @@ def create_tables(cur, conn):
         conn.commit()
 
 
+def upgrade_tables(cur, conn):
+    """
+    Adds what `create_tables` cannot add to tables that already exist, using the queries in
+    `upgrade_table_queries` list.
+    """
+    for query in upgrade_table_queries:
+        cur.execute(query)
+        conn.commit()
+
+
 def main():
     """
     - Drops (if exists) and Creates the sparkify database. 
@@ -57,11 +74,21 @@ def main():
     - Creates all tables needed. 
     
     - Finally, closes the connection. 
+
+    With --incremental the database, tables and load manifest are kept and
+    only missing tables are created; existing ones get the songplays unique key.
     """
-    cur, conn = create_database()
+    parser = argparse.ArgumentParser(description="Create the sparkifydb database and tables.")
+    parser.add_argument("--incremental", action="store_true", help="keep existing data and only create what is missing")
+    args = parser.parse_args()
+
+    cur, conn = create_database(read_config(), reset=not args.incremental)
     
-    drop_tables(cur, conn)
+    if not args.incremental:
+        drop_tables(cur, conn)
     create_tables(cur, conn)
+    if args.incremental:
+        upgrade_tables(cur, conn)
 
     conn.close()
 
@@ -0,0 +1,123 @@
+import os
+import configparser
+from contextlib import contextmanager
+import psycopg2
+from psycopg2.pool import ThreadedConnectionPool
+
+CONFIG_PATH = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'db.cfg')
+
+
+def read_config(path=CONFIG_PATH):
+    """
+    Read the DB connection, pool and commit settings.
+    :param path: location of the config file.
+    :return: ConfigParser.
+    """
+    config = configparser.ConfigParser()
+    config.read(path)
+    return config
+
+
+def get_dsn(config, admin=False):
+    """
+    Build a connection string from the config.
+    :param config: ConfigParser from read_config.
+    :param admin: connect to the maintenance DB used to create sparkifydb instead of sparkifydb itself.
+    :return: libpq connection string.
+    """
+    db = config['POSTGRES']
+    return "host={} port={} dbname={} user={} password={}".format(
+        db['HOST'], db['PORT'], db['ADMIN_DB_NAME'] if admin else db['DB_NAME'], db['DB_USER'], db['DB_PASSWORD'])
+
+
+def connect(config, admin=False):
+    """
+    Open a single connection.
+    :param config: ConfigParser from read_config.
+    :param admin: connect to the maintenance DB.
+    :return: psycopg2 connection.
+    """
+    return psycopg2.connect(get_dsn(config, admin))
+
+
+class ConnectionPool:
+    """
+    Thread-safe pool of connections to sparkifydb shared by the loaders and writer threads.
+    """
+
+    def __init__(self, config, min_connections=None, max_connections=None):
+        """
+        :param config: ConfigParser from read_config.
+        :param min_connections: connections opened up front; defaults to POOL.MIN_CONNECTIONS.
+        :param max_connections: upper bound of open connections; defaults to POOL.MAX_CONNECTIONS.
+        """
+        pool = config['POOL']
+        self.pool = ThreadedConnectionPool(
+            min_connections or pool.getint('MIN_CONNECTIONS'),
+            max_connections or pool.getint('MAX_CONNECTIONS'),
+            get_dsn(config))
+
+    @contextmanager
+    def connection(self):
+        """
+        Borrow a connection; it is rolled back if the block raises and returned to the pool either way.
+        """
+        conn = self.pool.getconn()
+        try:
+            yield conn
+        except Exception:
+            conn.rollback()
+            raise
+        finally:
+            self.pool.putconn(conn)
+
+    def close(self):
+        self.pool.closeall()
+
+
+class CommitPolicy:
+    """
+    Commit granularity of a connection: commit once every N files and/or every N rows, instead of
+    paying a commit (and fsync) per file. 0 disables a threshold; with both disabled only flush commits.
+    """
+
+    def __init__(self, every_files=1, every_rows=0):
+        """
+        :param every_files: files per commit.
+        :param every_rows: rows per commit.
+        """
+        self.every_files = every_files
+        self.every_rows = every_rows
+        self.files = 0
+        self.rows = 0
+
+    @classmethod
+    def from_config(cls, config):
+        """
+        :param config: ConfigParser from read_config.
+        """
+        return cls(config['COMMIT'].getint('EVERY_FILES'), config['COMMIT'].getint('EVERY_ROWS'))
+
+    def add(self, conn, files=0, rows=0):
+        """
+        Account for work done in the open transaction and commit when a threshold is reached.
+        :param conn: connection holding the transaction.
+        :param files: files loaded since the last call.
+        :param rows: rows loaded since the last call.
+        :return: True when a commit happened.
+        """
+        self.files += files
+        self.rows += rows
+        if (self.every_files and self.files >= self.every_files) or (self.every_rows and self.rows >= self.every_rows):
+            self.flush(conn)
+            return True
+        return False
+
+    def flush(self, conn):
+        """
+        Commit whatever is pending.
+        :param conn: connection holding the transaction.
+        """
+        conn.commit()
+        self.files = 0
+        self.rows = 0
@@ -1,8 +1,22 @@
 import os
+import io
+import sys
 import glob
-import psycopg2
+import time
+import queue
+import argparse
+import threading
+import multiprocessing
+from functools import partial
 import pandas as pd
 from sql_queries import *
+from song_lookup import SongLookup
+from manifest import pending_files, record_file
+from db import read_config, ConnectionPool, CommitPolicy
+from json_reader import read_columns, SONG_COLUMNS, LOG_COLUMNS
+
+sys.path.append(os.path.join(os.path.dirname(os.path.abspath(__file__)), os.pardir))
+from common.time_dimension import TimeDimension, time_frame
 
 
 def process_song_file(cur, filepath):
@@ -10,6 +24,7 @@ def process_song_file(cur, filepath):
     Process song file and insert data into corresponding DB.
     :param cur: cursor of DB.
     :param filepath: location of song file.
+    :return: number of song records loaded.
     """
     
     # open song file
@@ -23,12 +38,17 @@ def process_song_file(cur, filepath):
     artist_data = df[["artist_id", "artist_name", "artist_location", "artist_latitude", "artist_longitude"]].values[0].tolist()
     cur.execute(artist_table_insert, artist_data)
 
+    return len(df)
+
 
-def process_log_file(cur, filepath):
+def process_log_file(cur, filepath, lookup=None, calendar=None):
     """
     Process log file and insert data into corresponding DB.
     :param cur: cursor of DB.
     :param filepath: location of log file.
+    :param lookup: optional SongLookup resolving song and artist ids in memory instead of per-row song_select.
+    :param calendar: optional TimeDimension skipping start_times already inserted from earlier files.
+    :return: number of NextSong events loaded.
     """
     
     # open log file
@@ -37,17 +57,14 @@ def process_log_file(cur, filepath):
     # filter by NextSong action
     df = df[df["page"]=="NextSong"]
 
-    # convert timestamp column to datetime
-    t = pd.to_datetime(df["ts"], unit="ms")
-    df["ts"] = t
-    
-    # insert time data records
-    time_data = pd.concat((t, t.dt.hour, t.dt.day, t.dt.weekofyear, t.dt.month, t.dt.year, t.dt.weekday), axis=1).values
-    column_labels = ("start_time", "hour", "day", "week", "month", "year", "weekday")
-    time_df = pd.DataFrame.from_records(data=time_data, columns=column_labels)
+    # insert time data records, one per distinct timestamp
+    time_df = calendar.rows(df["ts"]) if calendar is not None else time_frame(df["ts"])
 
-    for i, row in time_df.iterrows():
-        cur.execute(time_table_insert, list(row))
+    for row in time_df.astype(object).values.tolist():
+        cur.execute(time_table_insert, row)
+
+    # convert timestamp column to datetime
+    df["ts"] = pd.to_datetime(df["ts"], unit="ms")
 
     # load user table
     user_df = df[["userId", "firstName", "lastName", "gender", "level"]]
@@ -56,62 +73,466 @@ def process_log_file(cur, filepath):
     for i, row in user_df.iterrows():
         cur.execute(user_table_insert, row)
 
+    # resolve the whole file against the in-memory index at once
+    if lookup is not None:
+        resolved = lookup.resolve(df)
+
     # insert songplay records
     for index, row in df.iterrows():
         
         # get songid and artistid from song and artist tables
-        cur.execute(song_select, (row.song, row.artist, row.length))
-        results = cur.fetchone()
-        
-        if results:
-            songid, artistid = results
+        if lookup is not None:
+            songid, artistid = resolved.at[index, "song_id"], resolved.at[index, "artist_id"]
         else:
-            songid, artistid = None, None
+            cur.execute(song_select, (row.song, row.artist, row.length))
+            results = cur.fetchone()
+
+            if results:
+                songid, artistid = results
+            else:
+                songid, artistid = None, None
 
         # insert songplay record
         songplay_data = (row.ts, row.userId, row.level, songid, artistid, row.sessionId, row.location, row.userAgent)
         cur.execute(songplay_table_insert, songplay_data)
 
+    return len(df)
+
 
-def process_data(cur, conn, filepath, func):
+def song_frames(df):
     """
-    Process song file and insert data into corresponding DB.
+    Shape raw song records into the rows of the songs and artists tables.
+    :param df: song records.
+    :return: dict of table name to DataFrame with staging column names.
+    """
+
+    songs = df[["song_id", "title", "artist_id", "year", "duration"]]
+    artists = df[["artist_id", "artist_name", "artist_location", "artist_latitude", "artist_longitude"]].rename(columns={
+        "artist_name": "name",
+        "artist_location": "location",
+        "artist_latitude": "latitude",
+        "artist_longitude": "longitude",
+    })
+
+    return {"songs": songs, "artists": artists}
+
+
+def log_frames(df):
+    """
+    Shape NextSong events into the rows of the time, users and songplays tables.
+    :param df: NextSong log records.
+    :return: dict of table name to DataFrame with staging column names.
+    """
+
+    t = pd.to_datetime(df["ts"], unit="ms")
+    time_df = time_frame(df["ts"])
+
+    user_df = df[["userId", "firstName", "lastName", "gender", "level"]].rename(columns={
+        "userId": "user_id",
+        "firstName": "first_name",
+        "lastName": "last_name",
+    })
+
+    songplay_df = pd.DataFrame({
+        "start_time": t,
+        "user_id": df["userId"],
+        "level": df["level"],
+        "song_id": None,
+        "artist_id": None,
+        "session_id": df["sessionId"],
+        "location": df["location"],
+        "user_agent": df["userAgent"],
+        "song": df["song"],
+        "artist": df["artist"],
+        "length": df["length"],
+    })
+
+    return {"time": time_df, "users": user_df, "songplays": songplay_df}
+
+
+def extract_song_file(filepath):
+    """
+    Parse song file into the rows of the songs and artists tables.
+    :param filepath: location of song file.
+    :return: dict of table name to DataFrame with staging column names.
+    """
+
+    df = pd.read_json(filepath, lines=True)
+    return song_frames(df)
+
+
+def extract_log_file(filepath):
+    """
+    Parse log file into the rows of the time, users and songplays tables.
+    :param filepath: location of log file.
+    :return: dict of table name to DataFrame with staging column names.
+    """
+
+    df = pd.read_json(filepath, lines=True)
+    return log_frames(df[df["page"]=="NextSong"])
+
+
+def stream_song_batch(filepaths):
+    """
+    Extract a batch of song files through the streaming reader, building one DataFrame for the whole batch.
+    :param filepaths: list of file locations.
+    :return: dict of table name to list of DataFrames, and the number of records extracted per file.
+    """
+
+    df, counts = read_columns(filepaths, SONG_COLUMNS)
+    return {table: [frame] for table, frame in song_frames(df).items()}, counts
+
+
+def stream_log_batch(filepaths):
+    """
+    Extract a batch of log files through the streaming reader, keeping only NextSong events.
+    :param filepaths: list of file locations.
+    :return: dict of table name to list of DataFrames, and the number of records extracted per file.
+    """
+
+    df, counts = read_columns(filepaths, LOG_COLUMNS, where=lambda record: record.get("page") == "NextSong")
+    return {table: [frame] for table, frame in log_frames(df).items()}, counts
+
+
+def copy_dataframe(cur, df, table):
+    """
+    Stream DataFrame rows into a table through COPY FROM STDIN.
     :param cur: cursor of DB.
-    :param conn: connection of DB.
+    :param df: rows to copy, columns named after the table columns.
+    :param table: name of target table.
+    """
+
+    buffer = io.StringIO()
+    df.to_csv(buffer, index=False, header=False)
+    buffer.seek(0)
+    cur.copy_expert("COPY {} ({}) FROM STDIN WITH (FORMAT csv)".format(table, ", ".join(df.columns)), buffer)
+
+
+def load_frames(cur, frames, lookup=None, calendar=None):
+    """
+    Bulk load a batch of extracted rows: COPY into temp staging tables, then merge each into its final table.
+    :param cur: cursor of DB.
+    :param frames: dict of table name to list of DataFrames, in file order.
+    :param lookup: optional SongLookup resolving songplay ids before the COPY; unresolved rows fall back to the SQL join.
+    :param calendar: optional TimeDimension dropping time rows already loaded by earlier batches.
+    """
+
+    for table, (staging_table, staging_create, merge) in bulk_load_queries.items():
+        if not frames.get(table):
+            continue
+        df = pd.concat(frames[table], ignore_index=True)
+
+        # dedupe keys inside the batch, keeping the row the per-row upserts would have left behind
+        if table == "users":
+            df = df.drop_duplicates("user_id", keep="last")
+        elif table == "songs":
+            df = df.drop_duplicates("song_id", keep="first")
+        elif table == "artists":
+            df = df.drop_duplicates("artist_id", keep="first")
+        elif table == "time":
+            df = calendar.unseen(df) if calendar is not None else df.drop_duplicates("start_time")
+        elif table == "songplays" and lookup is not None:
+            df[["song_id", "artist_id"]] = lookup.resolve(df).values
+
+        cur.execute(staging_create)
+        copy_dataframe(cur, df, staging_table)
+        cur.execute(merge)
+        cur.execute("TRUNCATE {}".format(staging_table))
+
+
+def get_files(filepath):
+    """
+    Collect all JSON files under a directory.
     :param filepath: location of files.
-    :param func: corresponding process function of the process files.
+    :return: list of absolute file paths.
     """
-        
-    # get all files matching extension from directory
+
     all_files = []
     for root, dirs, files in os.walk(filepath):
         files = glob.glob(os.path.join(root,'*.json'))
         for f in files :
             all_files.append(os.path.abspath(f))
 
-    # get total number of files found
-    num_files = len(all_files)
-    print('{} files found in {}'.format(num_files, filepath))
+    return all_files
+
+
+def extract_batch(func, filepaths):
+    """
+    Extract a batch of files.
+    :param func: corresponding extract function of the process files.
+    :param filepaths: list of file locations.
+    :return: dict of table name to list of DataFrames in file order, and the number of records extracted per file.
+    """
+
+    frames = {}
+    counts = []
+    for datafile in filepaths:
+        extracted = func(datafile)
+        for table, df in extracted.items():
+            frames.setdefault(table, []).append(df)
+        counts.append(max(len(df) for df in extracted.values()))
+
+    return frames, counts
+
+
+def process_data_bulk(cur, conn, filepath, extract, batch_size=100, lookup=None, policy=None):
+    """
+    Process new or changed files in batches through COPY and set-based merges instead of per-row inserts.
+    :param cur: cursor of DB.
+    :param conn: connection of DB.
+    :param filepath: location of files.
+    :param extract: batch extract function, such as extract_batch bound to a per-file extractor or stream_log_batch.
+    :param batch_size: number of files loaded per COPY.
+    :param lookup: optional SongLookup used to resolve songplay ids in memory.
+    :param policy: CommitPolicy deciding when to commit; defaults to a commit per batch.
+    """
+
+    all_files = get_files(filepath)
+    print('{} files found in {}'.format(len(all_files), filepath))
+    pending = pending_files(cur, conn, all_files)
+    num_files = len(pending)
+    calendar = TimeDimension()
+    policy = policy or CommitPolicy()
+
+    for start in range(0, num_files, batch_size):
+        entries = pending[start:start + batch_size]
+        frames, counts = extract([entry[0] for entry in entries])
+        load_frames(cur, frames, lookup, calendar)
+        for entry, rows in zip(entries, counts):
+            record_file(cur, entry, rows)
+        policy.add(conn, files=len(entries), rows=sum(counts))
+        print('{}/{} files processed.'.format(min(start + batch_size, num_files), num_files))
+
+    policy.flush(conn)
+
+
+def write_batches(pool, batches, lookup, row_counts, errors, policy):
+    """
+    Writer thread: load batches from the queue on a pooled connection until it receives None.
+    :param pool: ConnectionPool to borrow the connection from.
+    :param batches: queue of (frames, manifest entries with their record counts, number of files) tuples.
+    :param lookup: optional SongLookup used to resolve songplay ids in memory.
+    :param row_counts: list collecting rows written per batch, shared by all writers.
+    :param errors: list collecting writer exceptions.
+    :param policy: CommitPolicy whose thresholds this writer applies to its own transaction.
+    """
+
+    policy = CommitPolicy(policy.every_files, policy.every_rows)
+
+    with pool.connection() as conn:
+        cur = conn.cursor()
+        while True:
+            batch = batches.get()
+            if batch is None:
+                break
+            if errors:
+                continue
+            try:
+                frames, loaded, num_batch_files = batch
+                load_frames(cur, frames, lookup)
+                for entry, rows in loaded:
+                    record_file(cur, entry, rows)
+                rows = sum(len(df) for dfs in frames.values() for df in dfs)
+                policy.add(conn, files=num_batch_files, rows=rows)
+                row_counts.append(rows)
+            except Exception as e:
+                conn.rollback()
+                errors.append(e)
+
+        if not errors:
+            policy.flush(conn)
+
+
+def process_data_parallel(pool, filepath, extract, workers=4, writers=2, batch_size=100, lookup=None, policy=None):
+    """
+    Process files with a pool of parser processes feeding a set of writer connections.
+
+    Files are split into shards of `batch_size`, parsed in worker processes and handed back in file
+    order. Dimension rows are routed so the final tables match the serial path no matter which writer
+    commits first: songs, artists and time rows are only forwarded the first time a key is seen, and users (last
+    level wins) are collected and merged once after all other batches. Only songplay_id values,
+    generated by the SERIAL column, may be assigned in a different order.
+
+    Files of batches holding users are recorded in the manifest together with that final merge, so a
+    crash before it reloads them on the next run; the other tables make such a reload a no-op.
+    :param pool: ConnectionPool with room for `writers` more connections.
+    :param filepath: location of files.
+    :param extract: picklable batch extract function, run in the worker processes.
+    :param workers: number of parser processes.
+    :param writers: number of writer connections.
+    :param batch_size: number of files per shard.
+    :param lookup: optional SongLookup used to resolve songplay ids in memory.
+    :param policy: CommitPolicy applied by each writer; defaults to a commit per batch.
+    """
+
+    all_files = get_files(filepath)
+    print('{} files found in {}'.format(len(all_files), filepath))
+    with pool.connection() as conn:
+        pending = pending_files(conn.cursor(), conn, all_files)
+    num_files = len(pending)
+    policy = policy or CommitPolicy()
+
+    shards = [pending[i:i + batch_size] for i in range(0, num_files, batch_size)]
+    batches = queue.Queue(maxsize=writers * 2)
+    row_counts = []
+    errors = []
+    threads = [threading.Thread(target=write_batches, args=(pool, batches, lookup, row_counts, errors, policy)) for _ in range(writers)]
+    for thread in threads:
+        thread.start()
+
+    seen_keys = {"songs": set(), "artists": set()}
+    key_columns = {"songs": "song_id", "artists": "artist_id"}
+    calendar = TimeDimension()
+    users = []
+    deferred = []
+    start_time = time.time()
+    files_done = 0
+
+    try:
+        with multiprocessing.Pool(workers) as parsers:
+            paths = [[entry[0] for entry in shard] for shard in shards]
+            for shard, (frames, counts) in zip(shards, parsers.imap(extract, paths)):
+                for table, seen in seen_keys.items():
+                    if table in frames:
+                        df = pd.concat(frames[table], ignore_index=True).drop_duplicates(key_columns[table])
+                        df = df[~df[key_columns[table]].isin(seen)]
+                        seen.update(df[key_columns[table]])
+                        frames[table] = [df]
+                if "time" in frames:
+                    frames["time"] = [calendar.unseen(pd.concat(frames["time"], ignore_index=True))]
+                loaded = list(zip(shard, counts))
+                if "users" in frames:
+                    users.extend(frames.pop("users"))
+                    deferred.extend(loaded)
+                    loaded = []
+
+                batches.put((frames, loaded, len(shard)))
+                files_done += len(shard)
+                print('{}/{} files parsed.'.format(files_done, num_files))
+    finally:
+        for _ in threads:
+            batches.put(None)
+        for thread in threads:
+            thread.join()
+
+    if errors:
+        raise errors[0]
+
+    # users keep the last level seen, so they are merged once, in file order, after everything else
+    if users:
+        with pool.connection() as conn:
+            cur = conn.cursor()
+            load_frames(cur, {"users": users})
+            for entry, rows in deferred:
+                record_file(cur, entry, rows)
+            conn.commit()
+        row_counts.append(sum(len(df) for df in users))
+
+    rows = sum(row_counts)
+    elapsed = max(time.time() - start_time, 1e-9)
+    print('{} files, {} rows in {:.1f}s: {:.1f} files/sec, {:.1f} rows/sec.'.format(
+        num_files, rows, elapsed, num_files / elapsed, rows / elapsed))
+
 
-    # iterate over files and process
-    for i, datafile in enumerate(all_files, 1):
-        func(cur, datafile)
-        conn.commit()
+def process_data(cur, conn, filepath, func, policy=None):
+    """
+    Process song file and insert data into corresponding DB.
+    :param cur: cursor of DB.
+    :param conn: connection of DB.
+    :param filepath: location of files.
+    :param func: corresponding process function of the process files.
+    :param policy: CommitPolicy deciding when to commit; defaults to a commit per file.
+    """
+        
+    # get all files matching extension from directory
+    all_files = get_files(filepath)
+    print('{} files found in {}'.format(len(all_files), filepath))
+
+    # skip files already recorded in the manifest
+    pending = pending_files(cur, conn, all_files)
+    num_files = len(pending)
+
+    # iterate over files and process, recording each in the same transaction as its rows
+    policy = policy or CommitPolicy()
+    for i, entry in enumerate(pending, 1):
+        rows = func(cur, entry[0])
+        record_file(cur, entry, rows)
+        policy.add(conn, files=1, rows=rows)
         print('{}/{} files processed.'.format(i, num_files))
 
+    policy.flush(conn)
+
 
 def main():
     """
     Driver function of processing.
     """
-    
-    conn = psycopg2.connect("host=127.0.0.1 dbname=sparkifydb user=student password=student")
-    cur = conn.cursor()
 
-    process_data(cur, conn, filepath='data/song_data', func=process_song_file)
-    process_data(cur, conn, filepath='data/log_data', func=process_log_file)
+    parser = argparse.ArgumentParser(description="Load Sparkify song and log data into sparkifydb.")
+    parser.add_argument("--bulk", action="store_true", help="load through COPY and set-based merges instead of per-row inserts")
+    parser.add_argument("--batch-size", type=int, default=100, help="files per COPY batch in bulk and parallel mode")
+    parser.add_argument("--workers", type=int, default=0,
+                        help="parse files in this many processes and load them in bulk; 0 keeps the single-process path")
+    parser.add_argument("--writers", type=int, default=2, help="writer connections used with --workers")
+    parser.add_argument("--reader", choices=["pandas", "stream"], default="pandas",
+                        help="in bulk and parallel mode, parse each file with pandas or stream whole batches into typed column buffers")
+    parser.add_argument("--song-index", choices=["none", "db", "json"], default="none",
+                        help="resolve songplay ids from an in-memory index built from the DB or the song_data JSON")
+    parser.add_argument("--duration-tolerance", type=float, default=0.0,
+                        help="seconds of difference allowed between log length and song duration when using the index")
+    parser.add_argument("--commit-every-files", type=int, help="commit once every N files; overrides db.cfg")
+    parser.add_argument("--commit-every-rows", type=int, help="commit once every N rows; overrides db.cfg")
+    args = parser.parse_args()
+
+    config = read_config()
+    policy = CommitPolicy.from_config(config)
+    if args.commit_every_files is not None:
+        policy.every_files = args.commit_every_files
+    if args.commit_every_rows is not None:
+        policy.every_rows = args.commit_every_rows
+
+    pool = ConnectionPool(config, max_connections=max(config['POOL'].getint('MAX_CONNECTIONS'), args.writers + 1))
+    try:
+        with pool.connection() as conn:
+            run(args, pool, conn, conn.cursor(), policy)
+    finally:
+        pool.close()
+
+
+def run(args, pool, conn, cur, policy):
+    """
+    Load song data, then log data, with the mode selected on the command line.
+    :param args: parsed command line arguments.
+    :param pool: ConnectionPool used by the parallel writers.
+    :param conn: connection of DB.
+    :param cur: cursor of DB.
+    :param policy: CommitPolicy for the load.
+    """
+
+    if args.reader == "stream":
+        extract_songs, extract_logs = stream_song_batch, stream_log_batch
+    else:
+        extract_songs, extract_logs = partial(extract_batch, extract_song_file), partial(extract_batch, extract_log_file)
+
+    if args.workers:
+        process_data_parallel(pool, 'data/song_data', extract_songs, args.workers, args.writers, args.batch_size, policy=policy)
+    elif args.bulk:
+        process_data_bulk(cur, conn, filepath='data/song_data', extract=extract_songs, batch_size=args.batch_size, policy=policy)
+    else:
+        process_data(cur, conn, filepath='data/song_data', func=process_song_file, policy=policy)
+
+    lookup = None
+    if args.song_index == "db":
+        lookup = SongLookup.from_db(cur, args.duration_tolerance)
+    elif args.song_index == "json":
+        lookup = SongLookup.from_song_files(get_files('data/song_data'), args.duration_tolerance)
 
-    conn.close()
+    if args.workers:
+        process_data_parallel(pool, 'data/log_data', extract_logs, args.workers, args.writers, args.batch_size, lookup, policy)
+    elif args.bulk:
+        process_data_bulk(cur, conn, filepath='data/log_data', extract=extract_logs, batch_size=args.batch_size, lookup=lookup, policy=policy)
+    else:
+        process_data(cur, conn, filepath='data/log_data', func=partial(process_log_file, lookup=lookup, calendar=TimeDimension()), policy=policy)
 
 
 if __name__ == "__main__":
@@ -0,0 +1,114 @@
+import json
+import pandas as pd
+
+try:
+    import orjson
+    loads = orjson.loads
+except ImportError:
+    try:
+        import ujson
+        loads = ujson.loads
+    except ImportError:
+        loads = json.loads
+
+
+SONG_COLUMNS = {
+    "song_id": str,
+    "title": str,
+    "artist_id": str,
+    "year": int,
+    "duration": float,
+    "artist_name": str,
+    "artist_location": str,
+    "artist_latitude": float,
+    "artist_longitude": float,
+}
+
+LOG_COLUMNS = {
+    "artist": str,
+    "firstName": str,
+    "gender": str,
+    "lastName": str,
+    "length": float,
+    "level": str,
+    "location": str,
+    "page": str,
+    "sessionId": int,
+    "song": str,
+    "ts": int,
+    "userAgent": str,
+    "userId": int,
+}
+
+
+def iter_records(filepath):
+    """
+    Stream records from a line-delimited JSON file.
+    :param filepath: location of file.
+    :return: generator of dicts, one per non-empty line.
+    """
+    with open(filepath, 'rb') as f:
+        for line in f:
+            if line.strip():
+                yield loads(line)
+
+
+class ColumnBuffer:
+    """
+    Typed column buffers filled record by record and turned into a single DataFrame at the end,
+    so a batch of tiny files costs one DataFrame construction instead of one per file.
+    """
+
+    def __init__(self, columns):
+        """
+        :param columns: dict of column name to Python type (str, int or float).
+        """
+        self.columns = columns
+        self.data = {column: [] for column in columns}
+
+    def __len__(self):
+        return len(next(iter(self.data.values()), []))
+
+    def extend(self, records, where=None):
+        """
+        Append records to the buffers.
+        :param records: iterable of dicts.
+        :param where: optional predicate; records it rejects are skipped.
+        :return: number of records appended.
+        """
+        appended = 0
+        for record in records:
+            if where is not None and not where(record):
+                continue
+            for column, values in self.data.items():
+                values.append(record.get(column))
+            appended += 1
+        return appended
+
+    def to_frame(self):
+        """
+        :return: DataFrame with int columns as nullable Int64, float columns as float64 and the rest as object.
+        """
+        frame = {}
+        for column, kind in self.columns.items():
+            values = pd.Series(self.data[column], dtype=object)
+            if kind is int:
+                frame[column] = pd.to_numeric(values, errors="coerce").astype("Int64")
+            elif kind is float:
+                frame[column] = pd.to_numeric(values, errors="coerce").astype(float)
+            else:
+                frame[column] = values
+        return pd.DataFrame(frame)
+
+
+def read_columns(filepaths, columns, where=None):
+    """
+    Read many line-delimited JSON files into one set of column buffers.
+    :param filepaths: list of file locations.
+    :param columns: dict of column name to Python type.
+    :param where: optional record predicate.
+    :return: DataFrame of all kept records and the number kept per file.
+    """
+    buffer = ColumnBuffer(columns)
+    counts = [buffer.extend(iter_records(f), where) for f in filepaths]
+    return buffer.to_frame(), counts
@@ -0,0 +1,72 @@
+import os
+import hashlib
+from sql_queries import manifest_table_create, manifest_select, manifest_upsert
+
+
+def content_hash(filepath, chunk_size=1 << 20):
+    """
+    Hash file content.
+    :param filepath: location of file.
+    :param chunk_size: bytes read per step.
+    :return: hex md5 digest of the file.
+    """
+    digest = hashlib.md5()
+    with open(filepath, 'rb') as f:
+        for chunk in iter(lambda: f.read(chunk_size), b''):
+            digest.update(chunk)
+    return digest.hexdigest()
+
+
+def load_manifest(cur):
+    """
+    Read the processed-files manifest, creating it when missing.
+    :param cur: cursor of DB.
+    :return: dict of path to (size, mtime, content_hash, rows_loaded).
+    """
+    cur.execute(manifest_table_create)
+    cur.execute(manifest_select)
+    return {path: (size, mtime, digest, rows) for path, size, mtime, digest, rows in cur.fetchall()}
+
+
+def pending_files(cur, conn, filepaths):
+    """
+    Keep the files that are new or changed since they were last loaded.
+
+    Size and mtime are compared first; only files whose signature moved are hashed. A file that was
+    touched but has the same content is skipped and its new signature recorded.
+    :param cur: cursor of DB.
+    :param conn: connection of DB.
+    :param filepaths: list of file locations.
+    :return: list of (path, size, mtime, content_hash) tuples to load, in input order.
+    """
+    manifest = load_manifest(cur)
+    pending = []
+
+    for path in filepaths:
+        stat = os.stat(path)
+        loaded = manifest.get(path)
+        if loaded and loaded[0] == stat.st_size and loaded[1] == stat.st_mtime:
+            continue
+
+        digest = content_hash(path)
+        if loaded and loaded[2] == digest:
+            record_file(cur, (path, stat.st_size, stat.st_mtime, digest), loaded[3])
+            continue
+
+        pending.append((path, stat.st_size, stat.st_mtime, digest))
+
+    conn.commit()
+    print('{} of {} files are new or changed.'.format(len(pending), len(filepaths)))
+
+    return pending
+
+
+def record_file(cur, entry, rows_loaded):
+    """
+    Mark a file as loaded. Run it in the same transaction as the file's rows so a crash never leaves
+    a file recorded but not loaded.
+    :param cur: cursor of DB.
+    :param entry: (path, size, mtime, content_hash) tuple from pending_files.
+    :param rows_loaded: number of rows extracted from the file.
+    """
+    cur.execute(manifest_upsert, (*entry, rows_loaded))
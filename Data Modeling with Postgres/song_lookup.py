@@ -0,0 +1,114 @@
+import pandas as pd
+from sql_queries import song_lookup_select
+
+
+def normalize(values):
+    """
+    Normalize song titles or artist names for matching.
+    :param values: Series of strings.
+    :return: Series of stripped, case-folded strings.
+    """
+    return values.fillna("").astype(str).str.strip().str.casefold()
+
+
+class SongLookup:
+    """
+    In-memory index resolving (song, artist, length) to (song_id, artist_id).
+
+    The index is a hash map keyed on the normalized (title, artist name) pair, holding every
+    candidate duration, so an exact or tolerance-based duration match is one dict lookup plus a
+    scan of a handful of candidates.
+    """
+
+    def __init__(self, songs, tolerance=0.0):
+        """
+        :param songs: DataFrame with title, name, duration, song_id and artist_id columns.
+        :param tolerance: maximum absolute difference in seconds between log length and song duration.
+        """
+        songs = songs.dropna(subset=["title", "name", "duration"])
+        self.tolerance = tolerance
+        self.songs = pd.DataFrame({
+            "title_key": normalize(songs["title"]),
+            "artist_key": normalize(songs["name"]),
+            "duration": songs["duration"].astype(float),
+            "song_id": songs["song_id"],
+            "artist_id": songs["artist_id"],
+        }).drop_duplicates(["title_key", "artist_key", "duration"], keep="first").reset_index(drop=True)
+
+        self.index = {}
+        for title, artist, duration, song_id, artist_id in self.songs.itertuples(index=False):
+            self.index.setdefault((title, artist), []).append((duration, song_id, artist_id))
+
+    @classmethod
+    def from_db(cls, cur, tolerance=0.0):
+        """
+        Build the index from the songs and artists tables.
+        :param cur: cursor of DB.
+        :param tolerance: duration tolerance in seconds.
+        """
+        cur.execute(song_lookup_select)
+        songs = pd.DataFrame(cur.fetchall(), columns=["song_id", "artist_id", "title", "name", "duration"])
+        return cls(songs, tolerance)
+
+    @classmethod
+    def from_song_files(cls, filepaths, tolerance=0.0):
+        """
+        Build the index straight from song_data JSON files, without touching the DB.
+        :param filepaths: list of song file locations.
+        :param tolerance: duration tolerance in seconds.
+        """
+        frames = [pd.read_json(f, lines=True) for f in filepaths]
+        df = pd.concat(frames, ignore_index=True) if frames else pd.DataFrame(
+            columns=["song_id", "artist_id", "title", "artist_name", "duration"])
+        return cls(df.rename(columns={"artist_name": "name"}), tolerance)
+
+    def __len__(self):
+        return len(self.songs)
+
+    def get(self, song, artist, length):
+        """
+        Resolve a single event.
+        :param song: song title from the log.
+        :param artist: artist name from the log.
+        :param length: song length from the log.
+        :return: (song_id, artist_id), or (None, None) when nothing matches.
+        """
+        if song is None or artist is None or pd.isna(length):
+            return None, None
+
+        key = (str(song).strip().casefold(), str(artist).strip().casefold())
+        best = None
+        for duration, song_id, artist_id in self.index.get(key, ()):
+            diff = abs(duration - float(length))
+            if diff <= self.tolerance and (best is None or diff < best[0]):
+                best = (diff, song_id, artist_id)
+
+        return (best[1], best[2]) if best else (None, None)
+
+    def resolve(self, df, song_col="song", artist_col="artist", length_col="length"):
+        """
+        Resolve a whole log DataFrame at once with a vectorized merge.
+        :param df: log rows.
+        :param song_col: column holding the song title.
+        :param artist_col: column holding the artist name.
+        :param length_col: column holding the song length.
+        :return: DataFrame of song_id and artist_id aligned with the index of df.
+        """
+        events = pd.DataFrame({
+            "row": range(len(df)),
+            "title_key": normalize(df[song_col]),
+            "artist_key": normalize(df[artist_col]),
+            "length": df[length_col].astype(float),
+        })
+
+        matches = events.merge(self.songs, on=["title_key", "artist_key"], how="inner")
+        matches["diff"] = (matches["duration"] - matches["length"]).abs()
+        matches = matches[matches["diff"] <= self.tolerance]
+        matches = matches.sort_values(["row", "diff"], kind="stable").drop_duplicates("row", keep="first")
+
+        resolved = pd.DataFrame({"song_id": None, "artist_id": None}, index=range(len(df)), dtype=object)
+        resolved.loc[matches["row"].values, "song_id"] = matches["song_id"].values
+        resolved.loc[matches["row"].values, "artist_id"] = matches["artist_id"].values
+        resolved.index = df.index
+
+        return resolved
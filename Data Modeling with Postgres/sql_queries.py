@@ -5,6 +5,7 @@ user_table_drop = "DROP TABLE IF EXISTS users"
 song_table_drop = "DROP TABLE IF EXISTS songs"
 artist_table_drop = "DROP TABLE IF EXISTS artists"
 time_table_drop = "DROP TABLE IF EXISTS time"
+manifest_table_drop = "DROP TABLE IF EXISTS etl_manifest"
 
 # CREATE TABLES
 
@@ -18,7 +19,8 @@ song_id VARCHAR,
 artist_id VARCHAR,
 session_id INTEGER,
 location VARCHAR,
-user_agent VARCHAR
+user_agent VARCHAR,
+UNIQUE (start_time, user_id, session_id)
 );
 """)
 
@@ -64,6 +66,33 @@ weekday INTEGER
 );
 """)
 
+manifest_table_create = ("""
+CREATE TABLE IF NOT EXISTS etl_manifest(
+path VARCHAR PRIMARY KEY,
+size BIGINT NOT NULL,
+mtime DOUBLE PRECISION NOT NULL,
+content_hash VARCHAR NOT NULL,
+rows_loaded INTEGER,
+loaded_at TIMESTAMP NOT NULL DEFAULT now()
+);
+""")
+
+# UPGRADE TABLES CREATED BEFORE THE NATURAL KEY OF SONGPLAYS
+# CREATE TABLE IF NOT EXISTS leaves existing tables as they are, so the unique key the merges conflict on
+# is added here; duplicates loaded before it existed are removed first, keeping the earliest row
+
+songplay_duplicates_delete = ("""
+DELETE FROM songplays a
+USING songplays b
+WHERE a.start_time = b.start_time AND a.user_id = b.user_id AND a.session_id = b.session_id
+AND a.songplay_id > b.songplay_id;
+""")
+
+songplay_unique_index_create = ("""
+CREATE UNIQUE INDEX IF NOT EXISTS songplays_start_time_user_id_session_id_key
+ON songplays (start_time, user_id, session_id);
+""")
+
 # INSERT RECORDS
 
 songplay_table_insert = ("""
@@ -97,6 +126,22 @@ VALUES (%s, %s, %s, %s, %s, %s, %s)
 ON CONFLICT DO NOTHING;
 """)
 
+manifest_upsert = ("""
+INSERT INTO etl_manifest (path, size, mtime, content_hash, rows_loaded)
+VALUES (%s, %s, %s, %s, %s)
+ON CONFLICT (path) DO UPDATE SET
+size = EXCLUDED.size,
+mtime = EXCLUDED.mtime,
+content_hash = EXCLUDED.content_hash,
+rows_loaded = EXCLUDED.rows_loaded,
+loaded_at = now();
+""")
+
+manifest_select = ("""
+SELECT path, size, mtime, content_hash, rows_loaded
+FROM etl_manifest;
+""")
+
 # FIND SONGS
 
 song_select = ("""
@@ -110,7 +155,137 @@ ON s.artist_id = a.artist_id
 WHERE s.title = %s AND a.name = %s AND s.duration = %s;
 """)
 
+song_lookup_select = ("""
+SELECT
+    s.song_id,
+    s.artist_id,
+    s.title,
+    a.name,
+    s.duration
+FROM
+    songs s
+JOIN artists a
+ON s.artist_id = a.artist_id;
+""")
+
+# BULK LOAD STAGING
+
+songplay_staging_create = ("""
+CREATE TEMP TABLE IF NOT EXISTS songplays_staging(
+start_time TIMESTAMP,
+user_id INTEGER,
+level VARCHAR,
+song_id VARCHAR,
+artist_id VARCHAR,
+session_id INTEGER,
+location VARCHAR,
+user_agent VARCHAR,
+song VARCHAR,
+artist VARCHAR,
+length FLOAT
+) ON COMMIT DELETE ROWS;
+""")
+
+user_staging_create = ("""
+CREATE TEMP TABLE IF NOT EXISTS users_staging(
+user_id INTEGER,
+first_name VARCHAR,
+last_name VARCHAR,
+gender CHAR(1),
+level VARCHAR
+) ON COMMIT DELETE ROWS;
+""")
+
+song_staging_create = ("""
+CREATE TEMP TABLE IF NOT EXISTS songs_staging(
+song_id VARCHAR,
+title VARCHAR,
+artist_id VARCHAR,
+year INTEGER,
+duration FLOAT
+) ON COMMIT DELETE ROWS;
+""")
+
+artist_staging_create = ("""
+CREATE TEMP TABLE IF NOT EXISTS artists_staging(
+artist_id VARCHAR,
+name VARCHAR,
+location VARCHAR,
+latitude FLOAT,
+longitude FLOAT
+) ON COMMIT DELETE ROWS;
+""")
+
+time_staging_create = ("""
+CREATE TEMP TABLE IF NOT EXISTS time_staging(
+start_time TIMESTAMP,
+hour INTEGER,
+day INTEGER,
+week INTEGER,
+month INTEGER,
+year INTEGER,
+weekday INTEGER
+) ON COMMIT DELETE ROWS;
+""")
+
+# MERGE STAGING INTO FINAL TABLES
+
+songplay_table_merge = ("""
+INSERT INTO songplays (start_time, user_id, level, song_id, artist_id, session_id, location, user_agent)
+SELECT sp.start_time, sp.user_id, sp.level,
+       COALESCE(sp.song_id, m.song_id), COALESCE(sp.artist_id, m.artist_id),
+       sp.session_id, sp.location, sp.user_agent
+FROM songplays_staging sp
+LEFT JOIN LATERAL (
+    SELECT s.song_id, s.artist_id
+    FROM songs s
+    JOIN artists a
+    ON s.artist_id = a.artist_id
+    WHERE sp.song_id IS NULL AND s.title = sp.song AND a.name = sp.artist AND s.duration = sp.length
+    LIMIT 1
+) m ON TRUE
+ON CONFLICT DO NOTHING;
+""")
+
+user_table_merge = ("""
+INSERT INTO users (user_id, first_name, last_name, gender, level)
+SELECT user_id, first_name, last_name, gender, level
+FROM users_staging
+ON CONFLICT (user_id) DO UPDATE SET level = EXCLUDED.level;
+""")
+
+song_table_merge = ("""
+INSERT INTO songs (song_id, title, artist_id, year, duration)
+SELECT song_id, title, artist_id, year, duration
+FROM songs_staging
+ON CONFLICT DO NOTHING;
+""")
+
+artist_table_merge = ("""
+INSERT INTO artists (artist_id, name, location, latitude, longitude)
+SELECT artist_id, name, location, latitude, longitude
+FROM artists_staging
+ON CONFLICT DO NOTHING;
+""")
+
+time_table_merge = ("""
+INSERT INTO time (start_time, hour, day, week, month, year, weekday)
+SELECT start_time, hour, day, week, month, year, weekday
+FROM time_staging
+ON CONFLICT DO NOTHING;
+""")
+
 # QUERY LISTS
 
-create_table_queries = [songplay_table_create, user_table_create, song_table_create, artist_table_create, time_table_create]
-drop_table_queries = [songplay_table_drop, user_table_drop, song_table_drop, artist_table_drop, time_table_drop]
\ No newline at end of file
+create_table_queries = [songplay_table_create, user_table_create, song_table_create, artist_table_create, time_table_create, manifest_table_create]
+upgrade_table_queries = [songplay_duplicates_delete, songplay_unique_index_create]
+drop_table_queries = [songplay_table_drop, user_table_drop, song_table_drop, artist_table_drop, time_table_drop, manifest_table_drop]
+
+# table -> (staging table, staging create, merge), in load order so songs and artists are merged before songplays look them up
+bulk_load_queries = {
+    "songs": ("songs_staging", song_staging_create, song_table_merge),
+    "artists": ("artists_staging", artist_staging_create, artist_table_merge),
+    "time": ("time_staging", time_staging_create, time_table_merge),
+    "users": ("users_staging", user_staging_create, user_table_merge),
+    "songplays": ("songplays_staging", songplay_staging_create, songplay_table_merge),
+}
\ No newline at end of file
@@ -11,7 +11,9 @@ AWS_SECRET = os.environ.get('AWS_SECRET')
 
 default_args = {
     'owner': 'udacity',
-    'start_date': datetime(2019, 1, 12),
+    # the hourly runs backfill the log_data events, all of November 2018 from the hour of the first one
+    'start_date': datetime(2018, 11, 1, 20),
+    'end_date': datetime(2018, 11, 30, 23),
     'retries': 3,
     'retry_delay': timedelta(minutes=5),
     'email_on_retry': False,
@@ -22,7 +24,9 @@ dag = DAG('udac_example_dag',
           default_args=default_args,
           description='Load and transform data in Redshift with Airflow',
           schedule_interval='0 * * * *',
-          catchup=False
+          catchup=True,
+          # runs share the staging tables, which each one truncates
+          max_active_runs=1
         )
 
 start_operator = DummyOperator(task_id='Begin_execution',  dag=dag)
@@ -34,9 +38,10 @@ stage_events_to_redshift = StageToRedshiftOperator(
     redshift_conn_id="redshift",
     table="staging_events",
     s3_bucket="udacity-dend",
-    s3_key="log_data",
+    s3_key="log_data/{{ execution_date.strftime('%Y/%m') }}/{{ ds }}-events.json",
     json_path="s3://udacity-dend/log_json_path.json",
-    file_type="json"
+    file_type="json",
+    truncate=True
 )
 
 stage_songs_to_redshift = StageToRedshiftOperator(
@@ -48,7 +53,8 @@ stage_songs_to_redshift = StageToRedshiftOperator(
     s3_bucket="udacity-dend",
     s3_key="song_data/A/A/A",
     json_path="auto",
-    file_type="json"
+    file_type="json",
+    truncate=True
 )
 
 load_songplays_table = LoadFactOperator(
@@ -56,7 +62,10 @@ load_songplays_table = LoadFactOperator(
     dag=dag,
     redshift_conn_id="redshift",
     table='songplays',
-    sql_stmt=SqlQueries.songplay_table_insert
+    sql_stmt=SqlQueries.songplay_table_insert,
+    mode='upsert',
+    primary_key=['playid'],
+    source_filters={'staging_events': SqlQueries.staging_events_in_interval}
 )
 
 load_user_dimension_table = LoadDimensionOperator(
@@ -64,7 +73,10 @@ load_user_dimension_table = LoadDimensionOperator(
     dag=dag,
     redshift_conn_id="redshift",
     table='users',
-    sql_stmt=SqlQueries.user_table_insert
+    sql_stmt=SqlQueries.user_table_insert,
+    mode='upsert',
+    primary_key=['userid'],
+    source_filters={'staging_events': SqlQueries.staging_events_in_interval}
 )
 
 load_song_dimension_table = LoadDimensionOperator(
@@ -72,7 +84,9 @@ load_song_dimension_table = LoadDimensionOperator(
     dag=dag,
     redshift_conn_id="redshift",
     table='songs',
-    sql_stmt=SqlQueries.song_table_insert
+    sql_stmt=SqlQueries.song_table_insert,
+    mode='upsert',
+    primary_key=['songid']
 )
 
 load_artist_dimension_table = LoadDimensionOperator(
@@ -80,7 +94,9 @@ load_artist_dimension_table = LoadDimensionOperator(
     dag=dag,
     redshift_conn_id="redshift",
     table='artists',
-    sql_stmt=SqlQueries.artist_table_insert
+    sql_stmt=SqlQueries.artist_table_insert,
+    mode='upsert',
+    primary_key=['artistid']
 )
 
 load_time_dimension_table = LoadDimensionOperator(
@@ -88,7 +104,10 @@ load_time_dimension_table = LoadDimensionOperator(
     dag=dag,
     redshift_conn_id="redshift",
     table='time',
-    sql_stmt=SqlQueries.time_table_insert
+    sql_stmt=SqlQueries.time_table_insert,
+    mode='upsert',
+    primary_key=['start_time'],
+    source_filters={'songplays': SqlQueries.songplays_in_interval}
 )
 
 run_quality_checks = DataQualityOperator(
@@ -1,5 +1,7 @@
 from helpers.sql_queries import SqlQueries
+from helpers.load_table import load_table
 
 __all__ = [
     'SqlQueries',
-]
\ No newline at end of file
+    'load_table',
+]
@@ -0,0 +1,97 @@
+LOAD_MODES = ("append", "truncate", "upsert")
+
+
+def shadow_sources(cur, source_filters):
+    """Replace each filtered source table, for this session only, with a temp table of the same name
+    holding the rows matching its filter. The load statement is left as it is: its unqualified table
+    names resolve to the temp tables, the temporary schema being searched first.
+    :params cur: cursor
+    :params source_filters: dict of source table to SQL condition, e.g. the rows of the DAG run's interval
+    """
+    for source, condition in sorted(source_filters.items()):
+        cur.execute("CREATE TEMP TABLE {0} AS SELECT * FROM public.{0} WHERE {1}".format(source, condition))
+
+
+def key_condition(primary_key, left, right):
+    """:return: SQL condition joining two aliases on the primary key columns."""
+    return " AND ".join("{1}.{0} = {2}.{0}".format(column, left, right) for column in primary_key)
+
+
+def upsert(cur, table, sql_stmt, primary_key, order_by=()):
+    """Merge the rows of the load statement into the table on its primary key: target rows with a key of
+    the batch are deleted and one batch row per key inserted.
+    :params cur: cursor
+    :params table: target table
+    :params sql_stmt: SELECT producing rows of the table
+    :params primary_key: key columns of the table
+    :params order_by: columns of the table, optionally with DESC, ranking the batch rows of a key; the first
+        is kept. Without them any one row of a key is kept, which is only right when the SELECT returns one
+        row per key or the rows of a key are the same.
+    :return: (rows inserted with a new key, rows replacing an existing key)
+    """
+    batch = "{}_batch".format(table)
+    keys = ", ".join(primary_key)
+    order = " ORDER BY {}".format(", ".join(order_by)) if order_by else ""
+    cur.execute("CREATE TEMP TABLE {} (LIKE {})".format(batch, table))
+    cur.execute("INSERT INTO {} {}".format(batch, sql_stmt))
+    cur.execute("SELECT * FROM {} LIMIT 0".format(batch))
+    columns = ", ".join(description[0] for description in cur.description)
+
+    cur.execute("""SELECT COUNT(*) FROM (SELECT DISTINCT {keys} FROM {batch}) b
+                   WHERE EXISTS (SELECT 1 FROM {table} t WHERE {condition})""".format(
+        keys=keys, batch=batch, table=table, condition=key_condition(primary_key, "t", "b")))
+    updated = cur.fetchone()[0]
+
+    cur.execute("DELETE FROM {table} USING {batch} WHERE {condition}".format(
+        table=table, batch=batch, condition=key_condition(primary_key, table, batch)))
+    cur.execute("""INSERT INTO {table} ({columns})
+                   SELECT {columns} FROM (
+                       SELECT {columns}, ROW_NUMBER() OVER (PARTITION BY {keys}{order}) AS load_rank
+                       FROM {batch}
+                   ) ranked
+                   WHERE load_rank = 1""".format(table=table, columns=columns, keys=keys, order=order, batch=batch))
+    total = cur.rowcount
+    cur.execute("DROP TABLE {}".format(batch))
+    return total - updated, updated
+
+
+def load_table(hook, table, sql_stmt, mode="append", primary_key=(), source_filters=None, order_by=()):
+    """Load a fact or dimension table from a SELECT in one transaction.
+    :params hook: PostgresHook of Redshift
+    :params table: target table
+    :params sql_stmt: SELECT producing rows of the table
+    :params mode: "append" inserts the rows, "truncate" empties the table first, "upsert" merges them on the primary key
+    :params primary_key: key columns of the table, for "upsert"
+    :params source_filters: dict of source table to SQL condition restricting the rows the statement reads
+    :params order_by: columns ranking the rows of a key, for "upsert"
+    :return: dict of the rows inserted and updated
+    """
+    source_filters = source_filters or {}
+    if mode not in LOAD_MODES:
+        raise ValueError(f"Unknown load mode {mode}, expected one of {LOAD_MODES}")
+    if mode == "upsert" and not primary_key:
+        raise ValueError(f"Upserting {table} needs its primary key columns")
+    if mode == "truncate" and source_filters:
+        raise ValueError(f"Truncating {table} before loading only the filtered rows would drop the others")
+    if table in source_filters:
+        raise ValueError(f"{table} cannot be both loaded and filtered as a source")
+
+    conn = hook.get_conn()
+    try:
+        cur = conn.cursor()
+        shadow_sources(cur, source_filters)
+        if mode == "upsert":
+            inserted, updated = upsert(cur, table, sql_stmt, primary_key, order_by)
+        else:
+            if mode == "truncate":
+                cur.execute("TRUNCATE TABLE {}".format(table))
+            cur.execute("INSERT INTO {} {}".format(table, sql_stmt))
+            inserted, updated = cur.rowcount, 0
+        conn.commit()
+    except Exception:
+        conn.rollback()
+        raise
+    finally:
+        conn.close()
+
+    return {"table": table, "mode": mode, "inserted": inserted, "updated": updated}
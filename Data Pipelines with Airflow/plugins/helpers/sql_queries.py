@@ -19,10 +19,14 @@ class SqlQueries:
                 AND events.length = songs.duration
     """)
 
+    # one row per user, from the latest event, so a level change replaces the user's level
     user_table_insert = ("""
-        SELECT distinct userid, firstname, lastname, gender, level
-        FROM staging_events
-        WHERE page='NextSong'
+        SELECT userid, firstname, lastname, gender, level
+        FROM (SELECT userid, firstname, lastname, gender, level,
+                     ROW_NUMBER() OVER (PARTITION BY userid ORDER BY ts DESC) AS recency
+            FROM staging_events
+            WHERE page='NextSong') latest
+        WHERE recency = 1
     """)
 
     song_table_insert = ("""
@@ -39,4 +43,16 @@ class SqlQueries:
         SELECT start_time, extract(hour from start_time), extract(day from start_time), extract(week from start_time), 
                extract(month from start_time), extract(year from start_time), extract(dayofweek from start_time)
         FROM songplays
-    """)
\ No newline at end of file
+    """)
+
+    # rows of the DAG run's interval, [ts, next_execution_date), for the incremental loads;
+    # rendered by the operators' templates, ts of staging_events is in epoch milliseconds
+    staging_events_in_interval = ("""
+        ts >= extract(epoch from '{{ ts }}'::timestamptz) * 1000
+        AND ts < extract(epoch from '{{ next_execution_date }}'::timestamptz) * 1000
+    """)
+
+    songplays_in_interval = ("""
+        start_time >= '{{ ts }}'::timestamptz
+        AND start_time < '{{ next_execution_date }}'::timestamptz
+    """)
@@ -20,11 +20,11 @@ class DataQualityOperator(BaseOperator):
         redshift_hook = PostgresHook(self.redshift_conn_id)
         
         for t in self.tables:
-            self.log.into(f"Checking Data Quality for {t} table")
+            self.log.info(f"Checking Data Quality for {t} table")
             records = redshift_hook.get_records(f"SELECT COUNT(*) FROM {t}")
-            if len(records[0]) < 1 or len(records) < 1:
+            if len(records) < 1 or len(records[0]) < 1:
                 raise ValueError(f"Data quality check failed: Table {t} has no results")
             num_records = records[0][0]
             if num_records < 1:
                 raise ValueError(f"Data quality check failed: Table {t} has 0 rows.")
-            self.log.info('Data Quality check passed with {records[0][0]} records.')
\ No newline at end of file
+            self.log.info(f'Data Quality check passed with {records[0][0]} records.')
\ No newline at end of file
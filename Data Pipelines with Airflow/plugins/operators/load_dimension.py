@@ -1,10 +1,12 @@
 from airflow.hooks.postgres_hook import PostgresHook
 from airflow.models import BaseOperator
 from airflow.utils.decorators import apply_defaults
+from helpers.load_table import load_table
 
 class LoadDimensionOperator(BaseOperator):
 
     ui_color = '#80BD9E'
+    template_fields = ('sql_stmt', 'source_filters')
 
     @apply_defaults
     def __init__(self,
@@ -12,31 +14,27 @@ class LoadDimensionOperator(BaseOperator):
              table="",
              sql_stmt="",
              append=False,
+             mode=None,
+             primary_key=(),
+             source_filters=None,
+             order_by=(),
              *args, **kwargs):
 
         super(LoadDimensionOperator, self).__init__(*args, **kwargs)
         self.redshift_conn_id = redshift_conn_id
         self.table = table
         self.sql_stmt = sql_stmt
-        self.append = append
+        # without a mode, append chooses between appending and truncating first as before
+        self.mode = mode or ("append" if append else "truncate")
+        self.primary_key = primary_key
+        self.source_filters = source_filters or {}
+        self.order_by = order_by
 
     def execute(self, context):
         redshift = PostgresHook(postgres_conn_id=self.redshift_conn_id)
-        self.log.info(f"Loading dimension table {self.table}")
-        sql = ""
-
-        if self.append:
-            sql = """
-                    BEGIN;
-                    INSERT INTO {}
-                    {};
-                    COMMIT;""".format(self.table, self.sql_stmt)
-        else:
-            sql = """
-                    BEGIN;
-                    TRUNCATE TABLE {}; 
-                    INSERT INTO {}
-                    {}; 
-                    COMMIT;""".format(self.table, self.table, self.sql_stmt)
-
-        redshift.run(sql)
\ No newline at end of file
+        self.log.info(f"Loading dimension table {self.table} in {self.mode} mode")
+        rows = load_table(redshift, self.table, self.sql_stmt, self.mode, self.primary_key, self.source_filters,
+                          self.order_by)
+        self.log.info(f"Dimension table {self.table}: {rows['inserted']} rows inserted, {rows['updated']} updated")
+        # the return value is pushed to XCom
+        return rows
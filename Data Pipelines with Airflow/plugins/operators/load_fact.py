@@ -1,27 +1,38 @@
 from airflow.hooks.postgres_hook import PostgresHook
 from airflow.models import BaseOperator
 from airflow.utils.decorators import apply_defaults
+from helpers.load_table import load_table
 
 class LoadFactOperator(BaseOperator):
 
     ui_color = '#F98866'
+    template_fields = ('sql_stmt', 'source_filters')
 
     @apply_defaults
     def __init__(self,
              redshift_conn_id="",
              table="",
              sql_stmt="",
+             mode="append",
+             primary_key=(),
+             source_filters=None,
+             order_by=(),
              *args, **kwargs):
 
         super(LoadFactOperator, self).__init__(*args, **kwargs)
         self.redshift_conn_id = redshift_conn_id
         self.table = table
         self.sql_stmt = sql_stmt
+        self.mode = mode
+        self.primary_key = primary_key
+        self.source_filters = source_filters or {}
+        self.order_by = order_by
 
     def execute(self, context):
         redshift = PostgresHook(postgres_conn_id=self.redshift_conn_id)
-        self.log.info(f'Load Fact table {self.table}')
-        sql = """INSERT INTO {}
-              {};
-             COMMIT;""".format(self.table, self.sql_stmt)
-        redshift.run(sql)
+        self.log.info(f'Load Fact table {self.table} in {self.mode} mode')
+        rows = load_table(redshift, self.table, self.sql_stmt, self.mode, self.primary_key, self.source_filters,
+                          self.order_by)
+        self.log.info(f"Fact table {self.table}: {rows['inserted']} rows inserted, {rows['updated']} updated")
+        # the return value is pushed to XCom
+        return rows
@@ -5,6 +5,8 @@ from airflow.contrib.hooks.aws_hook import AwsHook
 
 class StageToRedshiftOperator(BaseOperator):
     ui_color = '#358140'
+    # the key can pick the files of the run's interval, e.g. log_data/{{ execution_date.strftime('%Y/%m') }}/{{ ds }}-events.json
+    template_fields = ('s3_key',)
     
     copy_query = " COPY {} \
         FROM '{}' \
@@ -23,6 +25,7 @@ class StageToRedshiftOperator(BaseOperator):
              file_type="",
              delimiter=",",
              ignore_headers=1,
+             truncate=False,
              *args, **kwargs):
 
         super(StageToRedshiftOperator, self).__init__(*args, **kwargs)
@@ -35,6 +38,7 @@ class StageToRedshiftOperator(BaseOperator):
         self.file_type = file_type
         self.delimiter = delimiter
         self.ignore_headers = ignore_headers
+        self.truncate = truncate
         
         
     def execute(self, context):
@@ -44,16 +48,20 @@ class StageToRedshiftOperator(BaseOperator):
         s3_path = "s3://{}/{}".format(self.s3_bucket, self.s3_key)
         self.log.info(f"Picking staging file for table {self.table} from location : {s3_path}")
         
-        if self.log_json_file != "":
-            self.log_json_file = "s3://{}/{}".format(self.s3_bucket, self.log_json_file)
-            copy_query = self.copy_query.format(self.table, s3_path, credentials.access_key, credentials.secret_key, self.log_json_file)
-        else:
-            copy_query = self.copy_query.format(self.table, s3_path, credentials.access_key, credentials.secret_key, 'auto')
+        # 'auto' and full s3:// URLs are passed as they are, keys are taken as relative to the bucket
+        json_path = self.log_json_file or 'auto'
+        if json_path != 'auto' and not json_path.startswith("s3://"):
+            json_path = "s3://{}/{}".format(self.s3_bucket, json_path)
+        copy_query = self.copy_query.format(self.table, s3_path, credentials.access_key, credentials.secret_key, json_path)
         
         
         self.log.info(f"Running copy query : {copy_query}")
         redshift_hook = PostgresHook(postgres_conn_id = self.redshift_conn_id)
         
+        if self.truncate:
+            # staging holds only the files of this run, not every file copied before
+            self.log.info(f"Truncating staging table {self.table}")
+            redshift_hook.run("TRUNCATE TABLE {}".format(self.table))
         redshift_hook.run(copy_query)
         self.log.info(f"Table {self.table} staged successfully!!")
         
\ No newline at end of file
@@ -0,0 +1,278 @@
+import os
+import re
+import json
+import time
+import argparse
+import configparser
+from collections import namedtuple, Counter
+import psycopg2
+from sql_queries import create_table_queries
+
+Table = namedtuple("Table", ["name", "columns", "primary_key", "layout"])
+Layout = namedtuple("Layout", ["diststyle", "distkey", "sortstyle", "sortkey"])
+
+# join steps that keep rows where they are; every other DS_ label moves rows between slices
+LOCAL_JOINS = {"DS_DIST_NONE", "DS_DIST_ALL_NONE"}
+
+
+def split_columns(body):
+    """
+    Split the body of a CREATE TABLE on the commas between column definitions, not those inside
+    parentheses such as IDENTITY(0,1).
+    :return: list of column definitions.
+    """
+    columns, depth, current = [], 0, ""
+    for char in body:
+        depth += (char == "(") - (char == ")")
+        if char == "," and depth == 0:
+            columns.append(current.strip())
+            current = ""
+        else:
+            current += char
+    if current.strip():
+        columns.append(current.strip())
+    return columns
+
+
+def parse_ddl(query):
+    """
+    Read a CREATE TABLE of sql_queries with inline DISTKEY / SORTKEY column attributes.
+    :param query: CREATE TABLE statement.
+    :return: Table with the column definitions stripped of DISTKEY / SORTKEY and the current layout.
+    """
+    name = re.search(r"CREATE TABLE\s+(?:IF NOT EXISTS\s+)?(\w+)", query, re.IGNORECASE).group(1)
+    body = query[query.index("(") + 1:query.rindex(")")]
+    columns, primary_key, distkey, sortkey = [], None, None, []
+
+    for definition in split_columns(body):
+        column = definition.split()[0]
+        tokens = definition.upper().split()
+        if "PRIMARY" in tokens:
+            primary_key = column
+        if "DISTKEY" in tokens:
+            distkey = column
+        if "SORTKEY" in tokens:
+            sortkey.append(column)
+        columns.append((column, re.sub(r"\s+(DISTKEY|SORTKEY)\b", "", definition, flags=re.IGNORECASE)))
+
+    layout = Layout("KEY" if distkey else "AUTO", distkey, "COMPOUND", tuple(sortkey))
+    return Table(name, columns, primary_key, layout)
+
+
+def table_attributes(layout):
+    """
+    :return: Redshift table attributes of a layout, usable in CREATE TABLE and CREATE TABLE AS.
+    """
+    attributes = []
+    if layout.diststyle == "KEY":
+        attributes.append("DISTSTYLE KEY DISTKEY({})".format(layout.distkey))
+    elif layout.diststyle != "AUTO":
+        attributes.append("DISTSTYLE {}".format(layout.diststyle))
+    if layout.sortkey:
+        attributes.append("{} SORTKEY({})".format(layout.sortstyle, ", ".join(layout.sortkey)))
+    return " ".join(attributes)
+
+
+def create_table(table, layout):
+    """
+    :return: CREATE TABLE statement of the table with the given layout.
+    """
+    return "CREATE TABLE {}(\n    {}\n)\n{};".format(
+        table.name, ",\n    ".join(definition for _, definition in table.columns), table_attributes(layout))
+
+
+def read_workload(path):
+    """
+    :param path: SQL file of analytical queries separated by semicolons.
+    :return: list of queries.
+    """
+    with open(path) as f:
+        text = "\n".join(line for line in f.read().splitlines() if not line.strip().startswith("--"))
+    return [query.strip() for query in text.split(";") if query.strip()]
+
+
+def fact_joins(fact, dims, workload):
+    """
+    Columns of the fact table joined to a dimension's primary key in the workload.
+    :param fact: Table of the fact.
+    :param dims: list of dimension Tables.
+    :param workload: list of queries.
+    :return: dict of fact column to the dimension Table it joins.
+    """
+    fact_columns = {column for column, _ in fact.columns}
+    by_key = {dim.primary_key: dim for dim in dims if dim.primary_key}
+    joins = {}
+    for query in workload:
+        for left, right in re.findall(r"\w+\.(\w+)\s*=\s*\w+\.(\w+)", query):
+            for column, key in [(left, right), (right, left)]:
+                if column in fact_columns and key in by_key:
+                    joins[column] = by_key[key]
+    return joins
+
+
+def recommend(tables, rows, workload, small_rows):
+    """
+    Layout variants of the star schema.
+
+    - current: the layout of create_table_queries.
+    - recommended: dimensions of at most `small_rows` rows are copied to every node (DISTSTYLE ALL)
+      and sorted on their key; larger dimensions are distributed and sorted on their key, and the
+      fact is distributed on its join column to the largest of them so that join stays local.
+      The fact keeps its compound sort key.
+    - interleaved: recommended, with an interleaved sort key over the fact's sort and join columns,
+      for workloads filtering on any one of them.
+    :param tables: list of Tables of the final tables.
+    :param rows: dict of table to row count.
+    :param workload: list of queries.
+    :param small_rows: largest dimension copied to all nodes.
+    :return: dict of variant name to dict of table name to Layout.
+    """
+    fact = max(tables, key=lambda table: rows.get(table.name, 0))
+    dims = [table for table in tables if table is not fact]
+    joins = fact_joins(fact, dims, workload)
+
+    recommended = {}
+    for dim in dims:
+        sortkey = (dim.primary_key,) if dim.primary_key else dim.layout.sortkey
+        if rows.get(dim.name, 0) <= small_rows:
+            recommended[dim.name] = Layout("ALL", None, "COMPOUND", sortkey)
+        else:
+            recommended[dim.name] = Layout("KEY", dim.primary_key, "COMPOUND", sortkey)
+
+    distributed = [(rows.get(dim.name, 0), column) for column, dim in joins.items()
+                   if recommended[dim.name].diststyle == "KEY"]
+    if distributed:
+        recommended[fact.name] = fact.layout._replace(diststyle="KEY", distkey=max(distributed)[1])
+    else:
+        recommended[fact.name] = fact.layout
+
+    interleaved = dict(recommended)
+    sort_columns = list(fact.layout.sortkey) + [column for column in sorted(joins) if column not in fact.layout.sortkey]
+    interleaved[fact.name] = recommended[fact.name]._replace(sortstyle="INTERLEAVED", sortkey=tuple(sort_columns[:8]))
+
+    return {
+        "current": {table.name: table.layout for table in tables},
+        "recommended": recommended,
+        "interleaved": interleaved,
+    }
+
+
+def table_rows(cur, tables):
+    """
+    :return: dict of table to row count.
+    """
+    rows = {}
+    for table in tables:
+        cur.execute("SELECT COUNT(*) FROM public.{}".format(table.name))
+        rows[table.name] = cur.fetchone()[0]
+    return rows
+
+
+def explain(cur, query):
+    """
+    :return: EXPLAIN plan of the query and the count of each data movement (DS_*) label in it.
+    """
+    cur.execute("EXPLAIN " + query)
+    plan = "\n".join(row[0] for row in cur.fetchall())
+    return plan, Counter(re.findall(r"\bDS_[A-Z_]+\b", plan))
+
+
+def timed(cur, query, repeats):
+    """
+    :return: best wall time in seconds over `repeats` runs, after one run to compile the query.
+    """
+    cur.execute(query)
+    cur.fetchall()
+    best = None
+    for _ in range(repeats):
+        start = time.perf_counter()
+        cur.execute(query)
+        cur.fetchall()
+        elapsed = time.perf_counter() - start
+        best = elapsed if best is None else min(best, elapsed)
+    return best
+
+
+def run_variant(cur, conn, name, tables, layouts, workload, repeats, keep=False):
+    """
+    Copy the final tables into schema advisor_<name> with the variant's layout and run the workload
+    against the copies.
+    :return: list of per-query dicts with the data movement labels and the best time.
+    """
+    schema = "advisor_" + name
+    cur.execute("DROP SCHEMA IF EXISTS {} CASCADE".format(schema))
+    cur.execute("CREATE SCHEMA {}".format(schema))
+    for table in tables:
+        cur.execute("CREATE TABLE {}.{} {} AS SELECT * FROM public.{}".format(
+            schema, table.name, table_attributes(layouts[table.name]), table.name))
+        cur.execute("ANALYZE {}.{}".format(schema, table.name))
+    conn.commit()
+
+    cur.execute("SET search_path TO {}".format(schema))
+    cur.execute("SET enable_result_cache_for_session TO off")
+    results = []
+    for number, query in enumerate(workload):
+        _, movements = explain(cur, query)
+        results.append({
+            "query": number,
+            "data_movement": dict(movements),
+            "redistributions": sum(count for label, count in movements.items() if label not in LOCAL_JOINS),
+            "seconds": round(timed(cur, query, repeats), 3),
+        })
+    cur.execute("RESET search_path")
+
+    if not keep:
+        cur.execute("DROP SCHEMA {} CASCADE".format(schema))
+    conn.commit()
+    return results
+
+
+def main():
+    """
+    Recommend distribution and sort keys for the star schema and time the workload on each variant.
+    """
+    parser = argparse.ArgumentParser(description="Distribution and sort key advisor for the Sparkify star schema.")
+    parser.add_argument("--workload", default="workload.sql", help="SQL file of analytical queries")
+    parser.add_argument("--small-rows", type=int, default=5000000,
+                        help="dimensions with at most this many rows are recommended DISTSTYLE ALL")
+    parser.add_argument("--repeats", type=int, default=3, help="timed runs per query, the best is reported")
+    parser.add_argument("--ddl-dir", default="ddl", help="directory to write each variant's CREATE TABLEs to")
+    parser.add_argument("--output", default="advisor_report.json", help="report of plans and timings")
+    parser.add_argument("--keep", action="store_true", help="keep the advisor_<variant> schemas")
+    args = parser.parse_args()
+
+    config = configparser.ConfigParser()
+    config.read('dwh.cfg')
+
+    conn = psycopg2.connect("host={} dbname={} user={} password={} port={}".format(*config['CLUSTER'].values()))
+    cur = conn.cursor()
+
+    tables = [table for table in map(parse_ddl, create_table_queries) if not table.name.startswith("staging_")]
+    workload = read_workload(args.workload)
+    rows = table_rows(cur, tables)
+    variants = recommend(tables, rows, workload, args.small_rows)
+
+    os.makedirs(args.ddl_dir, exist_ok=True)
+    report = {"rows": rows, "variants": {}}
+    for name, layouts in variants.items():
+        with open(os.path.join(args.ddl_dir, name + ".sql"), "w") as f:
+            f.write("\n\n".join(create_table(table, layouts[table.name]) for table in tables) + "\n")
+
+        results = run_variant(cur, conn, name, tables, layouts, workload, args.repeats, args.keep)
+        report["variants"][name] = {
+            "layouts": {table: layout._asdict() for table, layout in layouts.items()},
+            "total_seconds": round(sum(result["seconds"] for result in results), 3),
+            "redistributions": sum(result["redistributions"] for result in results),
+            "queries": results,
+        }
+        print("{:<12} {:>8.3f}s  {} redistribution steps".format(
+            name, report["variants"][name]["total_seconds"], report["variants"][name]["redistributions"]))
+
+    with open(args.output, "w") as f:
+        json.dump(report, f, indent=2)
+
+    conn.close()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,36 @@
+import os
+import sys
+import argparse
+import configparser
+import psycopg2
+from sql_queries import create_table_queries, create_rollup_queries
+
+sys.path.append(os.path.join(os.path.dirname(os.path.abspath(__file__)), os.pardir))
+from common.compression import add_arguments, run
+
+
+def main():
+    """
+    Pick a compression encoding for every column of the staging, final and rollup tables and write the
+    encoded CREATE TABLEs.
+    """
+    parser = argparse.ArgumentParser(description="Compression encodings for the Sparkify Redshift tables.")
+    add_arguments(parser)
+    parser.set_defaults(workload="workload.sql")
+    args = parser.parse_args()
+
+    config = configparser.ConfigParser()
+    config.read('dwh.cfg')
+
+    conn = psycopg2.connect("host={} dbname={} user={} password={} port={}".format(*config['CLUSTER'].values()))
+    # ANALYZE COMPRESSION cannot run inside a transaction block
+    conn.autocommit = True
+    cur = conn.cursor()
+
+    run(args, cur, create_table_queries + create_rollup_queries)
+
+    conn.close()
+
+
+if __name__ == "__main__":
+    main()
@@ -1,6 +1,12 @@
+import os
+import sys
+import argparse
 import configparser
 import psycopg2
-from sql_queries import create_table_queries, drop_table_queries
+from sql_queries import create_table_queries, drop_table_queries, create_rollup_queries, drop_rollup_queries
+
+sys.path.append(os.path.join(os.path.dirname(os.path.abspath(__file__)), os.pardir))
+from common.compression import apply_encodings, read_encodings
 
 
 def drop_tables(cur, conn):
@@ -9,19 +15,20 @@ def drop_tables(cur, conn):
     :param cur: cursor of query.
     :param conn: connection of database.
     """
-    for query in drop_table_queries:
+    for query in drop_table_queries + drop_rollup_queries:
         cur.execute(query)
         conn.commit()
 
 
-def create_tables(cur, conn):
+def create_tables(cur, conn, encodings=None):
     """
     Create nessecary tables.
     :param cur: cursor of query.
     :param conn: connection of database.
+    :param encodings: dict of table to dict of column to compression encoding to declare.
     """
-    for query in create_table_queries:
-        cur.execute(query)
+    for query in create_table_queries + create_rollup_queries:
+        cur.execute(apply_encodings(query, encodings or {}))
         conn.commit()
 
 
@@ -29,6 +36,10 @@ def main():
     """
     Main functions drop and create tables.
     """
+    parser = argparse.ArgumentParser(description="Drop and create the Sparkify staging, final and rollup tables.")
+    parser.add_argument("--encodings", help="report of compression_advisor.py whose column encodings are declared")
+    args = parser.parse_args()
+
     config = configparser.ConfigParser()
     config.read('dwh.cfg')
 
@@ -36,7 +47,7 @@ def main():
     cur = conn.cursor()
 
     drop_tables(cur, conn)
-    create_tables(cur, conn)
+    create_tables(cur, conn, read_encodings(args.encodings) if args.encodings else None)
 
     conn.close()
 
@@ -1,42 +1,159 @@
+import os
+import sys
+import argparse
 import configparser
+from datetime import datetime, timezone
 import psycopg2
-from sql_queries import copy_table_queries, insert_table_queries
+from psycopg2.pool import ThreadedConnectionPool
+import sql_queries
+from sql_queries import (copy_table_queries, insert_table_queries, merge_table_queries, staging_truncate_queries,
+                         rollup_days_create, rollup_days_all_create, rollup_days_drop, rollup_refresh_queries,
+                         rollup_tables_count, create_rollup_queries,
+                         last_copy_count, table_dependencies)
+from staging import load_staging_manifests, summarize
 
+sys.path.append(os.path.join(os.path.dirname(os.path.abspath(__file__)), os.pardir))
+from common.instrument import StatementRecorder, statement_names, execute
+from common.scheduler import declared_statements, run_statements
 
-def load_staging_tables(cur, conn):
+
+def load_staging_tables(cur, conn, recorder=None):
     """
     Copy raw data into the staging tables.
     :param cur: cursor of query.
     :param conn: connection of database.
+    :param recorder: StatementRecorder timing each statement, if any.
     """
     for query in copy_table_queries:
-        cur.execute(query)
+        execute(cur, query, recorder)
         conn.commit()
 
 
-def insert_tables(cur, conn):
+def run_declared(cur, conn, queries, recorder=None, pool=None, max_parallel=1):
+    """
+    Run load statements in the order their read and write tables declared in table_dependencies require.
+    :param cur: cursor of query.
+    :param conn: connection of database.
+    :param queries: list of statements declared in table_dependencies.
+    :param recorder: StatementRecorder timing each statement, if any.
+    :param pool: ThreadedConnectionPool of at least `max_parallel` connections.
+    :param max_parallel: most statements running at once.
+    """
+    statements = declared_statements(queries, table_dependencies, statement_names(sql_queries))
+    run_statements(cur, conn, statements, recorder, pool, max_parallel)
+
+
+def insert_tables(cur, conn, recorder=None, pool=None, max_parallel=1):
     """
     Insert staging data into final table.
     :param cur: cursor of query.
     :param conn: connection of database.
+    :param recorder: StatementRecorder timing each statement, if any.
+    :param pool: ThreadedConnectionPool to run independent inserts concurrently on.
+    :param max_parallel: most inserts running at once.
     """
-    for query in insert_table_queries:
-        cur.execute(query)
+    run_declared(cur, conn, insert_table_queries, recorder, pool, max_parallel)
+
+
+def truncate_staging_tables(cur, conn, recorder=None):
+    """
+    Empty the staging tables, so they hold only the batch about to be loaded.
+    :param cur: cursor of query.
+    :param conn: connection of database.
+    :param recorder: StatementRecorder timing each statement, if any.
+    """
+    for query in staging_truncate_queries:
+        execute(cur, query, recorder)
         conn.commit()
 
 
+def merge_tables(cur, conn, recorder=None, pool=None, max_parallel=1):
+    """
+    Merge the staging batch into the final tables: per table, the rows whose keys are in the batch
+    are deleted and the batch inserted, in one transaction per table.
+    :param cur: cursor of query.
+    :param conn: connection of database.
+    :param recorder: StatementRecorder timing each statement, if any.
+    :param pool: ThreadedConnectionPool to run independent merges concurrently on.
+    :param max_parallel: most merges running at once.
+    """
+    run_declared(cur, conn, merge_table_queries, recorder, pool, max_parallel)
+
+
+def refresh_rollups(cur, conn, rebuild=False, recorder=None):
+    """
+    Recompute the rollup tables for the days of the plays in staging_events only, in one transaction.
+    Rollup tables missing on clusters created before them are created and filled for every day.
+    :param cur: cursor of query.
+    :param conn: connection of database.
+    :param rebuild: recompute every day of songplays instead.
+    :param recorder: StatementRecorder timing each statement, if any.
+    """
+    cur.execute(rollup_tables_count)
+    if cur.fetchone()[0] < len(create_rollup_queries):
+        for query in create_rollup_queries:
+            execute(cur, query, recorder)
+        rebuild = True
+    execute(cur, rollup_days_all_create if rebuild else rollup_days_create, recorder)
+    for query in rollup_refresh_queries:
+        execute(cur, query, recorder)
+    execute(cur, rollup_days_drop, recorder)
+    conn.commit()
+
+
 def main():
     """
     Main function performing ETL functions.
     """
+    parser = argparse.ArgumentParser(description="Load the Sparkify staging tables and the star schema.")
+    parser.add_argument("--manifest-batch-size", type=int, default=0,
+                        help="COPY the staging tables concurrently in batches of this many files listed in "
+                             "manifests under S3.MANIFEST_PREFIX; 0 runs the wildcard COPYs one after the other")
+    parser.add_argument("--merge", action="store_true",
+                        help="truncate the staging tables before loading and merge the batch into the final tables "
+                             "on their keys instead of appending")
+    parser.add_argument("--skip-rollups", action="store_true", help="do not refresh the rollup tables")
+    parser.add_argument("--rebuild-rollups", action="store_true",
+                        help="recompute the rollups for every day of songplays, not only the days loaded")
+    parser.add_argument("--explain", action="store_true", help="record the EXPLAIN plan of every explainable statement")
+    parser.add_argument("--stats-log", default="etl_run_stats.json",
+                        help="JSON lines log the statement timings of the run are appended to")
+    parser.add_argument("--max-parallel", type=int, default=1,
+                        help="run up to this many independent inserts or merges at once, each on its own connection; "
+                             "keep it within the WLM queue's slots")
+    args = parser.parse_args()
+
     config = configparser.ConfigParser()
     config.read('dwh.cfg')
 
-    conn = psycopg2.connect("host={} dbname={} user={} password={} port={}".format(*config['CLUSTER'].values()))
+    dsn = "host={} dbname={} user={} password={} port={}".format(*config['CLUSTER'].values())
+    conn = psycopg2.connect(dsn)
     cur = conn.cursor()
-    
-    load_staging_tables(cur, conn)
-    insert_tables(cur, conn)
+    pool = ThreadedConnectionPool(1, args.max_parallel, dsn) if args.max_parallel > 1 else None
+    recorder = StatementRecorder("warehouse", statement_names(sql_queries), args.explain, last_copy_count)
+
+    try:
+        if args.merge:
+            truncate_staging_tables(cur, conn, recorder)
+        if args.manifest_batch_size:
+            started_at = datetime.now(timezone.utc)
+            stats = load_staging_manifests(config, args.manifest_batch_size)
+            for stat in stats:
+                recorder.record("{}_copy_manifest[{}]".format(stat["table"], stat["batch"]), started_at,
+                                stat["seconds"], stat["rows"])
+            print(summarize(stats))
+        else:
+            load_staging_tables(cur, conn, recorder)
+        if args.merge:
+            merge_tables(cur, conn, recorder, pool, args.max_parallel)
+        else:
+            insert_tables(cur, conn, recorder, pool, args.max_parallel)
+        if not args.skip_rollups:
+            refresh_rollups(cur, conn, args.rebuild_rollups, recorder)
+    finally:
+        recorder.flush(cur, conn, args.stats_log)
+        if pool is not None:
+            pool.closeall()
 
     conn.close()
 
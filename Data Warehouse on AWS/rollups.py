@@ -0,0 +1,143 @@
+import json
+import argparse
+import configparser
+from collections import namedtuple
+import psycopg2
+
+# dimensions: name to column expression; measures: name to (expression, dimensions the query must group by
+# for the expression to be exact). Distinct counts stored per hour cannot be summed across hours.
+Source = namedtuple("Source", ["table", "dimensions", "measures"])
+
+ROLLUPS = [
+    Source("songplays_hourly",
+           {"hour": "hour", "day": "day"},
+           {"plays": ("SUM(plays)", set()),
+            "paid_plays": ("SUM(paid_plays)", set()),
+            "active_users": ("SUM(active_users)", {"hour"}),
+            "active_paid_users": ("SUM(active_paid_users)", {"hour"})}),
+    Source("songplays_daily",
+           {"day": "day", "level": "level", "user_id": "user_id", "song_id": "song_id", "artist_id": "artist_id"},
+           {"plays": ("SUM(plays)", set()),
+            "paid_plays": ("SUM(CASE WHEN level = 'paid' THEN plays ELSE 0 END)", set()),
+            "active_users": ("COUNT(DISTINCT user_id)", set()),
+            "active_paid_users": ("COUNT(DISTINCT CASE WHEN level = 'paid' THEN user_id END)", set())}),
+]
+
+BASE = Source("songplays",
+              {"hour": "DATE_TRUNC('hour', start_time)", "day": "CAST(start_time AS DATE)", "level": "level",
+               "user_id": "user_id", "song_id": "song_id", "artist_id": "artist_id"},
+              {"plays": ("COUNT(*)", set()),
+               "paid_plays": ("SUM(CASE WHEN level = 'paid' THEN 1 ELSE 0 END)", set()),
+               "active_users": ("COUNT(DISTINCT user_id)", set()),
+               "active_paid_users": ("COUNT(DISTINCT CASE WHEN level = 'paid' THEN user_id END)", set())})
+
+
+def eligible(source, metrics, group_by, filters):
+    """
+    :return: whether the source has every dimension grouped or filtered on and can compute every metric
+        exactly at that grouping.
+    """
+    if not set(group_by) | set(filters) <= set(source.dimensions):
+        return False
+    return all(metric in source.measures and source.measures[metric][1] <= set(group_by) for metric in metrics)
+
+
+def route(metrics, group_by=(), filters=None):
+    """
+    Pick the smallest source able to answer a dashboard query: a rollup when eligible, songplays otherwise.
+    :param metrics: names of the measures, e.g. ["plays", "active_users"].
+    :param group_by: names of the dimensions, e.g. ["day", "level"].
+    :param filters: dict of dimension to the value it must equal.
+    :return: Source.
+    """
+    filters = filters or {}
+    for source in ROLLUPS:
+        if eligible(source, metrics, group_by, filters):
+            return source
+    if not eligible(BASE, metrics, group_by, filters):
+        raise ValueError("unsupported metrics {} or dimensions {}".format(metrics, list(group_by) + list(filters)))
+    return BASE
+
+
+def build_query(metrics, group_by=(), start=None, end=None, filters=None):
+    """
+    Dashboard query over whole days, which rollups and songplays answer alike.
+    :param metrics: names of the measures.
+    :param group_by: names of the dimensions.
+    :param start: first day included, as a date or 'YYYY-MM-DD'.
+    :param end: first day excluded.
+    :param filters: dict of dimension to the value it must equal.
+    :return: (table, SQL, parameters).
+    """
+    filters = filters or {}
+    source = route(metrics, group_by, filters)
+    # songplays is filtered on its sort key rather than the day derived from it
+    day = "start_time" if source is BASE else source.dimensions["day"]
+
+    columns = ["{} AS {}".format(source.dimensions[name], name) for name in group_by]
+    columns += ["{} AS {}".format(source.measures[metric][0], metric) for metric in metrics]
+    conditions, params = [], []
+    if start is not None:
+        conditions.append("{} >= %s".format(day))
+        params.append(start)
+    if end is not None:
+        conditions.append("{} < %s".format(day))
+        params.append(end)
+    for name, value in sorted(filters.items()):
+        conditions.append("{} = %s".format(source.dimensions[name]))
+        params.append(value)
+
+    sql = "SELECT {} FROM {}".format(", ".join(columns), source.table)
+    if conditions:
+        sql += " WHERE " + " AND ".join(conditions)
+    if group_by:
+        positions = ", ".join(str(number + 1) for number in range(len(group_by)))
+        sql += " GROUP BY {} ORDER BY {}".format(positions, positions)
+    return source.table, sql, params
+
+
+def dashboard_query(cur, metrics, group_by=(), start=None, end=None, filters=None):
+    """
+    Run a dashboard query on the source route picks.
+    :param cur: cursor of query.
+    :return: (table queried, list of rows).
+    """
+    table, sql, params = build_query(metrics, group_by, start, end, filters)
+    cur.execute(sql, params)
+    return table, cur.fetchall()
+
+
+def main():
+    """
+    Answer a dashboard query from the rollups when possible, printing the table used and the rows.
+    """
+    parser = argparse.ArgumentParser(description="Query Sparkify play metrics, from the rollups when possible.")
+    parser.add_argument("metrics", nargs="+", choices=sorted(BASE.measures), help="measures to compute")
+    parser.add_argument("--group-by", nargs="*", default=[], choices=sorted(BASE.dimensions),
+                        help="dimensions to group by")
+    parser.add_argument("--start", help="first day included, YYYY-MM-DD")
+    parser.add_argument("--end", help="first day excluded, YYYY-MM-DD")
+    parser.add_argument("--level", help="only plays at this subscription level")
+    parser.add_argument("--sql", action="store_true", help="print the query instead of running it")
+    args = parser.parse_args()
+
+    filters = {"level": args.level} if args.level else {}
+    if args.sql:
+        table, sql, params = build_query(args.metrics, args.group_by, args.start, args.end, filters)
+        print(json.dumps({"table": table, "sql": sql, "params": params}, indent=2))
+        return
+
+    config = configparser.ConfigParser()
+    config.read('dwh.cfg')
+
+    conn = psycopg2.connect("host={} dbname={} user={} password={} port={}".format(*config['CLUSTER'].values()))
+    cur = conn.cursor()
+    table, rows = dashboard_query(cur, args.metrics, args.group_by, args.start, args.end, filters)
+    print("source: " + table)
+    for row in rows:
+        print("\t".join(str(value) for value in row))
+    conn.close()
+
+
+if __name__ == "__main__":
+    main()
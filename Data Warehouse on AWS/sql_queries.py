@@ -1,4 +1,9 @@
 import configparser
+import os
+import sys
+
+sys.path.append(os.path.join(os.path.dirname(os.path.abspath(__file__)), os.pardir))
+from common.time_dimension import sql_time_columns
 
 
 # CONFIG
@@ -134,6 +139,40 @@ staging_songs_copy = ("""
     TRUNCATECOLUMNS BLANKSASNULL EMPTYASNULL;
 """).format(SONG_DATA, IAM_ROLE)
 
+# the same COPYs over a manifest listing one batch of files; {manifest} is the manifest's S3 URL
+
+staging_events_copy_manifest = ("""
+    COPY staging_events FROM '{{manifest}}'
+    CREDENTIALS 'aws_iam_role={}'
+    COMPUPDATE OFF region 'us-west-2'
+    TIMEFORMAT as 'epochmillisecs'
+    TRUNCATECOLUMNS BLANKSASNULL EMPTYASNULL
+    FORMAT AS JSON {}
+    MANIFEST;
+""").format(IAM_ROLE, LOG_PATH)
+
+staging_songs_copy_manifest = ("""
+    COPY staging_songs FROM '{{manifest}}'
+    CREDENTIALS 'aws_iam_role={}'
+    COMPUPDATE OFF region 'us-west-2'
+    FORMAT AS JSON 'auto'
+    TRUNCATECOLUMNS BLANKSASNULL EMPTYASNULL
+    MANIFEST;
+""").format(IAM_ROLE)
+
+last_copy_count = "SELECT pg_last_copy_count()"
+
+# local Postgres stand-in: CSV converted from the JSON files, streamed with COPY FROM STDIN
+
+staging_events_columns = ["artist", "auth", "firstName", "gender", "itemInSession", "lastName", "length", "level",
+                          "location", "method", "page", "registration", "sessionId", "song", "status", "ts",
+                          "userAgent", "userId"]
+staging_songs_columns = ["num_songs", "artist_id", "artist_latitude", "artist_longitude", "artist_location",
+                         "artist_name", "song_id", "title", "duration", "year"]
+
+staging_events_copy_local = "COPY staging_events ({}) FROM STDIN WITH CSV".format(", ".join(staging_events_columns))
+staging_songs_copy_local = "COPY staging_songs ({}) FROM STDIN WITH CSV".format(", ".join(staging_songs_columns))
+
 # FINAL TABLES
 
 songplay_table_insert = ("""
@@ -185,20 +224,259 @@ where artist_id IS NOT NULL;
 
 time_table_insert = ("""
 INSERT INTO time(start_time, hour, day, week, month, year, weekday)
-SELECT distinct ts,
-                EXTRACT(hour from ts),
-                EXTRACT(day from ts),
-                EXTRACT(week from ts),
-                EXTRACT(month from ts),
-                EXTRACT(year from ts),
-                EXTRACT(weekday from ts)
+SELECT DISTINCT {}
+FROM staging_events
+WHERE ts IS NOT NULL AND page = 'NextSong';
+""").format(sql_time_columns("ts"))
+
+# MERGE TABLES
+# staging-table pattern: the batch is shaped into a temp table with one row per key, rows with those
+# keys are deleted from the target and the batch inserted. Each merge is a tuple of single statements
+# run in order in one transaction, so every statement is timed and counted on its own.
+
+staging_events_truncate = "TRUNCATE staging_events"
+staging_songs_truncate = "TRUNCATE staging_songs"
+
+songplay_batch_create = ("""
+CREATE TEMP TABLE songplays_batch AS
+SELECT start_time, user_id, level, song_id, artist_id, session_id, location, user_agent
+FROM (
+    SELECT *,
+           ROW_NUMBER() OVER (PARTITION BY start_time, user_id, session_id
+                              ORDER BY duration_match, song_id, artist_id) AS match_rank
+    FROM (
+        SELECT to_timestamp(to_char(se.ts, '9999-99-99 99:99:99'),'YYYY-MM-DD HH24:MI:SS') AS start_time,
+               se.userId as user_id,
+               se.level as level,
+               ss.song_id as song_id,
+               ss.artist_id as artist_id,
+               se.sessionId as session_id,
+               se.location as location,
+               se.userAgent as user_agent,
+               CASE WHEN ss.duration = se.length THEN 0 ELSE 1 END AS duration_match
+        FROM staging_events se
+        JOIN staging_songs ss ON se.song = ss.title AND se.artist = ss.artist_name
+    ) matches
+) ranked
+-- one row per key: an event matching several songs keeps the one of the same duration, then the lowest ids
+WHERE match_rank = 1;
+""")
+
+songplay_merge_delete = ("""
+DELETE FROM songplays USING songplays_batch
+WHERE songplays.start_time = songplays_batch.start_time
+  AND songplays.user_id = songplays_batch.user_id
+  AND songplays.session_id = songplays_batch.session_id;
+""")
+
+songplay_merge_insert = ("""
+INSERT INTO songplays(start_time, user_id, level, song_id, artist_id, session_id, location, user_agent)
+SELECT start_time, user_id, level, song_id, artist_id, session_id, location, user_agent FROM songplays_batch;
+""")
+
+songplay_batch_drop = "DROP TABLE songplays_batch"
+
+songplay_table_merge = (songplay_batch_create, songplay_merge_delete, songplay_merge_insert, songplay_batch_drop)
+
+user_batch_create = ("""
+CREATE TEMP TABLE users_batch AS
+SELECT user_id, first_name, last_name, gender, level
+FROM (SELECT userId as user_id,
+             firstName as first_name,
+             lastName as last_name,
+             gender as gender,
+             level as level,
+             ROW_NUMBER() OVER (PARTITION BY userId ORDER BY ts DESC) AS recency
+      FROM staging_events
+      WHERE userId IS NOT NULL) latest
+WHERE recency = 1;
+""")
+
+user_merge_delete = ("""
+DELETE FROM users USING users_batch WHERE users.user_id = users_batch.user_id;
+""")
+
+user_merge_insert = ("""
+INSERT INTO users(user_id, first_name, last_name, gender, level)
+SELECT user_id, first_name, last_name, gender, level FROM users_batch;
+""")
+
+user_batch_drop = "DROP TABLE users_batch"
+
+user_table_merge = (user_batch_create, user_merge_delete, user_merge_insert, user_batch_drop)
+
+song_batch_create = ("""
+CREATE TEMP TABLE songs_batch AS
+SELECT song_id, title, artist_id, year, duration
+FROM (SELECT song_id, title, artist_id, year, duration,
+             ROW_NUMBER() OVER (PARTITION BY song_id ORDER BY title) AS pick
+      FROM staging_songs
+      WHERE song_id IS NOT NULL) unique_songs
+WHERE pick = 1;
+""")
+
+song_merge_delete = ("""
+DELETE FROM songs USING songs_batch WHERE songs.song_id = songs_batch.song_id;
+""")
+
+song_merge_insert = ("""
+INSERT INTO songs(song_id, title, artist_id, year, duration)
+SELECT song_id, title, artist_id, year, duration FROM songs_batch;
+""")
+
+song_batch_drop = "DROP TABLE songs_batch"
+
+song_table_merge = (song_batch_create, song_merge_delete, song_merge_insert, song_batch_drop)
+
+artist_batch_create = ("""
+CREATE TEMP TABLE artists_batch AS
+SELECT artist_id, name, location, latitude, longitude
+FROM (SELECT artist_id as artist_id,
+             artist_name as name,
+             artist_location as location,
+             artist_latitude as latitude,
+             artist_longitude as longitude,
+             ROW_NUMBER() OVER (PARTITION BY artist_id ORDER BY artist_name) AS pick
+      FROM staging_songs
+      WHERE artist_id IS NOT NULL) unique_artists
+WHERE pick = 1;
+""")
+
+artist_merge_delete = ("""
+DELETE FROM artists USING artists_batch WHERE artists.artist_id = artists_batch.artist_id;
+""")
+
+artist_merge_insert = ("""
+INSERT INTO artists(artist_id, name, location, latitude, longitude)
+SELECT artist_id, name, location, latitude, longitude FROM artists_batch;
+""")
+
+artist_batch_drop = "DROP TABLE artists_batch"
+
+artist_table_merge = (artist_batch_create, artist_merge_delete, artist_merge_insert, artist_batch_drop)
+
+time_batch_create = ("""
+CREATE TEMP TABLE time_batch (start_time, hour, day, week, month, year, weekday) AS
+SELECT DISTINCT {}
+FROM staging_events
+WHERE ts IS NOT NULL AND page = 'NextSong';
+""").format(sql_time_columns("ts"))
+
+time_merge_delete = ("""
+DELETE FROM time USING time_batch WHERE time.start_time = time_batch.start_time;
+""")
+
+time_merge_insert = ("""
+INSERT INTO time(start_time, hour, day, week, month, year, weekday)
+SELECT start_time, hour, day, week, month, year, weekday FROM time_batch;
+""")
+
+time_batch_drop = "DROP TABLE time_batch"
+
+time_table_merge = (time_batch_create, time_merge_delete, time_merge_insert, time_batch_drop)
+
+# ROLLUP TABLES
+# aggregates of songplays kept per day; a load recomputes only the days present in staging_events
+
+songplays_daily_table_drop = "DROP TABLE IF EXISTS songplays_daily"
+songplays_hourly_table_drop = "DROP TABLE IF EXISTS songplays_hourly"
+
+songplays_daily_table_create = ("""
+CREATE TABLE IF NOT EXISTS songplays_daily(
+    day                DATE       NOT NULL SORTKEY,
+    level              VARCHAR,
+    user_id            INTEGER    NOT NULL,
+    song_id            VARCHAR    NOT NULL DISTKEY,
+    artist_id          VARCHAR    NOT NULL,
+    plays              BIGINT     NOT NULL
+)
+""")
+
+songplays_hourly_table_create = ("""
+CREATE TABLE IF NOT EXISTS songplays_hourly(
+    hour               TIMESTAMP  NOT NULL SORTKEY,
+    day                DATE       NOT NULL,
+    plays              BIGINT     NOT NULL,
+    paid_plays         BIGINT     NOT NULL,
+    active_users       BIGINT     NOT NULL,
+    active_paid_users  BIGINT     NOT NULL
+)
+DISTSTYLE ALL
+""")
+
+rollup_tables_count = ("""
+SELECT COUNT(*) FROM pg_tables
+WHERE schemaname = 'public' AND tablename IN ('songplays_daily', 'songplays_hourly');
+""")
+
+rollup_days_create = ("""
+CREATE TEMP TABLE rollup_days AS
+SELECT DISTINCT CAST(ts AS DATE) AS day
 FROM staging_events
-WHERE ts IS NOT NULL;
+WHERE ts IS NOT NULL AND page = 'NextSong';
+""")
+
+rollup_days_all_create = ("""
+CREATE TEMP TABLE rollup_days AS
+SELECT DISTINCT CAST(start_time AS DATE) AS day
+FROM songplays;
 """)
 
+songplays_daily_delete = ("""
+DELETE FROM songplays_daily USING rollup_days WHERE songplays_daily.day = rollup_days.day;
+""")
+
+songplays_daily_refresh = ("""
+INSERT INTO songplays_daily(day, level, user_id, song_id, artist_id, plays)
+SELECT CAST(sp.start_time AS DATE), sp.level, sp.user_id, sp.song_id, sp.artist_id, COUNT(*)
+FROM songplays sp
+JOIN rollup_days rd ON CAST(sp.start_time AS DATE) = rd.day
+GROUP BY CAST(sp.start_time AS DATE), sp.level, sp.user_id, sp.song_id, sp.artist_id;
+""")
+
+songplays_hourly_delete = ("""
+DELETE FROM songplays_hourly USING rollup_days WHERE songplays_hourly.day = rollup_days.day;
+""")
+
+songplays_hourly_refresh = ("""
+INSERT INTO songplays_hourly(hour, day, plays, paid_plays, active_users, active_paid_users)
+SELECT DATE_TRUNC('hour', sp.start_time),
+       CAST(sp.start_time AS DATE),
+       COUNT(*),
+       SUM(CASE WHEN sp.level = 'paid' THEN 1 ELSE 0 END),
+       COUNT(DISTINCT sp.user_id),
+       COUNT(DISTINCT CASE WHEN sp.level = 'paid' THEN sp.user_id END)
+FROM songplays sp
+JOIN rollup_days rd ON CAST(sp.start_time AS DATE) = rd.day
+GROUP BY DATE_TRUNC('hour', sp.start_time), CAST(sp.start_time AS DATE);
+""")
+
+rollup_days_drop = "DROP TABLE rollup_days"
+
 # QUERY LISTS
 
 create_table_queries = [staging_events_table_create, staging_songs_table_create, songplay_table_create, user_table_create, song_table_create, artist_table_create, time_table_create]
 drop_table_queries = [staging_events_table_drop, staging_songs_table_drop, songplay_table_drop, user_table_drop, song_table_drop, artist_table_drop, time_table_drop]
 copy_table_queries = [staging_events_copy, staging_songs_copy]
 insert_table_queries = [songplay_table_insert, user_table_insert, song_table_insert, artist_table_insert, time_table_insert]
+staging_truncate_queries = [staging_events_truncate, staging_songs_truncate]
+merge_table_queries = [songplay_table_merge, user_table_merge, song_table_merge, artist_table_merge, time_table_merge]
+create_rollup_queries = [songplays_daily_table_create, songplays_hourly_table_create]
+drop_rollup_queries = [songplays_daily_table_drop, songplays_hourly_table_drop]
+rollup_refresh_queries = [songplays_daily_delete, songplays_daily_refresh, songplays_hourly_delete, songplays_hourly_refresh]
+
+# TABLES EACH LOAD STATEMENT READS AND WRITES, FOR THE PARALLEL SCHEDULER
+# the final tables are built from staging only, so their inserts and merges do not wait for each other
+
+table_dependencies = {
+    songplay_table_insert: (["staging_events", "staging_songs"], ["songplays"]),
+    user_table_insert: (["staging_events"], ["users"]),
+    song_table_insert: (["staging_songs"], ["songs"]),
+    artist_table_insert: (["staging_songs"], ["artists"]),
+    time_table_insert: (["staging_events"], ["time"]),
+    songplay_table_merge: (["staging_events", "staging_songs"], ["songplays"]),
+    user_table_merge: (["staging_events"], ["users"]),
+    song_table_merge: (["staging_songs"], ["songs"]),
+    artist_table_merge: (["staging_songs"], ["artists"]),
+    time_table_merge: (["staging_events"], ["time"]),
+}
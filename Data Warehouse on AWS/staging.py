@@ -0,0 +1,250 @@
+import io
+import os
+import csv
+import glob
+import json
+import time
+import argparse
+import configparser
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime, timezone
+import psycopg2
+from sql_queries import (LOG_DATA, SONG_DATA, staging_events_copy_manifest, staging_songs_copy_manifest,
+                         last_copy_count, staging_events_columns, staging_songs_columns,
+                         staging_events_copy_local, staging_songs_copy_local)
+
+
+def connect(config):
+    """
+    Open a connection to the cluster of dwh.cfg.
+    :param config: ConfigParser of dwh.cfg.
+    :return: psycopg2 connection.
+    """
+    return psycopg2.connect("host={} dbname={} user={} password={} port={}".format(*config['CLUSTER'].values()))
+
+
+def batches(items, size):
+    """
+    :return: list of consecutive slices of at most `size` items.
+    """
+    return [items[i:i + size] for i in range(0, len(items), size)]
+
+
+def split_s3_url(url):
+    """
+    :param url: s3://bucket/prefix, optionally quoted as in dwh.cfg.
+    :return: (bucket, prefix).
+    """
+    bucket, _, prefix = url.strip("'\"")[len("s3://"):].partition("/")
+    return bucket, prefix
+
+
+def list_s3_files(s3, url):
+    """
+    :param s3: boto3 S3 client.
+    :param url: s3://bucket/prefix of the input files.
+    :return: sorted list of s3:// URLs of the JSON files under the prefix.
+    """
+    bucket, prefix = split_s3_url(url)
+    urls = []
+    for page in s3.get_paginator("list_objects_v2").paginate(Bucket=bucket, Prefix=prefix):
+        urls.extend("s3://{}/{}".format(bucket, item["Key"]) for item in page.get("Contents", [])
+                    if item["Key"].endswith(".json"))
+    return sorted(urls)
+
+
+def write_manifests(s3, urls, manifest_prefix, table, batch_size):
+    """
+    Write one COPY manifest per batch of files.
+    :param s3: boto3 S3 client.
+    :param urls: s3:// URLs of the files to load.
+    :param manifest_prefix: s3://bucket/prefix the manifests are written under.
+    :param table: staging table, used in the manifest names.
+    :param batch_size: files per manifest.
+    :return: list of manifest URLs.
+    """
+    bucket, prefix = split_s3_url(manifest_prefix)
+    manifests = []
+    for number, batch in enumerate(batches(urls, batch_size)):
+        key = "{}/{}-{:05d}.json".format(prefix.rstrip("/"), table, number)
+        body = json.dumps({"entries": [{"url": url, "mandatory": True} for url in batch]})
+        s3.put_object(Bucket=bucket, Key=key, Body=body.encode())
+        manifests.append("s3://{}/{}".format(bucket, key))
+    return manifests
+
+
+def copy_manifest(query):
+    """
+    :param query: COPY template with a {manifest} placeholder.
+    :return: function running the COPY of one manifest and returning the rows it loaded.
+    """
+    def copy(cur, manifest):
+        cur.execute(query.format(manifest=manifest))
+        cur.execute(last_copy_count)
+        return cur.fetchone()[0]
+    return copy
+
+
+def run_copies(config, table, units, copy):
+    """
+    Run the COPYs of one staging table in order on a connection of its own, committing each.
+    :param config: ConfigParser of dwh.cfg.
+    :param table: staging table.
+    :param units: list of COPY inputs, e.g. manifest URLs.
+    :param copy: function(cur, unit) running one COPY and returning the rows it loaded.
+    :return: list of per-COPY stats dicts.
+    """
+    conn = connect(config)
+    cur = conn.cursor()
+    stats = []
+    try:
+        for number, unit in enumerate(units):
+            start = time.perf_counter()
+            rows = copy(cur, unit)
+            conn.commit()
+            stats.append({"table": table, "batch": number, "seconds": round(time.perf_counter() - start, 3),
+                          "rows": rows})
+            print(json.dumps(stats[-1]))
+    finally:
+        conn.close()
+    return stats
+
+
+def run_parallel(config, jobs):
+    """
+    Load independent staging tables concurrently, one connection and thread per table.
+    :param config: ConfigParser of dwh.cfg.
+    :param jobs: list of (table, units, copy) tuples.
+    :return: list of per-COPY stats dicts of all tables.
+    """
+    with ThreadPoolExecutor(max_workers=len(jobs)) as executor:
+        futures = [executor.submit(run_copies, config, table, units, copy) for table, units, copy in jobs]
+        return [stat for future in futures for stat in future.result()]
+
+
+def load_staging_manifests(config, batch_size):
+    """
+    Manifest-driven staging load: list the song and log files, write a COPY manifest per
+    `batch_size` files under S3.MANIFEST_PREFIX, and COPY staging_events and staging_songs at the
+    same time.
+    :param config: ConfigParser of dwh.cfg.
+    :param batch_size: files per manifest and COPY.
+    :return: list of per-COPY stats dicts.
+    """
+    import boto3
+
+    s3 = boto3.client("s3", region_name="us-west-2")
+    manifest_prefix = config.get("S3", "MANIFEST_PREFIX")
+    jobs = []
+    for table, data, query in [("staging_events", LOG_DATA, staging_events_copy_manifest),
+                               ("staging_songs", SONG_DATA, staging_songs_copy_manifest)]:
+        manifests = write_manifests(s3, list_s3_files(s3, data), manifest_prefix, table, batch_size)
+        jobs.append((table, manifests, copy_manifest(query)))
+    return run_parallel(config, jobs)
+
+
+def csv_value(value):
+    """
+    :return: the value as it goes into the CSV; blanks become NULL as with BLANKSASNULL EMPTYASNULL.
+    """
+    if value is None or (isinstance(value, str) and not value.strip()):
+        return None
+    return value
+
+
+def event_row(record):
+    """
+    :return: staging_events row of a log record, with the millisecond ts as a UTC timestamp.
+    """
+    row = [csv_value(record.get(column)) for column in staging_events_columns]
+    ts = staging_events_columns.index("ts")
+    if row[ts] is not None:
+        row[ts] = datetime.fromtimestamp(row[ts] / 1000, timezone.utc).strftime("%Y-%m-%d %H:%M:%S.%f")
+    return row
+
+
+def song_row(record):
+    """
+    :return: staging_songs row of a song record.
+    """
+    return [csv_value(record.get(column)) for column in staging_songs_columns]
+
+
+def copy_local(query, to_row):
+    """
+    :param query: COPY ... FROM STDIN WITH CSV statement.
+    :param to_row: function turning a JSON record into a row of the staging table.
+    :return: function converting a batch of line-delimited JSON files to CSV, streaming it with
+        copy_expert and returning the rows loaded.
+    """
+    def copy(cur, filepaths):
+        buffer = io.StringIO()
+        writer = csv.writer(buffer)
+        for filepath in filepaths:
+            with open(filepath) as f:
+                for line in f:
+                    if line.strip():
+                        writer.writerow(to_row(json.loads(line)))
+        buffer.seek(0)
+        cur.copy_expert(query, buffer)
+        return cur.rowcount
+    return copy
+
+
+def load_staging_local(config, data_dir, batch_size):
+    """
+    Local Postgres stand-in of the manifest-driven load: the batches are local song_data and
+    log_data files, and the staging tables are loaded concurrently as in load_staging_manifests.
+    :param config: ConfigParser of dwh.cfg, whose CLUSTER points at the local Postgres.
+    :param data_dir: directory holding song_data and log_data.
+    :param batch_size: files per COPY.
+    :return: list of per-COPY stats dicts.
+    """
+    jobs = []
+    for table, folder, query, to_row in [("staging_events", "log_data", staging_events_copy_local, event_row),
+                                         ("staging_songs", "song_data", staging_songs_copy_local, song_row)]:
+        filepaths = sorted(glob.glob(os.path.join(data_dir, folder, "**", "*.json"), recursive=True))
+        jobs.append((table, batches(filepaths, batch_size), copy_local(query, to_row)))
+    return run_parallel(config, jobs)
+
+
+def summarize(stats):
+    """
+    :return: dict of staging table to COPYs, rows and seconds spent.
+    """
+    summary = {}
+    for stat in stats:
+        table = summary.setdefault(stat["table"], {"copies": 0, "rows": 0, "seconds": 0.0})
+        table["copies"] += 1
+        table["rows"] += stat["rows"]
+        table["seconds"] = round(table["seconds"] + stat["seconds"], 3)
+    return summary
+
+
+def main():
+    """
+    Load the staging tables with batched, concurrent COPYs.
+    """
+    parser = argparse.ArgumentParser(description="Load the Sparkify staging tables with batched, concurrent COPYs.")
+    parser.add_argument("--batch-size", type=int, default=1000, help="files per manifest and COPY")
+    parser.add_argument("--local", metavar="DATA_DIR",
+                        help="load song_data and log_data of a local directory into Postgres instead of S3 into Redshift")
+    parser.add_argument("--stats", help="write the per-COPY timings and row counts to this JSON file")
+    args = parser.parse_args()
+
+    config = configparser.ConfigParser()
+    config.read('dwh.cfg')
+
+    if args.local:
+        stats = load_staging_local(config, args.local, args.batch_size)
+    else:
+        stats = load_staging_manifests(config, args.batch_size)
+    print(json.dumps(summarize(stats), indent=2))
+
+    if args.stats:
+        with open(args.stats, "w") as f:
+            json.dump(stats, f, indent=2)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,40 @@
+-- most played songs with their artists
+SELECT s.title, a.name, COUNT(*) AS plays
+FROM songplays sp
+JOIN songs s ON sp.song_id = s.song_id
+JOIN artists a ON sp.artist_id = a.artist_id
+GROUP BY s.title, a.name
+ORDER BY plays DESC
+LIMIT 10;
+
+-- plays per hour of day in one month
+SELECT t.hour, COUNT(*) AS plays
+FROM songplays sp
+JOIN time t ON sp.start_time = t.start_time
+WHERE t.year = 2018 AND t.month = 11
+GROUP BY t.hour
+ORDER BY t.hour;
+
+-- plays by subscription level and gender
+SELECT u.level, u.gender, COUNT(*) AS plays
+FROM songplays sp
+JOIN users u ON sp.user_id = u.user_id
+GROUP BY u.level, u.gender;
+
+-- top artists of a week
+SELECT a.name, COUNT(*) AS plays
+FROM songplays sp
+JOIN artists a ON sp.artist_id = a.artist_id
+WHERE sp.start_time BETWEEN '2018-11-05' AND '2018-11-12'
+GROUP BY a.name
+ORDER BY plays DESC
+LIMIT 10;
+
+-- sessions and plays per user on weekends
+SELECT sp.user_id, COUNT(DISTINCT sp.session_id) AS sessions, COUNT(*) AS plays
+FROM songplays sp
+JOIN time t ON sp.start_time = t.start_time
+WHERE t.weekday IN ('5', '6')
+GROUP BY sp.user_id
+ORDER BY plays DESC
+LIMIT 20;
@@ -0,0 +1,116 @@
+"""
+The Cassandra project's notebook as a script, so its current loading approach can be benchmarked:
+consolidate event_data/*.csv in memory into event_datafile_new.csv, then insert each row into the
+three query tables with a separate, unprepared INSERT.
+"""
+import os
+import csv
+import glob
+import argparse
+
+
+def consolidate(event_dir, output):
+    """
+    Part I of the notebook: buffer all rows, then write the rows with an artist.
+    :return: number of rows written.
+    """
+    full_data_rows_list = []
+    for f in glob.glob(os.path.join(event_dir, '*')):
+        with open(f, 'r', encoding='utf8', newline='') as csvfile:
+            csvreader = csv.reader(csvfile)
+            next(csvreader)
+            for line in csvreader:
+                full_data_rows_list.append(line)
+
+    csv.register_dialect('myDialect', quoting=csv.QUOTE_ALL, skipinitialspace=True)
+    rows = 0
+    with open(output, 'w', encoding='utf8', newline='') as f:
+        writer = csv.writer(f, dialect='myDialect')
+        writer.writerow(['artist', 'firstName', 'gender', 'itemInSession', 'lastName', 'length',
+                         'level', 'location', 'sessionId', 'song', 'userId'])
+        for row in full_data_rows_list:
+            if row[0] == '':
+                continue
+            writer.writerow((row[0], row[2], row[3], row[4], row[5], row[6], row[7], row[8], row[12], row[13], row[16]))
+            rows += 1
+    return rows
+
+
+def load(session, datafile):
+    """
+    Part II of the notebook: one pass over the CSV per query table, one unprepared INSERT per row.
+    """
+    with open(datafile, encoding='utf8') as f:
+        csvreader = csv.reader(f)
+        next(csvreader)
+        for line in csvreader:
+            artist_name, user_name, gender, itemInSession, user_last_name, length, level, location, sessionId, song, userId = line
+            session.execute("INSERT INTO song_info_by_session (sessionId, itemInSession, artist, song_title, song_length)"
+                            " VALUES (%s, %s, %s, %s, %s)",
+                            (int(sessionId), int(itemInSession), artist_name, song, float(length)))
+
+    with open(datafile, encoding='utf8') as f:
+        csvreader = csv.reader(f)
+        next(csvreader)
+        for line in csvreader:
+            artist, firstName, gender, itemInSession, lastName, length, level, location, sessionId, song, userId = line
+            session.execute("INSERT INTO song_info_by_user_and_session (userId, sessionId, itemInSession, artist, song, firstName, lastName)"
+                            " VALUES (%s, %s, %s, %s, %s, %s, %s)",
+                            (int(userId), int(sessionId), int(itemInSession), artist, song, firstName, lastName))
+
+    with open(datafile, encoding='utf8') as f:
+        csvreader = csv.reader(f)
+        next(csvreader)
+        for line in csvreader:
+            artist, firstName, gender, itemInSession, lastName, length, level, location, sessionId, song, userId = line
+            session.execute("INSERT INTO user_name_by_song_and_userid (song, userId, firstName, lastName)"
+                            " VALUES (%s, %s, %s, %s)",
+                            (song, int(userId), firstName, lastName))
+
+
+def create_tables(session):
+    session.execute("""
+    CREATE KEYSPACE IF NOT EXISTS sparkify
+    WITH REPLICATION = {'class':'SimpleStrategy', 'replication_factor':1}
+    """)
+    session.set_keyspace('sparkify')
+    session.execute("""
+    CREATE TABLE IF NOT EXISTS song_info_by_session
+    (sessionId int, itemInSession int, artist text, song_title text, song_length float, PRIMARY KEY(sessionId, itemInSession))
+    """)
+    session.execute("""
+    CREATE TABLE IF NOT EXISTS song_info_by_user_and_session
+    (userId int, sessionId int, itemInSession int, artist text, song text, firstName text, lastName text, PRIMARY KEY((userId, sessionId), itemInSession))
+    """)
+    session.execute("""
+    CREATE TABLE IF NOT EXISTS user_name_by_song_and_userid
+    (song text, userId int, firstName text, lastName text, PRIMARY KEY(song, userId))
+    """)
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Run the notebook's Cassandra ETL as a script.")
+    parser.add_argument("event_dir", help="directory of event CSV files")
+    parser.add_argument("--output", default="event_datafile_new.csv", help="consolidated CSV to write")
+    parser.add_argument("--hosts", default="127.0.0.1", help="comma separated Cassandra contact points")
+    parser.add_argument("--skip-load", action="store_true", help="only consolidate the CSV files")
+    parser.add_argument("--skip-consolidate", action="store_true", help="only load an already consolidated CSV")
+    args = parser.parse_args()
+
+    if not args.skip_consolidate:
+        print('{} rows consolidated.'.format(consolidate(args.event_dir, args.output)))
+    if args.skip_load:
+        return
+
+    from cassandra.cluster import Cluster
+
+    cluster = Cluster(args.hosts.split(','))
+    session = cluster.connect()
+    create_tables(session)
+    load(session, args.output)
+    session.shutdown()
+    cluster.shutdown()
+
+
+if __name__ == "__main__":
+    main()
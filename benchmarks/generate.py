@@ -0,0 +1,202 @@
+"""
+Synthetic Sparkify data at configurable scale, using the schemas of the bundled samples:
+
+- song_data/A/B/C/TR*.json: one song record per file, as in the song dataset.
+- log_data/YYYY/MM/YYYY-MM-DD-events.json: line-delimited event logs, one file per day.
+- event_data/YYYY-MM-DD-events.csv: the same events in the CSV layout of the Cassandra project.
+- metadata.json: record counts used by run.py to compute rows/sec.
+"""
+import os
+import csv
+import json
+import random
+import shutil
+import string
+import argparse
+from datetime import datetime, timezone
+
+LOG_FIELDS = ["artist", "auth", "firstName", "gender", "itemInSession", "lastName", "length", "level", "location",
+              "method", "page", "registration", "sessionId", "song", "status", "ts", "userAgent", "userId"]
+CSV_FIELDS = [field for field in LOG_FIELDS if field != "userAgent"]
+
+OTHER_PAGES = ["Home", "Logout", "Settings", "Add to Playlist", "Thumbs Up", "Thumbs Down", "Downgrade", "Upgrade"]
+LOCATIONS = ["San Francisco-Oakland-Hayward, CA", "Phoenix-Mesa-Scottsdale, AZ", "Atlanta-Sandy Springs-Roswell, GA",
+             "Chicago-Naperville-Elgin, IL-IN-WI", "Portland-South Portland, ME", "Lansing-East Lansing, MI"]
+USER_AGENTS = ["Mozilla/5.0 (Windows NT 6.1; WOW64; rv:31.0) Gecko/20100101 Firefox/31.0",
+               "\"Mozilla/5.0 (Macintosh; Intel Mac OS X 10_9_4) AppleWebKit/537.36 (KHTML, like Gecko) Chrome/36.0.1985.143 Safari/537.36\""]
+FIRST_NAMES = ["Walter", "Kaylee", "Mohammad", "Lily", "Jacob", "Tegan", "Chloe", "Aleena", "Ryan", "Sara"]
+LAST_NAMES = ["Frye", "Summers", "Rodriguez", "Koch", "Klein", "Levine", "Cuevas", "Kirby", "Smith", "Johnson"]
+
+DAY_MS = 24 * 3600 * 1000
+
+DATASET_DIRS = ["song_data", "log_data", "event_data"]
+
+
+def random_id(rng, prefix):
+    """
+    :return: 18 character id in the style of the song dataset, e.g. SOUPIRU12A6D4FA1E1.
+    """
+    return prefix + "".join(rng.choice(string.ascii_uppercase + string.digits) for _ in range(16))
+
+
+def random_words(rng, count):
+    return " ".join(rng.choice(string.ascii_uppercase) + "".join(rng.choice(string.ascii_lowercase) for _ in range(rng.randint(2, 8)))
+                    for _ in range(count))
+
+
+def generate_songs(rng, output, num_songs, num_artists):
+    """
+    Write one JSON file per song.
+    :return: list of (title, artist_name, duration) used to make log events resolvable.
+    """
+    artists = []
+    for _ in range(num_artists):
+        has_geo = rng.random() < 0.4
+        artists.append({
+            "artist_id": random_id(rng, "AR"),
+            "artist_latitude": round(rng.uniform(-60, 60), 5) if has_geo else None,
+            "artist_longitude": round(rng.uniform(-150, 150), 5) if has_geo else None,
+            "artist_location": rng.choice(LOCATIONS) if has_geo else "",
+            "artist_name": random_words(rng, rng.randint(1, 3)),
+        })
+
+    catalog = []
+    for _ in range(num_songs):
+        artist = rng.choice(artists)
+        record = dict(artist, num_songs=1, song_id=random_id(rng, "SO"), title=random_words(rng, rng.randint(1, 5)),
+                      duration=round(rng.uniform(60, 600), 5), year=rng.choice([0, rng.randint(1960, 2018)]))
+        track_id = random_id(rng, "TR")
+        directory = os.path.join(output, "song_data", track_id[2], track_id[3], track_id[4])
+        os.makedirs(directory, exist_ok=True)
+        with open(os.path.join(directory, track_id + ".json"), "w") as f:
+            json.dump(record, f)
+        catalog.append((record["title"], record["artist_name"], record["duration"]))
+
+    return catalog
+
+
+def generate_events(rng, output, num_events, days, num_users, catalog, start):
+    """
+    Write the same events as daily JSON logs and daily Cassandra CSV files.
+    :return: (number of NextSong events, number of CSV rows with an artist).
+    """
+    start_ms = int(start.timestamp() * 1000)
+    users = [{
+        "userId": str(user_id),
+        "firstName": rng.choice(FIRST_NAMES),
+        "lastName": rng.choice(LAST_NAMES),
+        "gender": rng.choice("MF"),
+        "level": rng.choice(["free", "paid"]),
+        "location": rng.choice(LOCATIONS),
+        "userAgent": rng.choice(USER_AGENTS),
+        "registration": float(start_ms - rng.randint(1, 365) * DAY_MS),
+    } for user_id in range(1, num_users + 1)]
+
+    next_songs = 0
+    csv_rows = 0
+    per_day = num_events // days
+    session_id = 0
+
+    for day in range(days):
+        date = datetime.fromtimestamp((start_ms + day * DAY_MS) / 1000, timezone.utc)
+        log_dir = os.path.join(output, "log_data", "{:%Y}".format(date), "{:%m}".format(date))
+        csv_dir = os.path.join(output, "event_data")
+        os.makedirs(log_dir, exist_ok=True)
+        os.makedirs(csv_dir, exist_ok=True)
+        count = per_day + (num_events - per_day * days if day == days - 1 else 0)
+        timestamps = sorted(rng.randrange(start_ms + day * DAY_MS, start_ms + (day + 1) * DAY_MS) for _ in range(count))
+
+        with open(os.path.join(log_dir, "{:%Y-%m-%d}-events.json".format(date)), "w") as log_file, \
+                open(os.path.join(csv_dir, "{:%Y-%m-%d}-events.csv".format(date)), "w", newline="") as csv_file:
+            writer = csv.writer(csv_file)
+            writer.writerow(CSV_FIELDS)
+            item_in_session = 0
+            for ts in timestamps:
+                user = rng.choice(users)
+                if item_in_session == 0 or rng.random() < 0.05:
+                    session_id += 1
+                    item_in_session = 0
+
+                event = {
+                    "auth": "Logged In", "firstName": user["firstName"], "gender": user["gender"],
+                    "itemInSession": item_in_session, "lastName": user["lastName"], "level": user["level"],
+                    "location": user["location"], "method": "PUT", "registration": user["registration"],
+                    "sessionId": session_id, "status": 200, "ts": ts, "userAgent": user["userAgent"],
+                    "userId": user["userId"],
+                }
+                if rng.random() < 0.8:
+                    title, artist, duration = rng.choice(catalog)
+                    if rng.random() < 0.5:
+                        title, artist = random_words(rng, 3), random_words(rng, 2)
+                    event.update(page="NextSong", artist=artist, song=title, length=duration)
+                    next_songs += 1
+                    csv_rows += 1
+                else:
+                    event.update(page=rng.choice(OTHER_PAGES), artist=None, song=None, length=None, method="GET")
+                item_in_session += 1
+
+                log_file.write(json.dumps({field: event[field] for field in LOG_FIELDS}) + "\n")
+                writer.writerow(["" if event[field] is None else event[field] for field in CSV_FIELDS])
+
+    return next_songs, csv_rows
+
+
+def generate(output, num_events, num_songs=None, num_artists=None, num_users=100, days=30, seed=0):
+    """
+    Generate a full synthetic dataset.
+    :param output: directory to write song_data, log_data and event_data into; any earlier dataset there is
+        removed first, as song files are named after random track ids and a smaller rerun would leave files behind.
+    :param num_events: total log events.
+    :param num_songs: number of song files; defaults to one per 100 events (at least 100).
+    :param num_artists: number of artists; defaults to one per 4 songs.
+    :param num_users: number of users.
+    :param days: number of daily log files.
+    :param seed: random seed, so runs at the same scale are comparable.
+    :return: metadata dict, also written to metadata.json.
+    """
+    rng = random.Random(seed)
+    num_songs = num_songs or max(100, num_events // 100)
+    num_artists = num_artists or max(1, num_songs // 4)
+    start = datetime(2018, 11, 1, tzinfo=timezone.utc)
+
+    for name in DATASET_DIRS:
+        shutil.rmtree(os.path.join(output, name), ignore_errors=True)
+    if os.path.exists(os.path.join(output, "metadata.json")):
+        os.remove(os.path.join(output, "metadata.json"))
+
+    catalog = generate_songs(rng, output, num_songs, num_artists)
+    next_songs, csv_rows = generate_events(rng, output, num_events, days, num_users, catalog, start)
+
+    metadata = {
+        "events": num_events,
+        "next_song_events": next_songs,
+        "event_csv_rows": csv_rows,
+        "songs": num_songs,
+        "artists": num_artists,
+        "users": num_users,
+        "days": days,
+        "seed": seed,
+    }
+    with open(os.path.join(output, "metadata.json"), "w") as f:
+        json.dump(metadata, f, indent=2)
+
+    return metadata
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Generate synthetic Sparkify song, log and event data.")
+    parser.add_argument("output", help="directory to write the dataset into")
+    parser.add_argument("--events", type=int, default=10000, help="total log events, e.g. 10000 to 100000000")
+    parser.add_argument("--songs", type=int, help="song files (default: events / 100)")
+    parser.add_argument("--artists", type=int, help="artists (default: songs / 4)")
+    parser.add_argument("--users", type=int, default=100, help="distinct users")
+    parser.add_argument("--days", type=int, default=30, help="daily log files")
+    parser.add_argument("--seed", type=int, default=0, help="random seed")
+    args = parser.parse_args()
+
+    metadata = generate(args.output, args.events, args.songs, args.artists, args.users, args.days, args.seed)
+    print(json.dumps(metadata, indent=2))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,198 @@
+"""
+Benchmark the Sparkify ETL pipelines on synthetic data.
+
+Every stage runs in its own process; wall time, rows/sec and the peak RSS of that process are
+recorded as JSON. Child processes of a stage (e.g. the Spark JVM) are not included in its RSS.
+"""
+import os
+import sys
+import json
+import time
+import shlex
+import argparse
+import subprocess
+from collections import namedtuple
+from datetime import datetime
+
+from generate import generate
+
+REPO = os.path.abspath(os.path.join(os.path.dirname(os.path.abspath(__file__)), os.pardir))
+POSTGRES_DIR = os.path.join(REPO, "Data Modeling with Postgres")
+CASSANDRA_DIR = os.path.join(REPO, "Data Modeling with Apache Cassandra")
+DATA_LAKE_DIR = os.path.join(REPO, "Data Lake on AWS")
+BENCHMARK_DIR = os.path.join(REPO, "benchmarks")
+
+Stage = namedtuple("Stage", ["name", "command", "cwd", "rows"])
+
+SPARK_SCRIPT = """
+import sys
+sys.path.insert(0, {project!r})
+import etl
+from tuning import profile_config, log_config
+config = dict(profile_config({profile!r}), **{{"spark.master": {master!r}}})
+spark = etl.create_spark_session(config)
+log_config(spark, {profile!r}, config)
+etl.{function}(spark, {input_data!r}, {output_data!r})
+spark.stop()
+"""
+
+
+def postgres_stages(args, data_dir, work_dir, metadata):
+    """
+    create_tables.py then etl.py, run from a directory whose `data` links to the synthetic dataset.
+    """
+    cwd = os.path.join(work_dir, "postgres")
+    os.makedirs(cwd, exist_ok=True)
+    if not os.path.exists(os.path.join(cwd, "data")):
+        os.symlink(data_dir, os.path.join(cwd, "data"))
+
+    return [
+        Stage("postgres:create_tables", [sys.executable, os.path.join(POSTGRES_DIR, "create_tables.py")], cwd, 0),
+        Stage("postgres:etl", [sys.executable, os.path.join(POSTGRES_DIR, "etl.py")] + shlex.split(args.postgres_args),
+              cwd, metadata["songs"] + metadata["next_song_events"]),
+    ]
+
+
+def cassandra_stages(args, data_dir, work_dir, metadata):
+    """
+    The notebook's consolidation and per-row inserts, then consolidate.py and cassandra_loader.py.
+    """
+    script = os.path.join(BENCHMARK_DIR, "cassandra_baseline.py")
+    event_dir = os.path.join(data_dir, "event_data")
+    output = os.path.join(work_dir, "event_datafile_new.csv")
+    common = [sys.executable, script, event_dir, "--output", output, "--hosts", args.cassandra_hosts]
+
+    return [
+        Stage("cassandra:consolidate", common + ["--skip-load"], CASSANDRA_DIR, metadata["event_csv_rows"]),
+        Stage("cassandra:load", common + ["--skip-consolidate"], CASSANDRA_DIR, 3 * metadata["event_csv_rows"]),
+        Stage("cassandra:consolidate_stream", [sys.executable, os.path.join(CASSANDRA_DIR, "consolidate.py"), event_dir,
+                                               "--output", output], CASSANDRA_DIR, metadata["event_csv_rows"]),
+        Stage("cassandra:loader", [sys.executable, os.path.join(CASSANDRA_DIR, "cassandra_loader.py"), output,
+                                   "--hosts", args.cassandra_hosts] + shlex.split(args.cassandra_args),
+              CASSANDRA_DIR, 3 * metadata["event_csv_rows"]),
+    ]
+
+
+def spark_stages(args, data_dir, work_dir, metadata):
+    """
+    process_song_data and process_log_data of the data lake ETL on a local-mode session, each reading
+    its own input, then the single-pass process_data.
+    """
+    cwd = os.path.join(work_dir, "spark")
+    os.makedirs(cwd, exist_ok=True)
+
+    input_data = data_dir.rstrip("/") + "/"
+    output_data = os.path.join(work_dir, "spark_output") + "/"
+    stages = []
+    for name, function, rows in [("spark:songs", "process_song_data", metadata["songs"]),
+                                 ("spark:logs", "process_log_data", metadata["next_song_events"]),
+                                 ("spark:single_pass", "process_data", metadata["songs"] + metadata["next_song_events"])]:
+        script = SPARK_SCRIPT.format(project=DATA_LAKE_DIR, master=args.spark_master, profile=args.spark_profile,
+                                     function=function,
+                                     input_data=input_data, output_data=output_data)
+        stages.append(Stage(name, [sys.executable, "-c", script], cwd, rows))
+    return stages
+
+
+PIPELINES = {
+    "postgres": postgres_stages,
+    "cassandra": cassandra_stages,
+    "spark": spark_stages,
+}
+
+
+def run_stage(stage):
+    """
+    Run a stage in a child process and measure it.
+    :return: dict of stage results.
+    """
+    print("running {}".format(stage.name))
+    start = time.perf_counter()
+    process = subprocess.Popen(stage.command, cwd=stage.cwd)
+    _, status, usage = os.wait4(process.pid, 0)
+    elapsed = time.perf_counter() - start
+    returncode = os.waitstatus_to_exitcode(status)
+    # the child was reaped by wait4, let Popen know
+    process.returncode = returncode
+
+    return {
+        "stage": stage.name,
+        "returncode": returncode,
+        "wall_time_s": round(elapsed, 3),
+        "rows": stage.rows,
+        "rows_per_s": round(stage.rows / elapsed, 1) if returncode == 0 and stage.rows else None,
+        # ru_maxrss is in kilobytes on Linux
+        "peak_rss_mb": round(usage.ru_maxrss / 1024, 1),
+    }
+
+
+def compare(results, baseline_path):
+    """
+    Print the change in rows/sec against an earlier results file.
+    """
+    with open(baseline_path) as f:
+        baseline = {stage["stage"]: stage for stage in json.load(f)["stages"]}
+
+    for stage in results["stages"]:
+        before = baseline.get(stage["stage"])
+        if not before or not before["rows_per_s"] or not stage["rows_per_s"]:
+            continue
+        change = (stage["rows_per_s"] - before["rows_per_s"]) / before["rows_per_s"] * 100
+        print("{:<24} {:>12.1f} -> {:>12.1f} rows/s ({:+.1f}%){}".format(
+            stage["stage"], before["rows_per_s"], stage["rows_per_s"], change, "  REGRESSION" if change < -10 else ""))
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark the Sparkify ETL pipelines on synthetic data.")
+    parser.add_argument("--data", default=os.path.join(BENCHMARK_DIR, "data"), help="synthetic dataset directory")
+    parser.add_argument("--events", type=int,
+                        help="events of the dataset; generated when --data does not exist yet (default 10000), "
+                             "and must match the dataset when it does")
+    parser.add_argument("--pipelines", default="postgres,cassandra,spark", help="comma separated pipelines to run")
+    parser.add_argument("--postgres-args", default="--bulk", help="extra arguments passed to the Postgres etl.py")
+    parser.add_argument("--cassandra-hosts", default="127.0.0.1", help="comma separated Cassandra contact points")
+    parser.add_argument("--cassandra-args", default="", help="extra arguments passed to cassandra_loader.py")
+    parser.add_argument("--spark-master", default="local[*]", help="Spark master URL")
+    parser.add_argument("--spark-profile", default="default", help="tuning profile of the data lake ETL, e.g. local-small")
+    parser.add_argument("--output", help="results JSON (default: benchmarks/results/<timestamp>.json)")
+    parser.add_argument("--baseline", help="earlier results JSON to compare rows/sec against")
+    args = parser.parse_args()
+
+    data_dir = os.path.abspath(args.data)
+    if not os.path.exists(os.path.join(data_dir, "metadata.json")):
+        events = args.events or 10000
+        print("generating {} events into {}".format(events, data_dir))
+        generate(data_dir, events)
+    with open(os.path.join(data_dir, "metadata.json")) as f:
+        metadata = json.load(f)
+    if args.events is not None and metadata["events"] != args.events:
+        # rows/sec would be computed for a dataset of another size
+        sys.exit("{} holds {} events, not {}: regenerate it with generate.py or pass another --data".format(
+            data_dir, metadata["events"], args.events))
+
+    stamp = datetime.now().strftime("%Y%m%d-%H%M%S")
+    work_dir = os.path.join(BENCHMARK_DIR, "work", stamp)
+    os.makedirs(work_dir, exist_ok=True)
+
+    results = {"started_at": stamp, "dataset": metadata, "stages": []}
+    for pipeline in args.pipelines.split(","):
+        for stage in PIPELINES[pipeline](args, data_dir, work_dir, metadata):
+            result = run_stage(stage)
+            results["stages"].append(result)
+            print(json.dumps(result))
+            if result["returncode"] != 0:
+                print("{} failed, skipping the rest of {}".format(stage.name, pipeline))
+                break
+
+    output = args.output or os.path.join(BENCHMARK_DIR, "results", stamp + ".json")
+    os.makedirs(os.path.dirname(output), exist_ok=True)
+    with open(output, "w") as f:
+        json.dump(results, f, indent=2)
+    print("results written to {}".format(output))
+
+    if args.baseline:
+        compare(results, args.baseline)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,112 @@
+"""
+Local-mode comparison of the songplays join of the data lake ETL before and after joining on
+(title, artist name, duration) with a broadcast song dimension and no global dedupe.
+
+Each variant is written with the no-op writer; the shuffle bytes it wrote are read from the Spark
+UI REST API (/api/v1/applications/<id>/stages) as the growth of the summed shuffleWriteBytes.
+"""
+import os
+import sys
+import json
+import time
+import argparse
+from urllib.request import urlopen
+
+from generate import generate
+
+REPO = os.path.abspath(os.path.join(os.path.dirname(os.path.abspath(__file__)), os.pardir))
+DATA_LAKE_DIR = os.path.join(REPO, "Data Lake on AWS")
+BENCHMARK_DIR = os.path.join(REPO, "benchmarks")
+
+
+def shuffle_write_bytes(spark):
+    """
+    :return: shuffle bytes written by all stages of the application so far.
+    """
+    url = "{}/api/v1/applications/{}/stages".format(spark.sparkContext.uiWebUrl, spark.sparkContext.applicationId)
+    with urlopen(url) as response:
+        return sum(stage.get("shuffleWriteBytes", 0) for stage in json.load(response))
+
+
+def title_join(df, output_data, spark):
+    """
+    The songplays join as it was: songs matched on title only, then a dedupe over all columns.
+    """
+    from pyspark.sql.functions import col
+
+    song_df = spark.read.parquet(output_data + "songs.parquet").drop("year")
+    return (
+        df.join(song_df, song_df.title == df.song)
+          .select(col('start_time'), col('userId').alias('user_id'), col('level'), col('song_id'), col('artist_id'),
+                  col('sessionId').alias('session_id'), col('location'), col('userAgent').alias('user_agent'),
+                  col('year'), col('month'))
+          .drop_duplicates()
+    )
+
+
+def key_join(df, output_data, spark, broadcast_threshold):
+    """
+    The songplays join of etl.py.
+    """
+    import etl
+
+    song_df = etl.song_dimension(spark.read.parquet(output_data + "songs.parquet"),
+                                 spark.read.parquet(output_data + "artist.parquet"))
+    return etl.build_songplays(df, song_df, broadcast_threshold)
+
+
+def measure(spark, songplays):
+    """
+    :return: (wall time in seconds, shuffle bytes written, songplays rows) of writing the songplays.
+    """
+    before = shuffle_write_bytes(spark)
+    start = time.perf_counter()
+    songplays.write.format("noop").mode("overwrite").save()
+    elapsed = time.perf_counter() - start
+    # stage metrics reach the REST API asynchronously
+    time.sleep(2)
+    return elapsed, shuffle_write_bytes(spark) - before, songplays.count()
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark the shuffle of the songplays join.")
+    parser.add_argument("--data", default=os.path.join(BENCHMARK_DIR, "data"), help="synthetic dataset directory")
+    parser.add_argument("--events", type=int, default=1000000, help="events to generate when --data does not exist yet")
+    parser.add_argument("--spark-master", default="local[*]", help="Spark master URL")
+    parser.add_argument("--broadcast-threshold", type=int, default=64 * 1024 * 1024,
+                        help="maximum estimated song dimension size in bytes to broadcast; 0 disables")
+    args = parser.parse_args()
+
+    data_dir = os.path.abspath(args.data)
+    if not os.path.exists(os.path.join(data_dir, "metadata.json")):
+        print("generating {} events into {}".format(args.events, data_dir))
+        generate(data_dir, args.events)
+
+    work_dir = os.path.join(BENCHMARK_DIR, "work", "spark_shuffle")
+    os.makedirs(work_dir, exist_ok=True)
+    sys.path[:0] = [DATA_LAKE_DIR, REPO]
+
+    from pyspark.sql import SparkSession
+    import etl
+
+    spark = SparkSession.builder.master(args.spark_master).config("spark.sql.session.timeZone", "UTC").getOrCreate()
+    input_data = data_dir.rstrip("/") + "/"
+    output_data = os.path.join(work_dir, "output") + "/"
+    etl.process_song_data(spark, input_data, output_data)
+
+    df = etl.read_log_data(spark, input_data)
+    # fill the cache so both variants start from the parsed events
+    df.count()
+
+    results = {}
+    for name, songplays in [("title_join", title_join(df, output_data, spark)),
+                            ("key_join", key_join(df, output_data, spark, args.broadcast_threshold))]:
+        elapsed, shuffled, rows = measure(spark, songplays)
+        results[name] = {"wall_time_s": round(elapsed, 3), "shuffle_write_bytes": shuffled, "rows": rows}
+
+    print(json.dumps(results, indent=2))
+    spark.stop()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,97 @@
+"""
+Local-mode comparison of the log transform of the data lake ETL before and after replacing the
+Python UDF timestamp conversion with native Column expressions.
+
+Both variants read the same synthetic log data, derive start_time and the time parts and are
+forced with the no-op writer, so only the transform is measured. The results are also checked to
+be identical.
+"""
+import os
+import sys
+import json
+import time
+import argparse
+from datetime import datetime
+
+from generate import generate
+
+REPO = os.path.abspath(os.path.join(os.path.dirname(os.path.abspath(__file__)), os.pardir))
+DATA_LAKE_DIR = os.path.join(REPO, "Data Lake on AWS")
+BENCHMARK_DIR = os.path.join(REPO, "benchmarks")
+
+
+def udf_transform(df):
+    """
+    The log transform as it was, with a Python UDF for start_time.
+    """
+    from pyspark.sql.functions import udf, col
+    from pyspark.sql.types import TimestampType
+    from common.time_dimension import spark_time_columns
+
+    get_timestamp = udf(lambda x: datetime.utcfromtimestamp(int(x) / 1000), TimestampType())
+    df = df.withColumn("start_time", get_timestamp("ts"))
+    return df.select("*", *spark_time_columns(col("start_time")))
+
+
+def native_transform(df):
+    """
+    The log transform of etl.py.
+    """
+    from pyspark.sql.functions import col
+    from common.time_dimension import spark_time_columns
+    import etl
+
+    df = df.withColumn("start_time", etl.start_time_column(col("ts")))
+    return df.select("*", *spark_time_columns(col("start_time")))
+
+
+def measure(df, transform, repeats):
+    """
+    :return: best wall time in seconds over `repeats` runs of the transform.
+    """
+    best = None
+    for _ in range(repeats):
+        start = time.perf_counter()
+        transform(df).write.format("noop").mode("overwrite").save()
+        elapsed = time.perf_counter() - start
+        best = elapsed if best is None else min(best, elapsed)
+    return best
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark the UDF and native start_time conversions.")
+    parser.add_argument("--data", default=os.path.join(BENCHMARK_DIR, "data"), help="synthetic dataset directory")
+    parser.add_argument("--events", type=int, default=1000000, help="events to generate when --data does not exist yet")
+    parser.add_argument("--spark-master", default="local[*]", help="Spark master URL")
+    parser.add_argument("--repeats", type=int, default=3, help="runs per variant, the best is reported")
+    args = parser.parse_args()
+
+    data_dir = os.path.abspath(args.data)
+    if not os.path.exists(os.path.join(data_dir, "metadata.json")):
+        print("generating {} events into {}".format(args.events, data_dir))
+        generate(data_dir, args.events)
+
+    sys.path[:0] = [DATA_LAKE_DIR, REPO]
+
+    from pyspark import StorageLevel
+    from pyspark.sql import SparkSession
+
+    spark = SparkSession.builder.master(args.spark_master).config("spark.sql.session.timeZone", "UTC").getOrCreate()
+    df = spark.read.json(os.path.join(data_dir, "log_data", "*", "*")).where("page = 'NextSong'")
+    # read the JSON once so both variants are measured on the same in-memory input
+    df = df.persist(StorageLevel.MEMORY_AND_DISK)
+    rows = df.count()
+
+    mismatches = udf_transform(df).exceptAll(native_transform(df)).count()
+    results = {"rows": rows, "mismatched_rows": mismatches}
+    for name, transform in [("udf", udf_transform), ("native", native_transform)]:
+        elapsed = measure(df, transform, args.repeats)
+        results[name] = {"wall_time_s": round(elapsed, 3), "rows_per_s": round(rows / elapsed, 1)}
+    results["speedup"] = round(results["udf"]["wall_time_s"] / results["native"]["wall_time_s"], 2)
+
+    print(json.dumps(results, indent=2))
+    spark.stop()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,445 @@
+"""
+Column compression encodings for the Redshift warehouses.
+
+The staging COPYs run with COMPUPDATE OFF and the CREATE TABLEs declare no encodings, so every
+column is stored as the tables were created. This module picks an encoding per column, either from
+Redshift's ANALYZE COMPRESSION on the loaded tables or by encoding a sample of each column locally
+with the candidate schemes, and writes the choice back into the CREATE TABLEs.
+
+The local estimates model each scheme's layout rather than reproduce it:
+- RAW: the fixed width of the type, or the length plus 4 bytes for character types.
+- BYTEDICT: one byte per value plus the dictionary, for columns of at most 256 distinct values.
+- RUNLENGTH: one value and a one-byte count per run.
+- DELTA: one byte per difference that fits in a byte, the full value plus a flag otherwise.
+- AZ64: differences zigzag-encoded and bit-packed per block of 128 values.
+- ZSTD: the serialized sample compressed with zstandard, or with zlib when it is not installed.
+"""
+import re
+import json
+import math
+import zlib
+import struct
+from datetime import date, datetime
+from decimal import Decimal
+
+CANDIDATES = {
+    "integer": ["AZ64", "ZSTD", "DELTA", "RUNLENGTH", "BYTEDICT", "RAW"],
+    "decimal": ["AZ64", "ZSTD", "RUNLENGTH", "BYTEDICT", "RAW"],
+    "temporal": ["AZ64", "ZSTD", "DELTA", "RUNLENGTH", "BYTEDICT", "RAW"],
+    "float": ["ZSTD", "RUNLENGTH", "BYTEDICT", "RAW"],
+    "boolean": ["ZSTD", "RUNLENGTH", "RAW"],
+    "text": ["ZSTD", "BYTEDICT", "RUNLENGTH", "RAW"],
+}
+
+WIDTHS = {"SMALLINT": 2, "INT2": 2, "INT": 4, "INTEGER": 4, "INT4": 4, "BIGINT": 8, "INT8": 8,
+          "REAL": 4, "FLOAT4": 4, "DATE": 4, "BOOLEAN": 1, "BOOL": 1}
+
+TYPE_PATTERN = r"(?:DOUBLE\s+PRECISION|CHARACTER\s+VARYING|TIMESTAMP\s+WITH(?:OUT)?\s+TIME\s+ZONE|\w+)(?:\s*\([^)]*\))?"
+# column attributes Redshift accepts only before ENCODE: a default value, IDENTITY or GENERATED ... AS IDENTITY
+ATTRIBUTES_BEFORE_ENCODE = (r"(?:\s+(?:DEFAULT\s+(?:'[^']*'|\([^)]*\)|[\w.]+(?:\s*\([^)]*\))?)"
+                            r"|IDENTITY\s*\([^)]*\)"
+                            r"|GENERATED\s+BY\s+DEFAULT\s+AS\s+IDENTITY\s*\([^)]*\)))*")
+TABLE_CONSTRAINTS = ("CONSTRAINT", "PRIMARY", "FOREIGN", "UNIQUE")
+EPOCH = datetime(1970, 1, 1)
+
+
+def column_body(query):
+    """
+    :return: (start, end) offsets of the column list between the parentheses of a CREATE TABLE.
+    """
+    start = query.index("(")
+    depth = 0
+    for end in range(start, len(query)):
+        depth += (query[end] == "(") - (query[end] == ")")
+        if depth == 0:
+            return start + 1, end
+    raise ValueError("unbalanced parentheses in " + query)
+
+
+def split_definitions(body):
+    """
+    Split a column list on the commas between definitions, keeping their whitespace.
+    :return: list of definitions.
+    """
+    parts, depth, current = [], 0, ""
+    for char in body:
+        depth += (char == "(") - (char == ")")
+        if char == "," and depth == 0:
+            parts.append(current)
+            current = ""
+        else:
+            current += char
+    parts.append(current)
+    return parts
+
+
+def parse_create(query):
+    """
+    :param query: CREATE TABLE statement.
+    :return: (table, list of (column, SQL type, is sort key)) of the columns, without table constraints.
+    """
+    table = re.search(r"CREATE\s+TABLE\s+(?:IF\s+NOT\s+EXISTS\s+)?(\w+)", query, re.IGNORECASE).group(1)
+    start, end = column_body(query)
+    sortkey = re.search(r"SORTKEY\s*\(([^)]*)\)", query[end:], re.IGNORECASE)
+    table_sortkey = [name.strip().lower() for name in sortkey.group(1).split(",")] if sortkey else []
+
+    columns = []
+    for definition in split_definitions(query[start:end]):
+        if not definition.strip() or definition.split()[0].upper() in TABLE_CONSTRAINTS:
+            continue
+        match = re.match(r"\s*(\w+)\s+(" + TYPE_PATTERN + ")", definition, re.IGNORECASE)
+        column = match.group(1)
+        is_sortkey = bool(re.search(r"\bSORTKEY\b", definition, re.IGNORECASE)) or column.lower() in table_sortkey
+        columns.append((column, re.sub(r"\s+", " ", match.group(2).upper()), is_sortkey))
+    return table, columns
+
+
+def apply_encodings(query, encodings):
+    """
+    Declare column encodings in a CREATE TABLE.
+    :param query: CREATE TABLE statement.
+    :param encodings: dict of table to dict of column to encoding, e.g. read from an encodings report.
+    :return: the statement with ENCODE after the type, and any default or identity clause, of every column
+        with an encoding.
+    """
+    table, _ = parse_create(query)
+    columns = {column.lower(): encoding for column, encoding in encodings.get(table, {}).items()}
+    if not columns:
+        return query
+
+    start, end = column_body(query)
+    definitions = []
+    for definition in split_definitions(query[start:end]):
+        name = definition.split()[0].lower() if definition.strip() else None
+        if name in columns:
+            definition = re.sub(r"\s+ENCODE\s+\w+", "", definition, flags=re.IGNORECASE)
+            definition = re.sub(r"^(\s*\w+\s+" + TYPE_PATTERN + ATTRIBUTES_BEFORE_ENCODE + ")",
+                                r"\1 ENCODE " + columns[name], definition, count=1, flags=re.IGNORECASE)
+        definitions.append(definition)
+    return query[:start] + ",".join(definitions) + query[end:]
+
+
+def type_family(sql_type):
+    """
+    :return: family of a SQL type, the key of CANDIDATES.
+    """
+    base = sql_type.split("(")[0].strip()
+    if base in ("SMALLINT", "INT2", "INT", "INTEGER", "INT4", "BIGINT", "INT8"):
+        return "integer"
+    if base in ("DECIMAL", "NUMERIC"):
+        return "decimal"
+    if base in ("REAL", "FLOAT", "FLOAT4", "FLOAT8", "DOUBLE PRECISION"):
+        return "float"
+    if base == "DATE" or base.startswith("TIMESTAMP"):
+        return "temporal"
+    if base in ("BOOLEAN", "BOOL"):
+        return "boolean"
+    return "text"
+
+
+def value_width(sql_type, value):
+    """
+    :return: bytes a value of the type takes uncompressed.
+    """
+    base = sql_type.split("(")[0].strip()
+    if type_family(sql_type) == "text":
+        return 4 + (len(str(value).encode()) if value is not None else 0)
+    return WIDTHS.get(base, 8)
+
+
+def as_integer(value):
+    """
+    :return: the integer an AZ64 or DELTA encoding works on: the value, its unscaled digits, days since
+        1970 or microseconds since 1970. None when the value is not numeric or temporal.
+    """
+    if isinstance(value, bool) or value is None:
+        return None
+    if isinstance(value, int):
+        return value
+    if isinstance(value, Decimal):
+        return int(value.scaleb(-value.as_tuple().exponent))
+    if isinstance(value, datetime):
+        delta = value.replace(tzinfo=None) - EPOCH
+        return (delta.days * 86400 + delta.seconds) * 1000000 + delta.microseconds
+    if isinstance(value, date):
+        return value.toordinal() - EPOCH.toordinal()
+    if isinstance(value, float) and value.is_integer():
+        return int(value)
+    return None
+
+
+def serialize(sql_type, values):
+    """
+    :return: the values as bytes in load order, fixed-width for numbers, length-prefixed for text.
+    """
+    family = type_family(sql_type)
+    chunks = []
+    for value in values:
+        if value is None:
+            chunks.append(b"\0")
+        elif family == "float":
+            chunks.append(struct.pack("<d", float(value)))
+        elif family in ("integer", "decimal", "temporal") and as_integer(value) is not None:
+            chunks.append(struct.pack("<q", as_integer(value)))
+        else:
+            data = str(value).encode()
+            chunks.append(struct.pack("<I", len(data)) + data)
+    return b"".join(chunks)
+
+
+def compressed_size(data):
+    """
+    :return: size of the data compressed with zstandard when installed, zlib otherwise.
+    """
+    try:
+        import zstandard
+        return len(zstandard.ZstdCompressor(level=3).compress(data))
+    except ImportError:
+        return len(zlib.compress(data, 6))
+
+
+def az64_size(integers):
+    """
+    :return: size of the integers as zigzag-encoded differences bit-packed per block of 128 values.
+    """
+    size, previous = 0, 0
+    for start in range(0, len(integers), 128):
+        block = integers[start:start + 128]
+        deltas = []
+        for value in block:
+            delta = value - previous
+            deltas.append(delta * 2 if delta >= 0 else -delta * 2 - 1)
+            previous = value
+        bits = max(delta.bit_length() for delta in deltas)
+        size += 2 + math.ceil(bits * len(block) / 8)
+    return size
+
+
+def estimate_sizes(sql_type, values):
+    """
+    Estimated bytes of a column sample under each candidate encoding of its type.
+    :param sql_type: SQL type of the column.
+    :param values: sample of the column in load order.
+    :return: dict of encoding to bytes; encodings that do not apply to the sample are left out.
+    """
+    family = type_family(sql_type)
+    widths = [value_width(sql_type, value) for value in values]
+    sizes = {"RAW": sum(widths)}
+    if not values:
+        return sizes
+
+    runs = [index for index in range(len(values)) if index == 0 or values[index] != values[index - 1]]
+    sizes["RUNLENGTH"] = sum(widths[index] + 1 for index in runs)
+
+    distinct = {}
+    for value, width in zip(values, widths):
+        distinct.setdefault(value, width)
+    if len(distinct) <= 256:
+        sizes["BYTEDICT"] = len(values) + sum(distinct.values())
+
+    sizes["ZSTD"] = compressed_size(serialize(sql_type, values))
+
+    integers = [as_integer(value) for value in values if value is not None]
+    if family in ("integer", "decimal", "temporal") and integers and None not in integers:
+        sizes["AZ64"] = az64_size(integers)
+        if family != "decimal":
+            width = widths[0]
+            sizes["DELTA"] = width + sum(1 if -127 <= current - previous <= 127 else width + 1
+                                         for previous, current in zip(integers, integers[1:]))
+
+    return {encoding: size for encoding, size in sizes.items() if encoding in CANDIDATES[family] or encoding == "RAW"}
+
+
+def estimate_table(columns, sample):
+    """
+    Pick the smallest encoding of every column from a local sample.
+    Sort key columns stay RAW, as ANALYZE COMPRESSION recommends, so range-restricted scans read as few
+    blocks of them as of the other columns.
+    :param columns: list of (column, SQL type, is sort key) of parse_create.
+    :param sample: dict of lower-case column name to list of sampled values.
+    :return: dict of column to {"type", "encoding", "raw_bytes", "encoded_bytes"}; columns missing
+        from the sample are left out.
+    """
+    result = {}
+    for column, sql_type, is_sortkey in columns:
+        values = sample.get(column.lower())
+        if values is None:
+            continue
+        sizes = estimate_sizes(sql_type, values)
+        order = CANDIDATES[type_family(sql_type)]
+        encoding = "RAW" if is_sortkey else min(sizes, key=lambda name: (sizes[name], order.index(name)))
+        result[column] = {"type": sql_type, "encoding": encoding, "raw_bytes": sizes["RAW"],
+                          "encoded_bytes": sizes[encoding]}
+    return result
+
+
+def sample_table(cur, table, columns, rows):
+    """
+    :return: dict of lower-case column name to the values of up to `rows` rows of the table.
+    """
+    names = [column for column, _, _ in columns]
+    cur.execute("SELECT {} FROM {} LIMIT {}".format(", ".join(names), table, int(rows)))
+    records = cur.fetchall()
+    return {name.lower(): [record[index] for record in records] for index, name in enumerate(names)}
+
+
+def sample_parquet(path, rows):
+    """
+    :param path: Parquet file or directory of a staging table's input.
+    :return: dict of lower-case column name to the values of up to `rows` rows.
+    """
+    import pyarrow.dataset as ds
+
+    table = ds.dataset(path, format="parquet").head(rows)
+    return {name.lower(): table.column(name).to_pylist() for name in table.column_names}
+
+
+def analyze_compression(cur, table, rows):
+    """
+    Run ANALYZE COMPRESSION on a loaded table. It must run outside a transaction block.
+    :return: dict of column to (encoding, estimated reduction in percent).
+    """
+    cur.execute("ANALYZE COMPRESSION {} COMPROWS {}".format(table, int(rows)))
+    return {column.strip(): (encoding.strip().upper(), float(reduction))
+            for _, column, encoding, reduction in cur.fetchall()}
+
+
+def column_blocks(cur, table, columns):
+    """
+    :return: dict of column to the 1 MB blocks it takes on disk, from SVV_DISKUSAGE; empty when the
+        view is not readable or the table is empty.
+    """
+    cur.execute("SELECT col, COUNT(*) FROM svv_diskusage WHERE TRIM(name) = %s GROUP BY col", (table,))
+    blocks = dict(cur.fetchall())
+    return {column: blocks[index] for index, (column, _, _) in enumerate(columns) if index in blocks}
+
+
+def analyzed_table(cur, table, columns, rows):
+    """
+    Encodings of ANALYZE COMPRESSION, with each column's raw size taken as its current disk blocks, or
+    as the same for every column when those are unknown, and its encoded size scaled by the estimated
+    reduction.
+    :return: dict of column to {"type", "encoding", "raw_bytes", "encoded_bytes"}.
+    """
+    analysis = {column.lower(): value for column, value in analyze_compression(cur, table, rows).items()}
+    blocks = column_blocks(cur, table, columns)
+    result = {}
+    for column, sql_type, _ in columns:
+        if column.lower() not in analysis:
+            continue
+        encoding, reduction = analysis[column.lower()]
+        raw = blocks.get(column, 1) * 1024 * 1024
+        result[column] = {"type": sql_type, "encoding": encoding, "raw_bytes": raw,
+                          "encoded_bytes": int(raw * (100 - reduction) / 100)}
+    return result
+
+
+def workload_columns(workload):
+    """
+    :param workload: text of the analytical queries, or None.
+    :return: set of lower-case identifiers the queries mention, or None without a workload.
+    """
+    if workload is None:
+        return None
+    return {token.lower() for token in re.findall(r"\w+", workload)}
+
+
+def reduction(columns):
+    """
+    :param columns: column results of estimate_table or analyzed_table.
+    :return: reduction in percent of the encoded against the raw bytes of the columns, or None.
+    """
+    raw = sum(column["raw_bytes"] for column in columns)
+    if not raw:
+        return None
+    return round(100.0 * (raw - sum(column["encoded_bytes"] for column in columns)) / raw, 1)
+
+
+def table_report(table, columns, scanned=None):
+    """
+    :param table: table name.
+    :param columns: dict of column to its estimate_table or analyzed_table result.
+    :param scanned: identifiers the workload mentions, or None to assume every column is scanned.
+    :return: report of the table: per-column encodings, the storage reduction over all columns and the
+        scan reduction over the columns the workload reads.
+    """
+    read = [name for name in columns if scanned is None or name.lower() in scanned]
+    return {
+        "table": table,
+        "columns": columns,
+        "storage_reduction_pct": reduction(list(columns.values())),
+        "scanned_columns": read,
+        "scan_reduction_pct": reduction([columns[name] for name in read]),
+    }
+
+
+def encodings_of(reports):
+    """
+    :return: dict of table to dict of column to encoding, the input of apply_encodings.
+    """
+    return {report["table"]: {column: result["encoding"] for column, result in report["columns"].items()}
+            for report in reports}
+
+
+def add_arguments(parser):
+    """
+    Add the options shared by the projects' compression scripts.
+    """
+    parser.add_argument("--method", choices=["analyze", "estimate"], default="analyze",
+                        help="ANALYZE COMPRESSION on Redshift, or estimate locally from sampled rows")
+    parser.add_argument("--sample-rows", type=int, default=100000, help="rows sampled per table")
+    parser.add_argument("--tables", nargs="*", help="only these tables, all of create_table_queries by default")
+    parser.add_argument("--workload", help="SQL file of analytical queries; the scan reduction counts only "
+                                           "the columns they mention")
+    parser.add_argument("--output", default="encodings.json", help="report of encodings and reductions")
+    parser.add_argument("--ddl", default="encoded_tables.sql", help="CREATE TABLEs with the chosen encodings")
+
+
+def run(args, cur, create_table_queries, parquet=None):
+    """
+    Pick encodings for the tables of create_table_queries, write the report and the encoded DDL, and
+    print the reductions of each table.
+    :param args: parsed arguments of add_arguments.
+    :param cur: cursor of the warehouse; with --method analyze the connection must be in autocommit mode.
+    :param create_table_queries: CREATE TABLE statements of the project.
+    :param parquet: dict of table to the Parquet input sampled instead of the table, for --method estimate.
+    :return: list of table reports.
+    """
+    parquet = parquet or {}
+    scanned = None
+    if args.workload:
+        with open(args.workload) as f:
+            scanned = workload_columns(f.read())
+
+    reports = []
+    for query in create_table_queries:
+        table, columns = parse_create(query)
+        if args.tables and table not in args.tables:
+            continue
+        if args.method == "analyze":
+            results = analyzed_table(cur, table, columns, args.sample_rows)
+        elif table in parquet:
+            results = estimate_table(columns, sample_parquet(parquet[table], args.sample_rows))
+        else:
+            results = estimate_table(columns, sample_table(cur, table, columns, args.sample_rows))
+        reports.append(table_report(table, results, scanned))
+        print("{:<22} storage {:>6}  scan {:>6}".format(
+            table, *("-{}%".format(reports[-1][key]) if reports[-1][key] is not None else "n/a"
+                     for key in ("storage_reduction_pct", "scan_reduction_pct"))))
+
+    encodings = encodings_of(reports)
+    with open(args.output, "w") as f:
+        json.dump({"method": args.method, "encodings": encodings, "tables": reports}, f, indent=2, default=str)
+    with open(args.ddl, "w") as f:
+        f.write("\n\n".join(apply_encodings(query, encodings).strip() + ";" for query in create_table_queries
+                            if parse_create(query)[0] in encodings) + "\n")
+    return reports
+
+
+def read_encodings(path):
+    """
+    :param path: report written by run.
+    :return: dict of table to dict of column to encoding.
+    """
+    with open(path) as f:
+        return json.load(f)["encodings"]
@@ -0,0 +1,195 @@
+"""
+Timing, row counts and plans of the SQL statements an ETL run executes.
+
+Every statement is recorded under the name of its sql_queries variable, so runs can be compared
+statement by statement. A run's records are appended to a JSON lines log and inserted into the
+etl_run_stats table, which is created on first use and kept across runs.
+"""
+import json
+import time
+import uuid
+from datetime import datetime, timezone
+
+# EXPLAIN accepts single statements of these kinds; COPY and DDL are not explained
+EXPLAINABLE = ("SELECT", "INSERT", "UPDATE", "DELETE")
+
+MAX_PLAN_BYTES = 65535
+
+etl_run_stats_table_create = ("""
+CREATE TABLE IF NOT EXISTS etl_run_stats(
+    run_id             VARCHAR(64)    NOT NULL,
+    project            VARCHAR(64)    NOT NULL,
+    statement          VARCHAR(256)   NOT NULL,
+    started_at         TIMESTAMP      NOT NULL,
+    seconds            FLOAT          NOT NULL,
+    row_count          BIGINT,
+    status             VARCHAR(16)    NOT NULL,
+    error              VARCHAR(4096),
+    plan               VARCHAR(65535)
+)
+""")
+
+etl_run_stats_insert = ("""
+INSERT INTO etl_run_stats(run_id, project, statement, started_at, seconds, row_count, status, error, plan)
+VALUES (%s, %s, %s, %s, %s, %s, %s, %s, %s)
+""")
+
+STATS_COLUMNS = ("run_id", "project", "statement", "started_at", "seconds", "row_count", "status", "error", "plan")
+
+
+def statement_names(module):
+    """
+    :param module: sql_queries module of a project.
+    :return: dict of SQL text, or tuple of statements run as one step, to the name of the variable holding it.
+    """
+    names = {}
+    for name, value in vars(module).items():
+        if name.startswith("_") or name.isupper():
+            continue
+        group = isinstance(value, tuple) and value and all(isinstance(query, str) for query in value)
+        if isinstance(value, str) or group:
+            names.setdefault(value, name)
+    return names
+
+
+def explainable(query):
+    """
+    :return: whether EXPLAIN can be run on the query.
+    """
+    text = query.strip().rstrip(";")
+    return text.split(None, 1)[0].upper() in EXPLAINABLE and ";" not in text
+
+
+def truncate_bytes(text, limit):
+    """
+    :return: the text cut to at most `limit` UTF-8 bytes.
+    """
+    return text.encode()[:limit].decode(errors="ignore")
+
+
+class StatementRecorder:
+    """
+    Executes statements on a cursor and records each one's wall time, rows affected, status and,
+    optionally, its EXPLAIN plan.
+    """
+
+    def __init__(self, project, names, explain=False, copy_count_query=None):
+        """
+        :param project: name the run's records are tagged with, e.g. "warehouse".
+        :param names: dict of SQL text to statement name, from statement_names.
+        :param explain: capture the EXPLAIN plan of explainable statements before running them.
+        :param copy_count_query: query returning the rows the last COPY loaded, for drivers that do not
+            report them, e.g. SELECT pg_last_copy_count() on Redshift.
+        """
+        self.project = project
+        self.names = names
+        self.explain = explain
+        self.copy_count_query = copy_count_query
+        self.run_id = datetime.now(timezone.utc).strftime("%Y%m%dT%H%M%S") + "-" + uuid.uuid4().hex[:8]
+        self.records = []
+
+    def name(self, query):
+        """
+        :return: the statement name of the query, or the start of its text when it is not in sql_queries.
+        """
+        return self.names.get(query) or " ".join(query.split())[:64]
+
+    def record(self, statement, started_at, seconds, row_count, status="ok", error=None, plan=None):
+        """
+        Record a statement run elsewhere, e.g. a COPY on a loader connection.
+        :return: the record.
+        """
+        self.records.append({
+            "run_id": self.run_id,
+            "project": self.project,
+            "statement": statement,
+            "started_at": started_at.strftime("%Y-%m-%d %H:%M:%S.%f"),
+            "seconds": round(seconds, 3),
+            "row_count": row_count,
+            "status": status,
+            "error": error,
+            "plan": plan,
+        })
+        return self.records[-1]
+
+    def execute(self, cur, query, params=None):
+        """
+        Run one statement, recording it whether it succeeds or raises.
+        :param cur: cursor of query.
+        :param query: SQL statement, normally a sql_queries variable.
+        :param params: parameters of the statement.
+        """
+        plan = None
+        started_at = datetime.now(timezone.utc)
+        start = time.perf_counter()
+        try:
+            if self.explain and explainable(query):
+                cur.execute("EXPLAIN " + query, params)
+                plan = truncate_bytes("\n".join(row[0] for row in cur.fetchall()), MAX_PLAN_BYTES)
+                # the plan is not part of the statement's time
+                started_at = datetime.now(timezone.utc)
+                start = time.perf_counter()
+            cur.execute(query, params)
+        except Exception as e:
+            self.record(self.name(query), started_at, time.perf_counter() - start, None, "error",
+                        truncate_bytes(str(e), 4096), plan)
+            raise
+        seconds = time.perf_counter() - start
+
+        row_count = cur.rowcount if cur.rowcount >= 0 else None
+        if row_count is None and self.copy_count_query and query.lstrip().upper().startswith("COPY"):
+            cur.execute(self.copy_count_query)
+            row_count = cur.fetchone()[0]
+        record = self.record(self.name(query), started_at, seconds, row_count, plan=plan)
+        print(json.dumps({key: value for key, value in record.items() if key != "plan"}))
+
+    def write_log(self, path):
+        """
+        Append the run's records to a JSON lines log.
+        """
+        with open(path, "a") as f:
+            for record in self.records:
+                f.write(json.dumps(record) + "\n")
+
+    def save(self, cur, conn):
+        """
+        Insert the run's records into etl_run_stats, creating it when missing. A failed transaction
+        is rolled back first, so the records of a failed run are kept too.
+        """
+        conn.rollback()
+        cur.execute(etl_run_stats_table_create)
+        for record in self.records:
+            cur.execute(etl_run_stats_insert, [record[column] for column in STATS_COLUMNS])
+        conn.commit()
+
+    def flush(self, cur, conn, path):
+        """
+        Write the log and save the records at the end of a run, printing rather than raising a failure of
+        either, so it cannot replace the error the run itself may be raising.
+        :param path: JSON lines log of write_log.
+        """
+        try:
+            self.write_log(path)
+        except OSError as e:
+            print("could not write the statement log {}: {}".format(path, e))
+        try:
+            self.save(cur, conn)
+        except Exception as e:
+            print("could not save the statement records to etl_run_stats: {}".format(e))
+
+    def summary(self):
+        """
+        :return: list of (statement, seconds, rows) of the run, slowest first.
+        """
+        return sorted(((record["statement"], record["seconds"], record["row_count"]) for record in self.records),
+                      key=lambda item: -item[1])
+
+
+def execute(cur, query, recorder=None):
+    """
+    Run a statement through the recorder when there is one, directly otherwise.
+    """
+    if recorder is None:
+        cur.execute(query)
+    else:
+        recorder.execute(cur, query)
@@ -0,0 +1,163 @@
+"""
+Dependency-aware, parallel execution of ETL statements.
+
+Each statement declares the tables it reads and writes. A statement runs after every statement
+writing a table it reads, whatever their order in the query list, so a fact insert declared as
+reading its dimensions waits for them. Statements writing the same table keep their list order,
+unless they also read it: two statements that both read and write a table each wait for the other,
+and are rejected as a cycle rather than run in list order.
+Statements without such a dependency run concurrently, each on a connection of a pool and committed
+on its own. A statement may be a tuple of single statements, e.g. the create, delete, insert and drop
+of a merge, run in order and committed together.
+"""
+from collections import namedtuple
+from concurrent.futures import ThreadPoolExecutor, FIRST_COMPLETED, wait
+
+from common.instrument import execute
+
+Statement = namedtuple("Statement", ["name", "query", "reads", "writes"])
+
+
+def declared_statements(queries, dependencies, names=None):
+    """
+    :param queries: list of SQL statements or tuples of them, e.g. insert_table_queries.
+    :param dependencies: dict of SQL text, or tuple of statements, to (tables read, tables written).
+    :param names: dict of SQL text to statement name, e.g. from instrument.statement_names.
+    :return: list of Statements in list order.
+    """
+    statements = []
+    for number, query in enumerate(queries):
+        if query not in dependencies:
+            raise ValueError("no read/write tables declared for statement {}".format(number))
+        reads, writes = dependencies[query]
+        name = (names or {}).get(query, "statement_{}".format(number))
+        statements.append(Statement(name, query, frozenset(reads), frozenset(writes)))
+    return statements
+
+
+def dependency_graph(statements):
+    """
+    :param statements: list of Statements.
+    :return: list of the set of indices each statement waits for.
+    :raises ValueError: when the dependencies form a cycle.
+    """
+    graph = []
+    for index, statement in enumerate(statements):
+        after = set()
+        for other, previous in enumerate(statements):
+            if other == index:
+                continue
+            if previous.writes & statement.reads or (other < index and previous.writes & statement.writes):
+                after.add(other)
+        graph.append(after)
+
+    # Kahn's algorithm, only to reject cycles before anything runs
+    remaining = {index: set(after) for index, after in enumerate(graph)}
+    while remaining:
+        ready = [index for index, after in remaining.items() if not after]
+        if not ready:
+            raise ValueError("cyclic dependencies between " + ", ".join(statements[index].name for index in remaining))
+        for index in ready:
+            del remaining[index]
+        for after in remaining.values():
+            after.difference_update(ready)
+    return graph
+
+
+def execution_order(statements):
+    """
+    :return: the statements in an order respecting their dependencies, preferring list order.
+    """
+    graph = dependency_graph(statements)
+    done, order = set(), []
+    while len(order) < len(statements):
+        index = next(index for index in range(len(statements)) if index not in done and graph[index] <= done)
+        done.add(index)
+        order.append(statements[index])
+    return order
+
+
+def execute_statement(cur, statement, recorder=None):
+    """
+    Run the statement's query, or each query of a tuple in order, so every one is recorded on its own.
+    """
+    for query in (statement.query if isinstance(statement.query, tuple) else (statement.query,)):
+        execute(cur, query, recorder)
+
+
+def run_statement(pool, statement, recorder=None):
+    """
+    Run one statement on a pooled connection and commit it.
+    """
+    conn = pool.getconn()
+    try:
+        cur = conn.cursor()
+        execute_statement(cur, statement, recorder)
+        conn.commit()
+    except Exception:
+        conn.rollback()
+        raise
+    finally:
+        pool.putconn(conn)
+
+
+def run_serial(cur, conn, statements, recorder=None):
+    """
+    Run the statements one after the other on one connection, in dependency order.
+    """
+    for statement in execution_order(statements):
+        execute_statement(cur, statement, recorder)
+        conn.commit()
+
+
+def run_parallel(pool, statements, max_parallel, recorder=None):
+    """
+    Run the statements on the pool, at most `max_parallel` at a time, each as soon as the statements it
+    waits for have committed. On the first failure no further statement is started; the running ones
+    finish and the error is raised.
+    :param pool: psycopg2 ThreadedConnectionPool of at least `max_parallel` connections.
+    :param statements: list of Statements.
+    :param max_parallel: most statements running at once.
+    :param recorder: StatementRecorder timing each statement, if any.
+    """
+    graph = dependency_graph(statements)
+    done, started, running, error = set(), set(), {}, None
+
+    with ThreadPoolExecutor(max_workers=max_parallel) as executor:
+        while len(done) < len(statements):
+            if error is None:
+                for index in range(len(statements)):
+                    if len(running) >= max_parallel:
+                        break
+                    if index not in started and graph[index] <= done:
+                        started.add(index)
+                        running[executor.submit(run_statement, pool, statements[index], recorder)] = index
+            if not running:
+                break
+            finished, _ = wait(running, return_when=FIRST_COMPLETED)
+            for future in finished:
+                index = running.pop(future)
+                if future.exception() is not None:
+                    error = error or future.exception()
+                else:
+                    done.add(index)
+
+    if error is not None:
+        raise error
+
+
+def run_statements(cur, conn, statements, recorder=None, pool=None, max_parallel=1):
+    """
+    Run the statements in dependency order, concurrently on the pool when there is one and
+    `max_parallel` allows, one after the other on the connection otherwise.
+    :param cur: cursor of query.
+    :param conn: connection of database.
+    :param statements: list of Statements, e.g. from declared_statements.
+    :param recorder: StatementRecorder timing each statement, if any.
+    :param pool: ThreadedConnectionPool of at least `max_parallel` connections.
+    :param max_parallel: most statements running at once.
+    """
+    if pool is None or max_parallel <= 1:
+        run_serial(cur, conn, statements, recorder)
+    else:
+        run_parallel(pool, statements, max_parallel, recorder)
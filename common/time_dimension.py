@@ -0,0 +1,133 @@
+"""
+Time dimension shared by the Postgres, Redshift and Spark pipelines.
+
+All three derive the same row for a start_time:
+- hour, day, month, year: calendar parts of the UTC timestamp.
+- week: ISO-8601 week number.
+- weekday: Monday = 0 ... Sunday = 6.
+"""
+import numpy as np
+
+TIME_COLUMNS = ("start_time", "hour", "day", "week", "month", "year", "weekday")
+
+MS_PER_HOUR = 3600 * 1000
+MS_PER_DAY = 24 * MS_PER_HOUR
+
+
+def time_parts(ts):
+    """
+    Derive the time dimension columns with datetime64 arithmetic.
+    Day-level parts are computed once per distinct calendar day and broadcast back.
+    :param ts: epoch milliseconds (array-like of ints).
+    :return: dict of column name to numpy array.
+    """
+    ts = np.asarray(ts, dtype="int64")
+    days, inverse = np.unique(ts // MS_PER_DAY, return_inverse=True)
+
+    dates = days.astype("datetime64[D]")
+    months = dates.astype("datetime64[M]")
+    years = dates.astype("datetime64[Y]")
+
+    # 1970-01-01 was a Thursday
+    weekday = (days + 3) % 7
+    # the ISO week belongs to the year holding its Thursday
+    thursday = days - weekday + 3
+    iso_year_start = thursday.astype("datetime64[D]").astype("datetime64[Y]").astype("datetime64[D]").astype("int64")
+
+    calendar = {
+        "day": (dates - months.astype("datetime64[D]")).astype("int64") + 1,
+        "week": (thursday - iso_year_start) // 7 + 1,
+        "month": (months - years.astype("datetime64[M]")).astype("int64") + 1,
+        "year": years.astype("int64") + 1970,
+        "weekday": weekday,
+    }
+
+    parts = {
+        "start_time": ts.astype("datetime64[ms]"),
+        "hour": (ts // MS_PER_HOUR) % 24,
+    }
+    for column in ("day", "week", "month", "year", "weekday"):
+        parts[column] = calendar[column][inverse]
+
+    return parts
+
+
+def time_frame(ts):
+    """
+    Build deduplicated time dimension rows.
+    :param ts: epoch milliseconds (array-like of ints).
+    :return: pandas DataFrame with TIME_COLUMNS, one row per distinct timestamp.
+    """
+    import pandas as pd
+
+    parts = time_parts(np.unique(np.asarray(ts, dtype="int64")))
+    return pd.DataFrame({column: parts[column] for column in TIME_COLUMNS})
+
+
+class TimeDimension:
+    """
+    Time dimension builder remembering the start_times it already emitted, so rows shared by
+    many files are built and loaded once.
+    """
+
+    def __init__(self):
+        self.emitted = set()
+
+    def __len__(self):
+        return len(self.emitted)
+
+    def unseen(self, frame):
+        """
+        Keep the time rows that were not emitted yet and mark them as emitted.
+        :param frame: DataFrame with a start_time column.
+        :return: filtered DataFrame.
+        """
+        keys = frame["start_time"].values.astype("datetime64[ms]").astype("int64")
+        mask = np.fromiter((key not in self.emitted for key in keys), dtype=bool, count=len(keys))
+        self.emitted.update(keys[mask].tolist())
+        return frame[mask]
+
+    def rows(self, ts):
+        """
+        Build the time rows for new timestamps only.
+        :param ts: epoch milliseconds (array-like of ints).
+        :return: pandas DataFrame with TIME_COLUMNS.
+        """
+        return self.unseen(time_frame(ts))
+
+
+def spark_time_columns(start_time):
+    """
+    Spark Column expressions for the time dimension parts; the session time zone must be UTC.
+    :param start_time: timestamp Column.
+    :return: list of aliased Columns: hour, day, week, month, year, weekday.
+    """
+    from pyspark.sql import functions as F
+
+    return [
+        F.hour(start_time).alias("hour"),
+        F.dayofmonth(start_time).alias("day"),
+        F.weekofyear(start_time).alias("week"),
+        F.month(start_time).alias("month"),
+        F.year(start_time).alias("year"),
+        # dayofweek is Sunday = 1 ... Saturday = 7
+        ((F.dayofweek(start_time) + 5) % 7).alias("weekday"),
+    ]
+
+
+def sql_time_columns(ts):
+    """
+    SQL select list for the time dimension, valid on Redshift and Postgres.
+    :param ts: SQL expression of the UTC timestamp.
+    :return: comma separated select list matching TIME_COLUMNS.
+    """
+    return ",\n                ".join([
+        ts,
+        "EXTRACT(hour FROM {})".format(ts),
+        "EXTRACT(day FROM {})".format(ts),
+        "EXTRACT(week FROM {})".format(ts),
+        "EXTRACT(month FROM {})".format(ts),
+        "EXTRACT(year FROM {})".format(ts),
+        # dow is Sunday = 0 ... Saturday = 6
+        "(EXTRACT(dow FROM {}) + 6) % 7".format(ts),
+    ])
@@ -0,0 +1,38 @@
+import os
+import sys
+
+sys.path.append(os.path.join(os.path.dirname(os.path.abspath(__file__)), os.pardir))
+from common.compression import apply_encodings, parse_create
+
+SONGPLAYS = """
+CREATE TABLE IF NOT EXISTS songplays(
+    songplay_id        INTEGER    IDENTITY(0,1)    PRIMARY KEY,
+    start_time         TIMESTAMP  NOT NULL SORTKEY,
+    level              VARCHAR(10) DEFAULT 'free' NOT NULL,
+    loaded_at          TIMESTAMP  DEFAULT GETDATE(),
+    session_id         INTEGER    GENERATED BY DEFAULT AS IDENTITY(1,1) ENCODE RAW
+)
+"""
+
+
+def test_encode_follows_identity():
+    query = apply_encodings(SONGPLAYS, {"songplays": {"songplay_id": "AZ64"}})
+    assert "songplay_id        INTEGER    IDENTITY(0,1) ENCODE AZ64    PRIMARY KEY," in query
+
+
+def test_encode_follows_default():
+    query = apply_encodings(SONGPLAYS, {"songplays": {"level": "ZSTD", "loaded_at": "AZ64"}})
+    assert "level              VARCHAR(10) DEFAULT 'free' ENCODE ZSTD NOT NULL," in query
+    assert "loaded_at          TIMESTAMP  DEFAULT GETDATE() ENCODE AZ64," in query
+
+
+def test_encode_replaces_existing_after_generated_identity():
+    query = apply_encodings(SONGPLAYS, {"songplays": {"session_id": "DELTA"}})
+    assert "session_id         INTEGER    GENERATED BY DEFAULT AS IDENTITY(1,1) ENCODE DELTA\n" in query
+    assert "ENCODE RAW" not in query
+
+
+def test_encode_follows_type():
+    query = apply_encodings(SONGPLAYS, {"songplays": {"start_time": "RAW"}})
+    assert "start_time         TIMESTAMP ENCODE RAW  NOT NULL SORTKEY," in query
+    assert parse_create(query) == parse_create(SONGPLAYS)
@@ -0,0 +1,157 @@
+import os
+import sys
+import time
+import threading
+
+import pytest
+
+sys.path.append(os.path.join(os.path.dirname(os.path.abspath(__file__)), os.pardir))
+from common.scheduler import Statement, dependency_graph, run_parallel, run_serial
+
+
+class FakeCursor:
+    def __init__(self, log, delay):
+        self.log = log
+        self.delay = delay
+        self.rowcount = -1
+
+    def execute(self, query, params=None):
+        self.log.start(query)
+        try:
+            time.sleep(self.delay)
+            if query.startswith("FAIL"):
+                raise RuntimeError(query)
+        finally:
+            self.log.finish(query)
+
+
+class FakeConnection:
+    def __init__(self, log, delay):
+        self.log = log
+        self.delay = delay
+        self.commits = 0
+
+    def cursor(self):
+        return FakeCursor(self.log, self.delay)
+
+    def commit(self):
+        self.commits += 1
+
+    def rollback(self):
+        pass
+
+
+class FakePool:
+    def __init__(self, log, delay=0.05):
+        self.log = log
+        self.delay = delay
+
+    def getconn(self):
+        return FakeConnection(self.log, self.delay)
+
+    def putconn(self, conn):
+        pass
+
+
+class ExecutionLog:
+    """Start and end order of the queries, and the most running at once."""
+
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.events = []
+        self.running = 0
+        self.most_running = 0
+
+    def start(self, query):
+        with self.lock:
+            self.events.append(("start", query))
+            self.running += 1
+            self.most_running = max(self.most_running, self.running)
+
+    def finish(self, query):
+        with self.lock:
+            self.events.append(("end", query))
+            self.running -= 1
+
+    def started(self):
+        return [query for event, query in self.events if event == "start"]
+
+    def index(self, event, query):
+        return self.events.index((event, query))
+
+
+def statement(name, reads=(), writes=()):
+    return Statement(name, name, frozenset(reads), frozenset(writes))
+
+
+def test_independent_statements_overlap():
+    log = ExecutionLog()
+    statements = [statement("users", ["staging_events"], ["users"]),
+                  statement("songs", ["staging_songs"], ["songs"]),
+                  statement("artists", ["staging_songs"], ["artists"])]
+    run_parallel(FakePool(log), statements, 3)
+    assert sorted(log.started()) == ["artists", "songs", "users"]
+    assert log.most_running == 3
+
+
+def test_fact_waits_for_the_dimensions_it_reads():
+    log = ExecutionLog()
+    statements = [statement("fact", ["dim_a", "dim_b"], ["fact"]),
+                  statement("dim_a", ["staging"], ["dim_a"]),
+                  statement("dim_b", ["staging"], ["dim_b"])]
+    run_parallel(FakePool(log), statements, 3)
+    assert log.index("start", "fact") > log.index("end", "dim_a")
+    assert log.index("start", "fact") > log.index("end", "dim_b")
+    assert log.most_running == 2
+
+
+def test_writers_of_the_same_table_keep_list_order():
+    log = ExecutionLog()
+    statements = [statement("delete_users", ["staging_events"], ["users"]),
+                  statement("insert_users", ["staging_events"], ["users"]),
+                  statement("songs", ["staging_songs"], ["songs"])]
+    run_parallel(FakePool(log), statements, 3)
+    assert log.index("start", "insert_users") > log.index("end", "delete_users")
+
+    serial = ExecutionLog()
+    conn = FakeConnection(serial, 0)
+    run_serial(conn.cursor(), conn, list(reversed(statements)))
+    assert serial.started().index("delete_users") > serial.started().index("insert_users")
+    assert conn.commits == 3
+
+
+def test_no_statement_starts_after_a_failure():
+    log = ExecutionLog()
+    statements = [statement("FAIL first", ["staging"], ["a"]),
+                  statement("FAIL second", ["staging"], ["b"]),
+                  statement("after_a", ["a"], ["c"]),
+                  statement("after_b", ["b"], ["d"])]
+    with pytest.raises(RuntimeError, match="FAIL first"):
+        run_parallel(FakePool(log), statements, 1)
+    assert log.started() == ["FAIL first"]
+
+
+def test_running_statements_finish_and_the_first_error_is_raised():
+    log = ExecutionLog()
+    statements = [statement("FAIL first", ["staging"], ["a"]),
+                  statement("slow", ["staging"], ["b"]),
+                  statement("after_a", ["a"], ["c"])]
+    pool = FakePool(log)
+    with pytest.raises(RuntimeError, match="FAIL first"):
+        run_parallel(pool, statements, 2)
+    assert log.started() == ["FAIL first", "slow"]
+    assert ("end", "slow") in log.events
+
+
+def test_cycle_is_rejected():
+    statements = [statement("a", ["y"], ["x"]), statement("b", ["x"], ["y"])]
+    with pytest.raises(ValueError, match="cyclic"):
+        dependency_graph(statements)
+
+
+def test_statements_reading_and_writing_the_same_table_are_a_cycle():
+    statements = [statement("first", ["users"], ["users"]), statement("second", ["users"], ["users"])]
+    with pytest.raises(ValueError, match="cyclic"):
+        dependency_graph(statements)
+    with pytest.raises(ValueError):
+        run_parallel(FakePool(ExecutionLog()), statements, 2)